@@ -157,6 +157,7 @@ def train(gan_logger, config):
 			gan_logger.save_model_weights(d_model, epoch_cnt, "discriminator")
 		if g_loss and d_loss_gen and batch_counter:
 			gan_logger.save_loss(g_loss, d_loss_gen, epoch_cnt, batch_counter)
+		gan_logger.flush_metrics()
 
 	gan_logger.save_model_weights(g_model, epoch_cnt, "generator")
 	gan_logger.save_model_weights(d_model, epoch_cnt, "discriminator")
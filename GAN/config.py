@@ -1,7 +1,7 @@
 # coding=utf-8
 import datetime
 
-from GAN.helpers.enums import NoiseMode, Conf, WordEmbedding, PreInit
+from GAN.helpers.enums import NoiseMode, Conf, WordEmbedding, PreInit, SamplingMode
 
 # noinspection SpellCheckingInspection
 """
@@ -38,17 +38,59 @@ config = {
 	# Conf.LIMITED_DATASET: "trippleflower.txt",
 	Conf.LIMITED_DATASET: None,
 	Conf.DATASET_SIZE: -1,
+
+	# Flower classes and max caption length (in words) used by the image caption dataset
+	Conf.IMAGE_CLASSES: ['00058', '00065', '00025'],
+	Conf.MAX_CAPTION_LENGTH: 10,
+
+	# Seeded train/val/test split of the images (or sentences), stored in the database. None uses the whole dataset
+	Conf.SPLIT_SEED: 1234,
+	Conf.SPLIT_RATIOS: [0.8, 0.1, 0.1],
+	Conf.TRAIN_SPLIT: "train",
+	Conf.EVAL_SPLIT: "test",
+
 	Conf.BATCH_SIZE: 50,
 	Conf.EPOCHS: 10000000,
 
 	# Conf.NOISE_MODE: NoiseMode.REPEAT,
 	Conf.NOISE_MODE: NoiseMode.REPEAT_SINGLE,
 	# Conf.NOISE_MODE: NoiseMode.FIRST_ONLY,
+	# Seed of the training noise (None draws a new one every run) and how many noise batches are generated at once
+	Conf.NOISE_SEED: None,
+	Conf.NOISE_PREFETCH: 64,
+	# Seq2seq model (sequence_to_sequence/logs/<model>) whose encoded dataset is sampled by NoiseMode.ENCODING
+	Conf.ENCODED_NOISE_MODEL: "S2S_2EMB_2017-04-04_VS2+1000_BS128_HD30_DHL1_ED50_SEQ5_WEMword2vec",
 
 	Conf.W2V_SET: "flowers",
 	# Conf.W2V_SET: "flickr",
 
 	Conf.MAX_LOSS_DIFF: 0,
+	# Training batches prepared ahead of the training step on a background thread (0 prepares them inline)
+	Conf.PIPELINE_DEPTH: 4,
+	# Order of the training examples: shuffled, balanced over images (image captions only) or bucketed by caption length
+	Conf.SAMPLING_MODE: SamplingMode.SHUFFLE,
+	# Conf.SAMPLING_MODE: SamplingMode.BALANCED,
+	# Conf.SAMPLING_MODE: SamplingMode.BUCKETED,
+	# Train the discriminator on real and generated captions in one batch (one update per step instead of two)
+	Conf.FUSED_DISCRIMINATOR_UPDATE: False,
+
+	# Checkpoint every N epochs and/or every N seconds. With neither set: every epoch up to 10, every 10th up to 100,
+	# then every 100th
+	Conf.CHECKPOINT_EVERY_EPOCHS: None,
+	Conf.CHECKPOINT_INTERVAL_SECONDS: None,
+	# Delete all checkpoints except the last N and/or the N best by a metric, e.g. ("g_loss", 5). None keeps everything
+	Conf.CHECKPOINT_KEEP_LAST: None,
+	Conf.CHECKPOINT_KEEP_BEST: None,
+
+	# Loss rows are buffered and appended to loss.metrics when this many are waiting, after this many seconds, and at
+	# the end of every epoch
+	Conf.METRICS_BUFFER_SIZE: 1024,
+	Conf.METRICS_FLUSH_SECONDS: 30,
+
+	# Processes in the evaluation pool (WMD retrieval), None for one per CPU
+	Conf.EVAL_WORKERS: None,
+	# Score BLEU in the evaluation pool instead of this process. Scores are cached either way
+	Conf.BLEU_IN_POOL: False,
 
 	Conf.EMBEDDING_SIZE: 50,
 	Conf.NOISE_SIZE: 50,
@@ -422,21 +422,19 @@ def emb_predict(config, logger):
 	# 		generated_sentence += word[0] + " "
 	# 	print generated_sentence + "\n"
 
-	g_weights = logger.get_generator_weights()
-	d_weights = logger.get_discriminator_weights()
-
-	print "Num g_weights: %s" % len(g_weights)
-	print "Num d_weights: %s" % len(g_weights)
-	for i in range(0, len(g_weights), 1):
-		g_weight = g_weights[i]
-		d_weight = d_weights[i]
-		# if not int(g_weight.split("-")[1]) % 10000 == 0:
+	checkpoints = logger.get_complete_checkpoints()
+
+	print "Num checkpoints: %s" % len(checkpoints)
+	for checkpoint in checkpoints:
+		g_weight = checkpoint["files"]["generator"]
+		d_weight = checkpoint["files"]["discriminator"]
+		# if not checkpoint["epoch"] % 10000 == 0:
 		# 	continue
 
-		# if not int(g_weight.split("-")[1]) == 12500 and not int(g_weight.split("-")[1]) == 15000:
+		# if not checkpoint["epoch"] == 12500 and not checkpoint["epoch"] == 15000:
 		# 	continue
-		g_model.load_weights("GAN/GAN_log/%s/model_files/stored_weights/%s" % (logger.name_prefix, g_weight))
-		d_model.load_weights("GAN/GAN_log/%s/model_files/stored_weights/%s" % (logger.name_prefix, d_weight))
+		g_model.load_weights(logger.get_weight_path(g_weight))
+		d_model.load_weights(logger.get_weight_path(d_weight))
 		generated_sentences = g_model.predict(noise_batch)
 		generated_classifications = d_model.predict(generated_sentences)
 		gen_header_string = "\n\nGENERATED SENTENCES: (%s)\n" % g_weight
@@ -483,27 +481,19 @@ def emb_evaluate(config, logger):
 
 	if not config[Conf.LIMITED_DATASET].endswith("_uniq.txt"):
 		config[Conf.LIMITED_DATASET] = config[Conf.LIMITED_DATASET].split(".txt")[0] + "_uniq.txt"
-	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config)
+	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config, config[Conf.EVAL_SPLIT])
 
 	g_model = load_generator(logger)
-	g_weights = logger.get_generator_weights()
+	checkpoints = logger.get_checkpoints("generator")
 	sentence_count = 1000
 	config[Conf.BATCH_SIZE] = sentence_count
-	num_weights_to_eval = 0
 	epoch_modulo = 1000
-	for i in range(len(g_weights)):
-		g_weight = g_weights[i]
-		epoch_string = int(g_weight.split("-")[1])
-		if epoch_string % epoch_modulo == 0:
-			num_weights_to_eval += 1
-
-	print "Number of weights to evaluate: %s/%s" % (num_weights_to_eval, len(g_weights))
-	for i in range(0, len(g_weights), 1):
-		g_weight = g_weights[i]
-		epoch_string = int(g_weight.split("-")[1])
-		if not epoch_string % epoch_modulo == 0:
-			continue
-		g_model.load_weights("GAN/GAN_log/%s/model_files/stored_weights/%s" % (logger.name_prefix, g_weight))
+	eval_checkpoints = [checkpoint for checkpoint in checkpoints if checkpoint["epoch"] % epoch_modulo == 0]
+
+	print "Number of weights to evaluate: %s/%s" % (len(eval_checkpoints), len(checkpoints))
+	for checkpoint in eval_checkpoints:
+		g_weight = checkpoint["files"]["generator"]
+		g_model.load_weights(logger.get_weight_path(g_weight))
 		noise_batch = generate_input_noise(config)
 		embedded_generated_sentences = g_model.predict(noise_batch)
 		gen_header_string = "\n\nGENERATED SENTENCES: (%s)\n" % g_weight
@@ -532,8 +522,7 @@ def emb_evaluate(config, logger):
 		                                                                                     eval_word_embedding_dict)
 		print "Number of distict sentences: %s/%s" % (distinct_sentences, sentence_count)
 		print logger.name_prefix
-		epoch = g_weight.split("-")[1]
-		logger.save_eval_data(epoch, distinct_sentences, sentence_count, avg_bleu_score, avg_bleu_cosine,
+		logger.save_eval_data(checkpoint["epoch"], distinct_sentences, sentence_count, avg_bleu_score, avg_bleu_cosine,
 		                      avg_bleu_tfidf, avg_bleu_wmd)
 
 
@@ -546,7 +535,7 @@ def img_caption_predict(config, logger):
 	colors = ['black', 'blue', 'brown', 'burgundy', 'gold', 'golden', 'green', 'grey', 'indigo', 'magenta', 'orange',
 	          'pink', 'purple', 'red', 'white', 'yellow', 'yellow-orange', 'violet']
 
-	filenames, all_image_vectors, captions = fetch_custom_embeddings(config)
+	filenames, all_image_vectors, captions, caption_image_index = fetch_custom_embeddings(config)
 	all_raw_caption_data, word_embedding_dict = preprocess_sentences(config, captions)
 	batch_counter = 1
 	raw_caption_training_batch = all_raw_caption_data[
@@ -572,8 +561,7 @@ def img_caption_predict(config, logger):
 	# from keras_diagram import ascii
 	# print (ascii(g_model))
 	# print (ascii(d_model))
-	g_weights = logger.get_generator_weights()
-	d_weights = logger.get_discriminator_weights()
+	checkpoints = logger.get_complete_checkpoints()
 
 	filename_58 = 'image_02639'
 	filename_65 = 'image_03182'
@@ -599,16 +587,13 @@ def img_caption_predict(config, logger):
 	C = np.reshape(image_batch, (config[Conf.BATCH_SIZE], 1, config[Conf.IMAGE_DIM]))
 	D = np.append(C, B, axis=1)
 
-	print "Num g_weights: %s" % len(g_weights)
-	print "Num d_weights: %s" % len(g_weights)
+	print "Num checkpoints: %s" % len(checkpoints)
 	prediction_string = ""
-	# for i in range(len(g_weights)):
-	for i in range(0, len(g_weights), 1):
-		# for i in range(20, 50, 1):
-		g_weight = g_weights[i]
-		d_weight = d_weights[i]
-		g_model.load_weights("GAN/GAN_log/%s/model_files/stored_weights/%s" % (logger.name_prefix, g_weight))
-		d_model.load_weights("GAN/GAN_log/%s/model_files/stored_weights/%s" % (logger.name_prefix, d_weight))
+	for checkpoint in checkpoints:
+		g_weight = checkpoint["files"]["generator"]
+		d_weight = checkpoint["files"]["discriminator"]
+		g_model.load_weights(logger.get_weight_path(g_weight))
+		d_model.load_weights(logger.get_weight_path(d_weight))
 
 		# generated_sentences = g_model.predict(noise_image_training_batch[:10])
 		# generated_sentences = g_model.predict([image_batch[:10], noise_image_training_batch[:10]])
@@ -630,7 +615,6 @@ def img_caption_predict(config, logger):
 			prediction_string += gen_sentence_string
 			batch_string += gen_sentence_string
 			# print gen_sentence_string
-		# print_progress(i, len(g_weights))
 		print batch_string
 	from collections import Counter
 	word_count = Counter(prediction_string.split())
@@ -0,0 +1,303 @@
+import json
+import os
+import sys
+import threading
+import time
+from Queue import Queue
+
+import h5py
+import keras
+import keras.backend as K
+
+""" SAVE POLICIES """
+
+
+class ScheduleSavePolicy(object):
+	""" Every epoch up to 10, every 10th up to 100, then every 100th """
+
+	def should_save(self, epoch, now):
+		return epoch < 10 or (epoch < 100 and epoch % 10 == 0) or epoch % 100 == 0
+
+
+class EveryEpochsSavePolicy(object):
+	def __init__(self, nb_epochs):
+		self.nb_epochs = nb_epochs
+
+	def should_save(self, epoch, now):
+		return epoch % self.nb_epochs == 0
+
+
+class IntervalSavePolicy(object):
+	""" At most one checkpoint per interval of wall-clock seconds """
+
+	def __init__(self, seconds):
+		self.seconds = seconds
+		self.last_save_time = time.time()
+
+	def should_save(self, epoch, now):
+		if now - self.last_save_time < self.seconds:
+			return False
+		self.last_save_time = now
+		return True
+
+
+""" RETENTION POLICIES """
+
+
+class KeepLastPolicy(object):
+	def __init__(self, nb_checkpoints):
+		# checkpoints[-0:] is every checkpoint, so 0 would keep everything instead of nothing
+		if nb_checkpoints < 1:
+			raise ValueError("KeepLastPolicy has to keep at least one checkpoint, got %s" % nb_checkpoints)
+		self.nb_checkpoints = nb_checkpoints
+
+	def keep(self, checkpoints):
+		return set(checkpoint["epoch"] for checkpoint in checkpoints[-self.nb_checkpoints:])
+
+
+class KeepBestPolicy(object):
+	""" The nb_checkpoints checkpoints with the lowest (or highest) value of a metric """
+
+	def __init__(self, metric, nb_checkpoints, lowest=True):
+		self.metric = metric
+		self.nb_checkpoints = nb_checkpoints
+		self.lowest = lowest
+
+	def keep(self, checkpoints):
+		scored = [checkpoint for checkpoint in checkpoints if self.metric in checkpoint["metrics"]]
+		scored.sort(key=lambda checkpoint: checkpoint["metrics"][self.metric], reverse=not self.lowest)
+		return set(checkpoint["epoch"] for checkpoint in scored[:self.nb_checkpoints])
+
+
+""" WEIGHT SNAPSHOTS """
+
+
+def snapshot_weights(model):
+	""" Copy of every weight of the model, read in one backend call, with the layer and weight names Keras'
+	save_weights stores them under """
+	layers = getattr(model, "flattened_layers", None) or model.layers
+	symbolic_weights = []
+	layer_weight_counts = []
+	for layer in layers:
+		weights = layer.trainable_weights + layer.non_trainable_weights
+		symbolic_weights.extend(weights)
+		layer_weight_counts.append(len(weights))
+	weight_values = K.batch_get_value(symbolic_weights)
+
+	snapshot = []
+	position = 0
+	for layer, weight_count in zip(layers, layer_weight_counts):
+		weights = symbolic_weights[position:position + weight_count]
+		values = weight_values[position:position + weight_count]
+		names = []
+		for i, weight in enumerate(weights):
+			if hasattr(weight, "name") and weight.name:
+				names.append(str(weight.name))
+			else:
+				names.append("param_" + str(i))
+		snapshot.append((layer.name, zip(names, values)))
+		position += weight_count
+	return snapshot
+
+
+def write_weight_snapshot(snapshot, path):
+	""" Writes a snapshot in the HDF5 layout of model.save_weights, so model.load_weights reads it back """
+	tmp_path = path + ".tmp"
+	with h5py.File(tmp_path, "w") as weight_file:
+		weight_file.attrs["layer_names"] = [layer_name.encode("utf8") for layer_name, _ in snapshot]
+		weight_file.attrs["backend"] = K.backend().encode("utf8")
+		weight_file.attrs["keras_version"] = str(keras.__version__).encode("utf8")
+		for layer_name, weights in snapshot:
+			group = weight_file.create_group(layer_name)
+			group.attrs["weight_names"] = [name.encode("utf8") for name, _ in weights]
+			for name, value in weights:
+				dataset = group.create_dataset(name, value.shape, dtype=value.dtype)
+				if not value.shape:
+					dataset[()] = value
+				else:
+					dataset[:] = value
+	os.rename(tmp_path, path)
+
+
+""" CHECKPOINT INDEX """
+
+CHECKPOINT_INDEX_VERSION = 1
+
+
+class CheckpointIndex(object):
+	""" JSON index of the checkpoints in a weights directory: epoch, weight file and size per model, write time and the
+	metrics of the epoch. Entries are kept sorted by epoch, so the latest checkpoint is the last one. A weights
+	directory from before the index existed is scanned once to build it """
+
+	def __init__(self, path, weights_dir):
+		self.path = path
+		self.weights_dir = weights_dir
+		self.lock = threading.RLock()
+		self.entries = self.load()
+
+	def load(self):
+		if os.path.isfile(self.path):
+			with open(self.path, "r") as index_file:
+				index = json.load(index_file)
+			if index.get("version") == CHECKPOINT_INDEX_VERSION:
+				return index["checkpoints"]
+		entries = self.scan_weights_dir()
+		if os.path.isdir(self.weights_dir):
+			self.entries = entries
+			self.save()
+		return entries
+
+	def scan_weights_dir(self):
+		""" Entries for the "<name>-<epoch>" weight files in the weights directory """
+		checkpoints = {}
+		if not os.path.isdir(self.weights_dir):
+			return []
+		for filename in os.listdir(self.weights_dir):
+			parts = filename.split("-")
+			path = os.path.join(self.weights_dir, filename)
+			if len(parts) != 2 or not parts[1].isdigit() or not os.path.isfile(path):
+				continue
+			name, epoch = parts[0], int(parts[1])
+			if epoch not in checkpoints:
+				checkpoints[epoch] = {"epoch": epoch, "files": {}, "sizes": {}, "metrics": {}, "time": 0}
+			checkpoints[epoch]["files"][name] = filename
+			checkpoints[epoch]["sizes"][name] = os.path.getsize(path)
+			checkpoints[epoch]["time"] = max(checkpoints[epoch]["time"], os.path.getmtime(path))
+		return [checkpoints[epoch] for epoch in sorted(checkpoints)]
+
+	def save(self):
+		with self.lock:
+			tmp_path = self.path + ".tmp"
+			with open(tmp_path, "w") as index_file:
+				json.dump({"version": CHECKPOINT_INDEX_VERSION, "checkpoints": self.entries}, index_file)
+			os.rename(tmp_path, self.path)
+
+	def record(self, epoch, files, metrics=None):
+		""" Adds the weight files {name: filename} of an epoch, merged into the entry of the epoch if there is one """
+		with self.lock:
+			matches = [entry for entry in self.entries if entry["epoch"] == epoch]
+			if len(matches) > 0:
+				entry = matches[0]
+			else:
+				entry = {"epoch": epoch, "files": {}, "sizes": {}, "metrics": {}, "time": 0}
+				self.entries.append(entry)
+				if len(self.entries) > 1 and self.entries[-2]["epoch"] > epoch:
+					self.entries.sort(key=lambda x: x["epoch"])
+			for name, filename in files.items():
+				entry["files"][name] = filename
+				entry["sizes"][name] = os.path.getsize(os.path.join(self.weights_dir, filename))
+			entry["metrics"].update(metrics or {})
+			entry["time"] = time.time()
+			self.save()
+
+	def remove(self, epochs):
+		with self.lock:
+			self.entries = [entry for entry in self.entries if entry["epoch"] not in epochs]
+			self.save()
+
+	def checkpoints(self, name=None):
+		""" Entries sorted by epoch, only those with a weight file for name if given """
+		with self.lock:
+			return [entry for entry in self.entries if name is None or name in entry["files"]]
+
+	def complete_checkpoints(self, names):
+		""" Entries sorted by epoch that have a weight file for every one of names """
+		with self.lock:
+			return [entry for entry in self.entries if all(name in entry["files"] for name in names)]
+
+	def latest(self, name=None):
+		checkpoints = self.checkpoints(name)
+		if len(checkpoints) == 0:
+			return None
+		return checkpoints[-1]
+
+	def best(self, metric, name=None, lowest=True):
+		scored = [entry for entry in self.checkpoints(name) if metric in entry["metrics"]]
+		if len(scored) == 0:
+			return None
+		if lowest:
+			return min(scored, key=lambda entry: entry["metrics"][metric])
+		return max(scored, key=lambda entry: entry["metrics"][metric])
+
+	def weight_path(self, filename):
+		return os.path.join(self.weights_dir, filename)
+
+
+""" CHECKPOINT MANAGER """
+
+
+class CheckpointManager(object):
+	""" Decides when to checkpoint, writes the weights on a background thread and prunes old weight files.
+
+	A checkpoint is taken when any save policy asks for one. The weights are copied on the calling thread, so training
+	continues while they are written. Written checkpoints are recorded in the index, and afterwards checkpoints no
+	retention policy keeps are deleted; without retention policies every checkpoint is kept. The first error of the
+	writer is re-raised by wait """
+
+	def __init__(self, index, save_policies, retention_policies=()):
+		self.index = index
+		self.save_policies = list(save_policies)
+		self.retention_policies = list(retention_policies)
+		self.queue = Queue()
+		self.write_error = None
+		self.writer = threading.Thread(target=self.write_checkpoints)
+		self.writer.daemon = True
+		self.writer.start()
+
+	def weight_filename(self, name, epoch):
+		return "%s-%s" % (name, epoch)
+
+	def maybe_save(self, epoch, models, metrics=None):
+		now = time.time()
+		# The first policy that asks for a save decides, the policies after it do not see the epoch
+		if any(policy.should_save(epoch, now) for policy in self.save_policies):
+			self.save(epoch, models, metrics)
+
+	def save(self, epoch, models, metrics=None):
+		""" models: {name: model}, e.g. {"generator": g_model, "discriminator": d_model} """
+		snapshots = [(name, snapshot_weights(model)) for name, model in models.items()]
+		self.queue.put((epoch, snapshots, dict(metrics or {})))
+
+	def write_checkpoints(self):
+		while True:
+			epoch, snapshots, metrics = self.queue.get()
+			try:
+				files = {}
+				for name, snapshot in snapshots:
+					files[name] = self.weight_filename(name, epoch)
+					write_weight_snapshot(snapshot, self.index.weight_path(files[name]))
+				self.index.record(epoch, files, metrics)
+				self.prune()
+			except Exception as e:
+				print "Could not write checkpoint for epoch %s: %s" % (epoch, e)
+				if self.write_error is None:
+					self.write_error = sys.exc_info()
+			finally:
+				self.queue.task_done()
+
+	def prune(self):
+		if len(self.retention_policies) == 0:
+			return
+		checkpoints = self.index.checkpoints()
+		kept_epochs = set()
+		for policy in self.retention_policies:
+			kept_epochs.update(policy.keep(checkpoints))
+		removed_epochs = set()
+		for checkpoint in checkpoints:
+			if checkpoint["epoch"] in kept_epochs:
+				continue
+			removed_epochs.add(checkpoint["epoch"])
+			for filename in checkpoint["files"].values():
+				path = self.index.weight_path(filename)
+				if os.path.isfile(path):
+					os.remove(path)
+		if len(removed_epochs) > 0:
+			self.index.remove(removed_epochs)
+
+	def wait(self):
+		""" Blocks until every queued checkpoint is on disk, and raises the first error of the writer if a checkpoint
+		could not be written """
+		self.queue.join()
+		if self.write_error is not None:
+			exc_info, self.write_error = self.write_error, None
+			raise exc_info[0], exc_info[1], exc_info[2]
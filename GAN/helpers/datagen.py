@@ -1,46 +1,70 @@
+import hashlib
+import json
+import os
+
 import numpy as np
 from keras.preprocessing.text import Tokenizer
 
-from GAN.helpers.enums import NoiseMode, Conf, WordEmbedding, PreInit
+import settings
+
+from GAN.helpers.enums import Conf, WordEmbedding
 from GAN.helpers.list_helpers import pairwise_cosine_similarity
-from helpers.io_helper import load_pickle_file
+from GAN.helpers.noise import sample_noise_batches
+from data.database.helpers.split_database_helper import filter_split
+from helpers.io_helper import load_pickle_file, save_array_dir, load_array_dir, load_array_dir_manifest
 from helpers.list_helpers import print_progress
 from word2vec.word2vec_helpers import get_dict_filename
 
 
-def to_categorical_lists(captions, word_to_id_dict, config):
-	matrix = np.zeros((len(captions), config[Conf.MAX_SEQ_LENGTH], config[Conf.VOCAB_SIZE]))
-	for caption_index in range(len(captions)):
-		caption = captions[caption_index]
-		for word_index in range(config[Conf.MAX_SEQ_LENGTH]):
-			if word_index >= len(caption):
-				word = word_to_id_dict['<pad>']
-			else:
-				word = caption[word_index]
-			matrix[caption_index, word_index, word] = 1.
+def pad_index_sentences(captions, word_to_id_dict, config):
+	""" int32 (captions, MAX_SEQ_LENGTH) matrix of word ids, cut to length and padded with <pad> """
+	matrix = np.empty((len(captions), config[Conf.MAX_SEQ_LENGTH]), dtype=np.int32)
+	matrix.fill(word_to_id_dict['<pad>'])
+	for caption_index, caption in enumerate(captions):
+		caption = caption[:config[Conf.MAX_SEQ_LENGTH]]
+		matrix[caption_index, :len(caption)] = caption
 	return matrix
 
 
-def onehot_to_softmax(one_hot, max_range=(0.5, 1.0), min_range=(0.0, 0.001)):
-	softmax = np.random.uniform(min_range[0], min_range[1], one_hot.shape).astype(dtype="float32")
-	for i, one_hot_sentence in enumerate(one_hot):
-		for j, one_hot_word in enumerate(one_hot_sentence):
-			new_word = softmax[i][j]
-			new_word[np.argmax(one_hot_word)] = np.random.uniform(max_range[0], max_range[1])
-			word_sum = new_word.sum()
-			softmax[i][j] = new_word / word_sum
+def scatter_word_values(index_matrix, values, vocab_size, base=None):
+	""" Writes values[i, j] to position index_matrix[i, j] of the last axis of a (.., vocab_size) float32 matrix """
+	if base is None:
+		base = np.zeros(index_matrix.shape + (vocab_size,), dtype=np.float32)
+	flat = base.reshape(-1, vocab_size)
+	flat[np.arange(flat.shape[0]), index_matrix.ravel()] = np.ravel(values)
+	return base
+
+
+def to_categorical_lists(captions, word_to_id_dict, config):
+	if not isinstance(captions, np.ndarray):
+		captions = pad_index_sentences(captions, word_to_id_dict, config)
+	return scatter_word_values(captions, 1., config[Conf.VOCAB_SIZE])
+
+
+def index_to_softmax(index_matrix, vocab_size, max_range=(0.5, 1.0), min_range=(0.0, 0.001)):
+	""" Noisy softmax targets straight from word ids, without building the one-hot matrix first """
+	softmax = np.random.uniform(min_range[0], min_range[1], index_matrix.shape + (vocab_size,)).astype(dtype="float32")
+	peaks = np.random.uniform(max_range[0], max_range[1], index_matrix.shape)
+	softmax = scatter_word_values(index_matrix, peaks, vocab_size, softmax)
+	softmax /= softmax.sum(axis=-1, keepdims=True)
 	return softmax
 
 
-def generate_index_sentences(config, cap_data=-1):
+def onehot_to_softmax(one_hot, max_range=(0.5, 1.0), min_range=(0.0, 0.001)):
+	return index_to_softmax(np.argmax(one_hot, axis=-1), one_hot.shape[-1], max_range, min_range)
+
+
+def generate_index_sentences(config, cap_data=-1, split=None):
 	max_seq_length = config[Conf.MAX_SEQ_LENGTH]
 	nb_words = config[Conf.VOCAB_SIZE]
+	if split is None:
+		split = config[Conf.TRAIN_SPLIT]
 
 	if config[Conf.LIMITED_DATASET] is not None:
 		print "Loading %s sentences" % config[Conf.LIMITED_DATASET]
-		word_captions = get_custom_sentences(config)
+		word_captions = get_custom_sentences(config, split)
 	else:
-		word_captions = get_flickr_sentences(cap_data)
+		word_captions = get_flickr_sentences(cap_data, config, split)
 	word_captions = ['<sos> ' + line + ' <eos> <pad>' for line in word_captions]
 
 	tokenizer = Tokenizer(nb_words=nb_words, filters="""!"#$%&'()*+-/:;=?@[\]^_`{|}~""")
@@ -54,14 +78,17 @@ def generate_index_sentences(config, cap_data=-1):
 	return index_captions, id_to_word_dict, word_to_id_dict
 
 
-def generate_string_sentences(config):
+def generate_string_sentences(config, split=None):
+	""" Sentences of the given split, config[Conf.TRAIN_SPLIT] by default """
 	cap_data = config[Conf.DATASET_SIZE]
+	if split is None:
+		split = config[Conf.TRAIN_SPLIT]
 	if config[Conf.LIMITED_DATASET] is not None:
 		print "Loading %s sentences" % config[Conf.LIMITED_DATASET]
-		sentences = get_custom_sentences(config)
+		sentences = get_custom_sentences(config, split)
 	else:
 		print "Loading Flickr sentences..."
-		sentences = get_flickr_sentences(cap_data)
+		sentences = get_flickr_sentences(cap_data, config, split)
 	return preprocess_sentences(config, sentences)
 
 
@@ -95,7 +122,7 @@ def preprocess_sentences(config, sentences):
 	return np.asarray(word_list_sentences), word_embedding_dict
 
 
-def get_flickr_sentences(cap_data):
+def get_flickr_sentences(cap_data, config=None, split=None):
 	path = "data/datasets/Flickr8k.txt"
 
 	sentence_file = open(path)
@@ -104,76 +131,29 @@ def get_flickr_sentences(cap_data):
 	else:
 		word_captions = sentence_file.readlines()[:cap_data]
 	sentence_file.close()
-	word_captions = [(line.split("\t")[1]).strip() for line in word_captions]
+	word_captions = [line.split("\t") for line in word_captions]
+	# Split by image (the part of "image.jpg#2" before the caption number) so captions of one image stay together
+	word_captions = filter_split("Flickr8k", word_captions, config, split, key=lambda line: line[0].split("#")[0])
+	word_captions = [line[1].strip() for line in word_captions]
 	return word_captions
 
 
-def get_custom_sentences(config):
+def get_custom_sentences(config, split=None):
 	if config[Conf.LIMITED_DATASET].endswith(".txt"):
 		path = "data/datasets/%s" % config[Conf.LIMITED_DATASET]
 		sentence_file = open(path)
 		word_captions = sentence_file.readlines()
 		sentence_file.close()
 		word_captions = [line.strip() for line in word_captions]
+		word_captions = filter_split(config[Conf.LIMITED_DATASET], word_captions, config, split,
+		                             key=lambda line: line.decode("utf-8", "ignore"))
 	else:
 		word_captions = fetch_flower_captions(config)
 
 	return word_captions
 
-import random
 def generate_input_noise(config):
-	if config[Conf.PREINIT] == PreInit.ENCODER_DECODER:
-		if config[Conf.WORD_EMBEDDING] == WordEmbedding.ONE_HOT:
-			noise_size = config[Conf.VOCAB_SIZE]
-		else:
-			noise_size = config[Conf.EMBEDDING_SIZE]
-	else:
-		noise_size = config[Conf.NOISE_SIZE]
-
-	if config[Conf.NOISE_MODE] == NoiseMode.REPEAT:
-		noise_matrix = np.zeros((config[Conf.BATCH_SIZE], config[Conf.MAX_SEQ_LENGTH], noise_size))
-		for batch_index in range(config[Conf.BATCH_SIZE]):
-			word_noise = np.random.normal(size=noise_size)
-			for word_index in range(config[Conf.MAX_SEQ_LENGTH]):
-				noise_matrix[batch_index][word_index] = word_noise
-
-		return noise_matrix
-
-	elif config[Conf.NOISE_MODE] == NoiseMode.REPEAT_SINGLE:
-		noise_matrix = np.zeros((config[Conf.BATCH_SIZE], noise_size))
-		for batch_index in range(config[Conf.BATCH_SIZE]):
-			noise_matrix[batch_index] = np.random.normal(size=noise_size)
-
-		return noise_matrix
-
-	elif config[Conf.NOISE_MODE] == NoiseMode.NEW:
-		return np.random.rand(config[Conf.BATCH_SIZE], config[Conf.MAX_SEQ_LENGTH], noise_size)
-
-	elif config[Conf.NOISE_MODE] == NoiseMode.FIRST_ONLY:
-		noise_matrix = np.zeros((config[Conf.BATCH_SIZE], config[Conf.MAX_SEQ_LENGTH], noise_size))
-		for batch_index in range(config[Conf.BATCH_SIZE]):
-			word_noise = np.random.normal(size=noise_size)
-			for word_index in range(config[Conf.MAX_SEQ_LENGTH]):
-				noise_matrix[batch_index][word_index] = word_noise
-		for batch_index in range(config[Conf.BATCH_SIZE]):
-			if random.random() < 0.5:
-				word_noise = np.zeros(noise_size)
-			else:
-				word_noise = np.ones(noise_size)
-			noise_matrix[batch_index][0] = word_noise
-		return noise_matrix
-
-	elif config[Conf.NOISE_MODE] == NoiseMode.ONES:
-		return np.ones((config[Conf.BATCH_SIZE], config[Conf.MAX_SEQ_LENGTH], noise_size))
-
-	elif config[Conf.NOISE_MODE] == NoiseMode.ENCODING:
-		embedded_data = load_pickle_file(
-			"sequence_to_sequence/logs/S2S_2EMB_2017-04-04_VS2+1000_BS128_HD30_DHL1_ED50_SEQ5_WEMword2vec/encoded_data.pkl")
-		random_distribution_of_embedded_data = []
-		for i in range(config[Conf.BATCH_SIZE]):
-			# random_distribution_of_embedded_data.append(embedded_data[np.random.randint(0, len(embedded_data))])
-			random_distribution_of_embedded_data.append(embedded_data[i])
-		return np.asarray(random_distribution_of_embedded_data)
+	return sample_noise_batches(config, np.random)[0]
 
 
 def get_word_embeddings():
@@ -193,22 +173,76 @@ def get_word_embeddings():
 
 
 def emb_generate_caption_training_batch(training_batch, word_embedding_dict, config):
-	embedding_lists = []
-	for word_list in training_batch:
-		embedding_sentence = []
+	token_ids, embedding_table = emb_encode_sentences(training_batch, word_embedding_dict, config)
+	return embedding_table[token_ids]
+
+
+def emb_encode_sentences(word_list_sentences, word_embedding_dict, config):
+	""" int32 (sentences, MAX_SEQ_LENGTH) token id matrix and the float32 embedding table it indexes, so a batch of
+	embedded sentences is embedding_table[token_ids[batch]]. Words without an embedding are dropped and sentences are
+	cut or padded to MAX_SEQ_LENGTH. The pad word has id 0 """
+	if config[Conf.WORD_EMBEDDING] == WordEmbedding.GLOVE:
+		pad_word = "="
+	else:
+		pad_word = "<pad>"
+	word_to_id_dict = {pad_word: 0}
+	embedding_rows = [word_embedding_dict[pad_word]]
+	token_ids = np.zeros((len(word_list_sentences), config[Conf.MAX_SEQ_LENGTH]), dtype=np.int32)
+	for sentence_index, word_list in enumerate(word_list_sentences):
+		sentence_ids = []
 		for word_string in word_list:
-			if word_string in word_embedding_dict:
-				word_embedding = word_embedding_dict[word_string]
-				embedding_sentence.append(word_embedding)
-		if len(embedding_sentence) > config[Conf.MAX_SEQ_LENGTH]:
-			embedding_sentence = embedding_sentence[:config[Conf.MAX_SEQ_LENGTH]]
-		while len(embedding_sentence) < config[Conf.MAX_SEQ_LENGTH]:
-			if config[Conf.WORD_EMBEDDING] == WordEmbedding.GLOVE:
-				embedding_sentence.append(word_embedding_dict["="])
-			else:
-				embedding_sentence.append(word_embedding_dict["<pad>"])
-		embedding_lists.append(embedding_sentence)
-	return np.asarray(embedding_lists)
+			if word_string not in word_embedding_dict:
+				continue
+			if word_string not in word_to_id_dict:
+				word_to_id_dict[word_string] = len(embedding_rows)
+				embedding_rows.append(word_embedding_dict[word_string])
+			sentence_ids.append(word_to_id_dict[word_string])
+		sentence_ids = sentence_ids[:config[Conf.MAX_SEQ_LENGTH]]
+		token_ids[sentence_index, :len(sentence_ids)] = sentence_ids
+	return token_ids, np.asarray(embedding_rows, dtype=np.float32)
+
+
+# Bump when emb_encode_sentences changes, so stored token matrices are rebuilt
+TOKEN_CACHE_VERSION = 1
+
+
+def emb_fetch_token_matrix(word_list_sentences, word_embedding_dict, config):
+	""" emb_encode_sentences, stored on disk per (sentences, word embedding model) and loaded memory-mapped. The arrays
+	are read-only, a batch indexed with an array of rows is a writable copy """
+	cache_path = settings.STORED_EMBEDDINGS_DIR + get_token_cache_key(word_list_sentences, config)
+	manifest = load_array_dir_manifest(cache_path)
+	if manifest is not None and manifest["version"] == TOKEN_CACHE_VERSION:
+		print "Loading token matrix from local storage: %s" % cache_path
+		arrays, _ = load_array_dir(cache_path, mmap_mode="r")
+		return arrays["token_ids"], arrays["embedding_table"]
+
+	token_ids, embedding_table = emb_encode_sentences(word_list_sentences, word_embedding_dict, config)
+	save_array_dir({"token_ids": token_ids, "embedding_table": embedding_table},
+	               {"version": TOKEN_CACHE_VERSION, "word_embedding": get_word_embedding_name(config)}, cache_path)
+	# Read-only like the memory-mapped arrays, so a write fails on the first run instead of only on cached runs
+	token_ids.setflags(write=False)
+	embedding_table.setflags(write=False)
+	return token_ids, embedding_table
+
+
+def get_word_embedding_name(config):
+	if config[Conf.WORD_EMBEDDING] == WordEmbedding.GLOVE:
+		return "data/datasets/glove.6B.50d.txt"
+	return get_dict_filename(config[Conf.EMBEDDING_SIZE], config[Conf.WORD2VEC_NUM_STEPS], config[Conf.VOCAB_SIZE],
+	                         config[Conf.W2V_SET])
+
+
+def get_token_cache_key(word_list_sentences, config):
+	sentence_hash = hashlib.sha1()
+	for word_list in word_list_sentences:
+		line = u" ".join(word.decode("utf-8", "ignore") if isinstance(word, str) else word for word in word_list)
+		sentence_hash.update(line.encode("utf-8") + "\n")
+	word_embedding_name = get_word_embedding_name(config)
+	# The model mtime catches a word2vec model retrained under the same file name
+	word_embedding_mtime = os.path.getmtime(word_embedding_name) if os.path.isfile(word_embedding_name) else 0
+	key_source = json.dumps([TOKEN_CACHE_VERSION, word_embedding_name, word_embedding_mtime,
+	                         config[Conf.MAX_SEQ_LENGTH], sentence_hash.hexdigest()])
+	return "tokens-%s" % hashlib.sha1(key_source).hexdigest()[:12]
 
 
 def generate_image_training_batch(image_batch, config):
@@ -216,6 +250,16 @@ def generate_image_training_batch(image_batch, config):
 	return np.repeat(image_batch, config[Conf.MAX_SEQ_LENGTH], axis=1)
 
 
+def build_image_noise_input(image_batch, noise_batch, config):
+	""" Image caption generator input: the (batch, 1, IMAGE_DIM) image vectors as first timestep, followed by each
+	sentence's noise vector repeated over the remaining MAX_SEQ_LENGTH - 1 timesteps """
+	generator_input = np.empty((len(noise_batch), config[Conf.MAX_SEQ_LENGTH], noise_batch.shape[-1]),
+	                           dtype=np.result_type(image_batch, noise_batch))
+	generator_input[:, :1, :] = image_batch
+	generator_input[:, 1:, :] = noise_batch[:, np.newaxis, :]
+	return generator_input
+
+
 def generate_image_with_noise_training_batch(image_batch, config):
 	noise = generate_input_noise(config)
 	for batch_index in range(len(image_batch)):
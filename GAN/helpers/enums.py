@@ -23,6 +23,12 @@ class PreInit(Enum):
 	ENCODER_DECODER = "EncDec"
 
 
+class SamplingMode(Enum):
+	SHUFFLE = "shuffle"
+	BALANCED = "balanced"
+	BUCKETED = "bucketed"
+
+
 class Conf(Enum):
 	DATE = 1
 	VOCAB_SIZE = 2
@@ -44,3 +50,23 @@ class Conf(Enum):
 	LIMITED_DATASET = 18
 	W2V_SET = 19
 	LOGGER = 20
+	IMAGE_CLASSES = 21
+	MAX_CAPTION_LENGTH = 22
+	SPLIT_SEED = 23
+	SPLIT_RATIOS = 24
+	TRAIN_SPLIT = 25
+	EVAL_SPLIT = 26
+	NOISE_SEED = 27
+	NOISE_PREFETCH = 28
+	ENCODED_NOISE_MODEL = 29
+	PIPELINE_DEPTH = 30
+	SAMPLING_MODE = 31
+	FUSED_DISCRIMINATOR_UPDATE = 32
+	CHECKPOINT_EVERY_EPOCHS = 33
+	CHECKPOINT_INTERVAL_SECONDS = 34
+	CHECKPOINT_KEEP_LAST = 35
+	CHECKPOINT_KEEP_BEST = 36
+	METRICS_BUFFER_SIZE = 37
+	METRICS_FLUSH_SECONDS = 38
+	EVAL_WORKERS = 39
+	BLEU_IN_POOL = 40
@@ -2,7 +2,10 @@ import datetime
 import os
 import sys
 
+from GAN.helpers.checkpoints import CheckpointIndex, CheckpointManager, ScheduleSavePolicy, EveryEpochsSavePolicy, \
+	IntervalSavePolicy, KeepLastPolicy, KeepBestPolicy
 from GAN.helpers.enums import Conf
+from GAN.helpers.metrics import MetricsWriter, LOSS_FIELDS, LOSS_ACC_FIELDS, LOSS_ACC_FAKE_FIELDS
 
 
 def generate_name_prefix(config):
@@ -33,6 +36,10 @@ def generate_name_prefix(config):
 class GANLogger:
 	def __init__(self, config, inference):
 		self.exists = False
+		self.checkpoint_index = None
+		self.metrics_writers = {}
+		self.metrics_buffer_size = config[Conf.METRICS_BUFFER_SIZE]
+		self.metrics_flush_seconds = config[Conf.METRICS_FLUSH_SECONDS]
 		print "config[Conf.MODELNAME]: %s" % config[Conf.MODELNAME]
 		if config[Conf.MODELNAME] is not None:
 			self.name_prefix = config[Conf.MODELNAME]
@@ -51,12 +58,11 @@ class GANLogger:
 			os.makedirs(directory)
 
 	def create_model_files(self):
-		text_filenames = ["comments", "loss", "model_summary", "eval"]
+		text_filenames = ["comments", "model_summary", "eval"]
 		for filename in text_filenames:
 			f = open("GAN/GAN_log/%s/%s.txt" % (self.name_prefix, filename), 'a+')
-			if filename == "loss":
-				f.write(str(datetime.datetime.now()) + "\n")
 			f.close()
+		self.write_to_comments_file("Training started %s" % datetime.datetime.now())
 
 	def create_model_folders_and_files(self):
 		model_filepath = "GAN/GAN_log/%s/model_files/stored_weights" % self.name_prefix
@@ -72,28 +78,67 @@ class GANLogger:
 		with open("GAN/GAN_log/%s/model_files/%s.json" % (self.name_prefix, name), "w+") as json_file:
 			json_file.write(model_json)
 
+	def get_metrics_writer(self, name, fields):
+		""" Buffered writer of GAN/GAN_log/<name_prefix>/<name>.metrics, read back with helpers.metrics.load_metrics """
+		if name not in self.metrics_writers:
+			self.metrics_writers[name] = MetricsWriter("GAN/GAN_log/%s/%s.metrics" % (self.name_prefix, name), fields,
+			                                           self.metrics_buffer_size, self.metrics_flush_seconds)
+		return self.metrics_writers[name]
+
+	def flush_metrics(self):
+		for metrics_writer in self.metrics_writers.values():
+			metrics_writer.flush()
+
 	def save_loss(self, g_loss, d_loss, epoch, batch):
-		loss_file = open("GAN/GAN_log/%s/loss.txt" % self.name_prefix, "a")
-		loss_file.write("%s,%s,%s,%s\n" % (epoch, batch, g_loss, d_loss))
-		loss_file.close()
+		self.get_metrics_writer("loss", LOSS_FIELDS).append(epoch, batch, g_loss, d_loss)
 
 	def save_loss_acc(self, g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train, epoch, batch):
-		loss_file = open("GAN/GAN_log/%s/loss.txt" % self.name_prefix, "a")
-		loss_file.write("%s,%s,%s,%s,%s,%s,%s,%s\n" % (
-			epoch, batch, g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train))
-		loss_file.close()
+		self.get_metrics_writer("loss", LOSS_ACC_FIELDS).append(
+			epoch, batch, g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train)
 
 	def save_loss_acc_fake(self, g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train, epoch, batch, d_loss_fake_img, d_acc_fake_img):
-		loss_file = open("GAN/GAN_log/%s/loss.txt" % self.name_prefix, "a")
-		loss_file.write("%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n" % (
-			epoch, batch, g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train, d_loss_fake_img, d_acc_fake_img))
-		loss_file.close()
+		self.get_metrics_writer("loss", LOSS_ACC_FAKE_FIELDS).append(
+			epoch, batch, g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train, d_loss_fake_img, d_acc_fake_img)
+
+	def create_checkpoint_manager(self, config):
+		""" Checkpoint manager for training, with the save and retention policies of the config """
+		save_policies = []
+		if config[Conf.CHECKPOINT_EVERY_EPOCHS] is not None:
+			save_policies.append(EveryEpochsSavePolicy(config[Conf.CHECKPOINT_EVERY_EPOCHS]))
+		if config[Conf.CHECKPOINT_INTERVAL_SECONDS] is not None:
+			save_policies.append(IntervalSavePolicy(config[Conf.CHECKPOINT_INTERVAL_SECONDS]))
+		if len(save_policies) == 0:
+			save_policies.append(ScheduleSavePolicy())
+
+		retention_policies = []
+		if config[Conf.CHECKPOINT_KEEP_LAST] is not None:
+			retention_policies.append(KeepLastPolicy(config[Conf.CHECKPOINT_KEEP_LAST]))
+		if config[Conf.CHECKPOINT_KEEP_BEST] is not None:
+			metric, nb_checkpoints = config[Conf.CHECKPOINT_KEEP_BEST]
+			retention_policies.append(KeepBestPolicy(metric, nb_checkpoints))
+
+		self.checkpoint_manager = CheckpointManager(self.get_checkpoint_index(), save_policies, retention_policies)
+		return self.checkpoint_manager
+
+	def get_weights_dir(self):
+		return "GAN/GAN_log/%s/model_files/stored_weights/" % self.name_prefix
+
+	def get_checkpoint_index(self):
+		if self.checkpoint_index is None:
+			self.checkpoint_index = CheckpointIndex(
+				"GAN/GAN_log/%s/model_files/checkpoints.json" % self.name_prefix, self.get_weights_dir())
+		return self.checkpoint_index
+
+	def get_weight_path(self, weight_filename):
+		return self.get_checkpoint_index().weight_path(weight_filename)
 
 	def save_model_weights(self, model, epoch, name, suffix=""):
-		path = "GAN/GAN_log/%s/model_files/stored_weights/" % self.name_prefix
+		path = self.get_weights_dir()
 		if suffix != "":
 			suffix = "-" + suffix
 		model.save_weights(path + "%s-%s%s" % (name, epoch, suffix), True)
+		if suffix == "":
+			self.get_checkpoint_index().record(epoch, {name: "%s-%s" % (name, epoch)})
 
 	def print_start_message(self):
 		print "\n"
@@ -101,25 +146,22 @@ class GANLogger:
 		print "Starting network %s" % self.name_prefix
 		print "#" * 100
 
+	def get_checkpoints(self, name=None):
+		""" Checkpoint index entries sorted by epoch, see CheckpointIndex """
+		return self.get_checkpoint_index().checkpoints(name)
+
+	def get_complete_checkpoints(self, names=("generator", "discriminator")):
+		""" Checkpoint index entries with a weight file for each of names, IOError if there are none """
+		checkpoints = self.get_checkpoint_index().complete_checkpoints(names)
+		if len(checkpoints) == 0:
+			raise IOError("No checkpoint with %s weights in GAN/GAN_log/%s" % (" and ".join(names), self.name_prefix))
+		return checkpoints
+
 	def get_generator_weights(self):
-		path = "GAN/GAN_log/%s/model_files/stored_weights/" % self.name_prefix
-		weigthfiles = [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
-		generator_weights = []
-		for weightfile in weigthfiles:
-			if "generator" in weightfile:
-				generator_weights.append(weightfile)
-		generator_weights.sort(key=lambda x: int(x.split("-")[-1]))
-		return generator_weights
+		return [checkpoint["files"]["generator"] for checkpoint in self.get_checkpoints("generator")]
 
 	def get_discriminator_weights(self):
-		path = "GAN/GAN_log/%s/model_files/stored_weights/" % self.name_prefix
-		weigthfiles = [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
-		d_weights = []
-		for weightfile in weigthfiles:
-			if "discriminator" in weightfile:
-				d_weights.append(weightfile)
-		d_weights.sort(key=lambda x: int(x.split("-")[-1]))
-		return d_weights
+		return [checkpoint["files"]["discriminator"] for checkpoint in self.get_checkpoints("discriminator")]
 
 	def save_model_summary(self, model, name=str()):
 		summary_file = open("GAN/GAN_log/%s/model_summary.txt" % self.name_prefix, "a")
@@ -0,0 +1,111 @@
+import atexit
+import json
+import os
+import time
+
+import numpy as np
+
+""" Append-only binary metrics files. A file starts with METRICS_MAGIC and a JSON header line holding the schema, padded
+so the records start at a multiple of 64 bytes, followed by the records as packed numpy structs """
+
+METRICS_MAGIC = "GANMETRICS\n"
+METRICS_VERSION = 1
+
+LOSS_FIELDS = [("epoch", "<i4"), ("batch", "<i4"), ("g_loss", "<f4"), ("d_loss", "<f4")]
+LOSS_ACC_FIELDS = [("epoch", "<i4"), ("batch", "<i4"), ("g_loss", "<f4"), ("g_acc", "<f4"), ("d_loss_gen", "<f4"),
+                   ("d_acc_gen", "<f4"), ("d_loss_train", "<f4"), ("d_acc_train", "<f4")]
+LOSS_ACC_FAKE_FIELDS = LOSS_ACC_FIELDS + [("d_loss_fake_img", "<f4"), ("d_acc_fake_img", "<f4")]
+
+
+def write_metrics_header(path, fields):
+	header = json.dumps({"version": METRICS_VERSION, "fields": fields, "created": time.time()})
+	header_length = len(METRICS_MAGIC) + len(header) + 1
+	padding = " " * (-header_length % 64)
+	with open(path, "wb") as metrics_file:
+		metrics_file.write(METRICS_MAGIC + header + padding + "\n")
+
+
+def read_metrics_header(path):
+	""" (header dict, offset of the first record) """
+	with open(path, "rb") as metrics_file:
+		if metrics_file.read(len(METRICS_MAGIC)) != METRICS_MAGIC:
+			raise ValueError("Not a metrics file: %s" % path)
+		header = json.loads(metrics_file.readline())
+		return header, metrics_file.tell()
+
+
+def get_metrics_dtype(fields):
+	return np.dtype([(str(name), str(dtype)) for name, dtype in fields])
+
+
+class MetricsWriter(object):
+	""" Buffers metric rows in a preallocated record array and appends them to the file when the buffer is full,
+	flush_seconds have passed since the last write, or flush is called. Rows still buffered at exit are written too """
+
+	def __init__(self, path, fields, buffer_size=1024, flush_seconds=30):
+		self.path = path
+		self.dtype = get_metrics_dtype(fields)
+		if os.path.isfile(path):
+			header, offset = read_metrics_header(path)
+			if get_metrics_dtype(header["fields"]) != self.dtype:
+				raise ValueError("%s was written with other fields: %s" % (path, header["fields"]))
+			# Drop a record cut off by a crash, so appended records stay aligned
+			record_bytes = (os.path.getsize(path) - offset) % self.dtype.itemsize
+			if record_bytes > 0:
+				with open(path, "r+b") as metrics_file:
+					metrics_file.truncate(os.path.getsize(path) - record_bytes)
+		else:
+			write_metrics_header(path, fields)
+		self.buffer = np.zeros(buffer_size, dtype=self.dtype)
+		self.count = 0
+		self.flush_seconds = flush_seconds
+		self.last_flush_time = time.time()
+		atexit.register(self.flush)
+
+	def append(self, *values):
+		self.buffer[self.count] = values
+		self.count += 1
+		if self.count == len(self.buffer) or time.time() - self.last_flush_time >= self.flush_seconds:
+			self.flush()
+
+	def flush(self):
+		if self.count > 0:
+			with open(self.path, "ab") as metrics_file:
+				self.buffer[:self.count].tofile(metrics_file)
+		self.count = 0
+		self.last_flush_time = time.time()
+
+
+def load_metrics(path):
+	""" Memory-mapped record array of a metrics file, with one field per column. A partly written last record is
+	ignored """
+	header, offset = read_metrics_header(path)
+	dtype = get_metrics_dtype(header["fields"])
+	count = (os.path.getsize(path) - offset) / dtype.itemsize
+	if count == 0:
+		return np.zeros(0, dtype=dtype)
+	return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def load_loss_metrics(log_dir):
+	""" The loss and accuracy rows of a GAN log directory. Runs logged before loss.metrics existed are read from
+	loss.txt """
+	metrics_path = os.path.join(log_dir, "loss.metrics")
+	if os.path.isfile(metrics_path):
+		return load_metrics(metrics_path)
+	return np.genfromtxt(os.path.join(log_dir, "loss.txt"), delimiter=',', skip_header=1, invalid_raise=False,
+	                     names=[name for name, _ in LOSS_ACC_FIELDS])
+
+
+def downsample_metrics(data, max_points):
+	""" At most max_points rows, each the mean of a run of consecutive rows, for plotting long runs """
+	if len(data) <= max_points:
+		return data
+	bucket_size = int(np.ceil(len(data) / float(max_points)))
+	starts = np.arange(0, len(data), bucket_size)
+	counts = np.diff(np.append(starts, len(data)))
+	names = data.dtype.names
+	downsampled = np.zeros(len(starts), dtype=[(name, "<f8") for name in names])
+	for name in names:
+		downsampled[name] = np.add.reduceat(np.asarray(data[name], dtype=np.float64), starts) / counts
+	return downsampled
@@ -0,0 +1,121 @@
+import os
+from collections import deque
+
+import numpy as np
+
+from GAN.helpers.enums import NoiseMode, Conf, WordEmbedding, PreInit
+from helpers.io_helper import load_pickle_file
+
+
+def get_noise_size(config):
+	if config[Conf.PREINIT] == PreInit.ENCODER_DECODER:
+		if config[Conf.WORD_EMBEDDING] == WordEmbedding.ONE_HOT:
+			return config[Conf.VOCAB_SIZE]
+		return config[Conf.EMBEDDING_SIZE]
+	return config[Conf.NOISE_SIZE]
+
+
+def sample_noise_batches(config, random_state, nb_batches=1, encoded_noise=None):
+	""" nb_batches noise batches for config[Conf.NOISE_MODE], each mode drawn with a single call to random_state.
+	REPEAT batches are read-only broadcast views of one noise vector per sentence. ENCODING batches come from
+	encoded_noise, or a provider shared by the process if none is given """
+	batch_size = config[Conf.BATCH_SIZE]
+	max_seq_length = config[Conf.MAX_SEQ_LENGTH]
+	noise_size = get_noise_size(config)
+	noise_mode = config[Conf.NOISE_MODE]
+
+	if noise_mode == NoiseMode.REPEAT:
+		word_noise = random_state.normal(size=(nb_batches, batch_size, 1, noise_size))
+		return [np.broadcast_to(batch, (batch_size, max_seq_length, noise_size)) for batch in word_noise]
+
+	elif noise_mode == NoiseMode.REPEAT_SINGLE:
+		return list(random_state.normal(size=(nb_batches, batch_size, noise_size)))
+
+	elif noise_mode == NoiseMode.NEW:
+		return list(random_state.rand(nb_batches, batch_size, max_seq_length, noise_size))
+
+	elif noise_mode == NoiseMode.FIRST_ONLY:
+		word_noise = random_state.normal(size=(nb_batches, batch_size, 1, noise_size))
+		noise = np.repeat(word_noise, max_seq_length, axis=2)
+		# First word is all zeros or all ones, with equal probability
+		noise[:, :, 0, :] = random_state.random_sample((nb_batches, batch_size, 1)) >= 0.5
+		return list(noise)
+
+	elif noise_mode == NoiseMode.ONES:
+		return [np.ones((batch_size, max_seq_length, noise_size)) for _ in range(nb_batches)]
+
+	elif noise_mode == NoiseMode.ENCODING:
+		if encoded_noise is None:
+			encoded_noise = get_encoded_noise_provider(config)
+		return [encoded_noise.next_batch(batch_size) for _ in range(nb_batches)]
+
+	raise ValueError("Unsupported noise mode: %s" % noise_mode)
+
+
+def get_encoded_data_path(model_filename):
+	""" Path of the latent vectors saved by sequence_to_sequence.embedding_seq2seq.encode, without extension """
+	return "sequence_to_sequence/logs/%s/encoded_data" % model_filename
+
+
+def load_encoded_data(model_filename):
+	""" The encoded dataset of a seq2seq model, memory-mapped. Models encoded before the .npy copy existed only have the
+	pickle, which is converted once """
+	path = get_encoded_data_path(model_filename)
+	if not os.path.isfile(path + ".npy"):
+		print "Converting %s.pkl to .npy" % path
+		np.save(path + ".npy", np.asarray(load_pickle_file(path + ".pkl")))
+	return np.load(path + ".npy", mmap_mode="r")
+
+
+class EncodedNoiseProvider(object):
+	""" Noise batches sampled from a seq2seq encoded dataset. Rows are drawn without replacement: every row is used
+	once per pass over the data before any row repeats, and a batch only repeats a row if it is larger than the data """
+
+	def __init__(self, model_filename, random_state):
+		self.encoded_data = load_encoded_data(model_filename)
+		self.random_state = random_state
+		self.order = np.zeros(0, dtype=np.int64)
+		self.position = 0
+
+	def next_batch(self, batch_size):
+		rows = self.order[self.position:self.position + batch_size]
+		self.position += len(rows)
+		while len(rows) < batch_size:
+			order = self.random_state.permutation(len(self.encoded_data))
+			# Rows of the previous pass already in this batch go to the end of the new pass, so a batch that spans both
+			# passes holds no row twice
+			in_batch = np.in1d(order, rows)
+			self.order = np.concatenate((order[~in_batch], order[in_batch]))
+			self.position = batch_size - len(rows)
+			rows = np.concatenate((rows, self.order[:self.position]))
+		return np.asarray(self.encoded_data[rows])
+
+
+_encoded_noise_providers = {}
+
+
+def get_encoded_noise_provider(config):
+	model_filename = config[Conf.ENCODED_NOISE_MODEL]
+	if model_filename not in _encoded_noise_providers:
+		_encoded_noise_providers[model_filename] = EncodedNoiseProvider(model_filename, np.random)
+	return _encoded_noise_providers[model_filename]
+
+
+class NoiseSampler(object):
+	""" Noise for one training run. Draws from its own seeded RandomState, so runs are reproducible, and generates
+	prefetch_size batches ahead of time in one vectorized call """
+
+	def __init__(self, config, seed=None, prefetch_size=1):
+		self.config = config
+		self.random_state = np.random.RandomState(seed)
+		self.prefetch_size = max(1, prefetch_size)
+		self.buffer = deque()
+		self.encoded_noise = None
+		if config[Conf.NOISE_MODE] == NoiseMode.ENCODING:
+			self.encoded_noise = EncodedNoiseProvider(config[Conf.ENCODED_NOISE_MODEL], self.random_state)
+
+	def next_batch(self):
+		if len(self.buffer) == 0:
+			self.buffer.extend(
+				sample_noise_batches(self.config, self.random_state, self.prefetch_size, self.encoded_noise))
+		return self.buffer.popleft()
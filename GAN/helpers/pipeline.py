@@ -0,0 +1,77 @@
+import sys
+import threading
+import time
+from Queue import Queue
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class StageTimer(object):
+	""" Accumulated wall time per named stage, safe to share between the producer thread and the training loop """
+
+	def __init__(self):
+		self.totals = OrderedDict()
+		self.lock = threading.Lock()
+
+	@contextmanager
+	def stage(self, name):
+		start_time = time.time()
+		try:
+			yield
+		finally:
+			self.add(name, time.time() - start_time)
+
+	def add(self, name, seconds):
+		with self.lock:
+			self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+	def report(self):
+		with self.lock:
+			return "\t".join("%s: %7.4f" % (name, seconds) for name, seconds in self.totals.items())
+
+	def reset(self):
+		with self.lock:
+			self.totals = OrderedDict()
+
+
+_end_of_batches = object()
+
+
+class BatchPipeline(object):
+	""" Iterates over the batches of a generator that runs on a background thread, at most depth batches ahead of the
+	consumer. Time spent waiting for the producer is recorded as the "wait" stage. A depth of 0 runs the generator
+	inline. Exceptions raised by the producer are re-raised in the consumer """
+
+	def __init__(self, batch_generator, depth, timer):
+		self.batch_generator = batch_generator
+		self.depth = depth
+		self.timer = timer
+		if depth > 0:
+			self.queue = Queue(maxsize=depth)
+			self.thread = threading.Thread(target=self.produce)
+			# Never keep the process alive for batches nobody will consume
+			self.thread.daemon = True
+			self.thread.start()
+
+	def produce(self):
+		try:
+			for batch in self.batch_generator:
+				self.queue.put((batch, None))
+		except Exception:
+			self.queue.put((_end_of_batches, sys.exc_info()))
+			return
+		self.queue.put((_end_of_batches, None))
+
+	def __iter__(self):
+		if self.depth <= 0:
+			for batch in self.batch_generator:
+				yield batch
+			return
+		while True:
+			with self.timer.stage("wait"):
+				batch, exc_info = self.queue.get()
+			if batch is _end_of_batches:
+				if exc_info is not None:
+					raise exc_info[0], exc_info[1], exc_info[2]
+				return
+			yield batch
@@ -0,0 +1,46 @@
+import numpy as np
+
+from GAN.helpers.enums import SamplingMode
+
+
+class EpochSampler(object):
+	""" Row indices of every batch of an epoch. The data itself is never reordered, each epoch only draws a new
+	permutation of int indices.
+
+	SHUFFLE visits every example once per epoch in random order. BALANCED draws examples with replacement so every
+	group (e.g. the image a caption belongs to) is equally likely. BUCKETED puts examples with similar bucket keys
+	(e.g. caption lengths) in the same batch and shuffles the order of the batches """
+
+	def __init__(self, nb_examples, batch_size, sampling_mode=SamplingMode.SHUFFLE, groups=None, bucket_keys=None,
+	             random_state=np.random):
+		self.nb_examples = nb_examples
+		self.batch_size = batch_size
+		self.nb_batches = int(nb_examples / batch_size)
+		self.sampling_mode = sampling_mode
+		self.random_state = random_state
+		if sampling_mode == SamplingMode.BALANCED:
+			if groups is None:
+				raise ValueError("Balanced sampling needs a group per example")
+			group_counts = np.bincount(groups)
+			weights = 1.0 / group_counts[groups]
+			self.probabilities = weights / weights.sum()
+		elif sampling_mode == SamplingMode.BUCKETED:
+			if bucket_keys is None:
+				raise ValueError("Bucketed sampling needs a bucket key per example")
+			self.bucket_keys = np.asarray(bucket_keys)
+
+	def epoch_batches(self):
+		""" (nb_batches, batch_size) int array, one row of example indices per batch """
+		nb_samples = self.nb_batches * self.batch_size
+		if self.sampling_mode == SamplingMode.BALANCED:
+			indices = self.random_state.choice(self.nb_examples, nb_samples, p=self.probabilities)
+			return indices.reshape(self.nb_batches, self.batch_size)
+		if self.sampling_mode == SamplingMode.BUCKETED:
+			# The examples left out are drawn at random, so no key range is always dropped. The stable sort of a random
+			# permutation breaks ties inside a key at random, so buckets hold different examples every epoch
+			chosen = self.random_state.permutation(self.nb_examples)[:nb_samples]
+			order = chosen[np.argsort(self.bucket_keys[chosen], kind="mergesort")]
+			batches = order.reshape(self.nb_batches, self.batch_size)
+			return batches[self.random_state.permutation(self.nb_batches)]
+		indices = self.random_state.permutation(self.nb_examples)[:nb_samples]
+		return indices.reshape(self.nb_batches, self.batch_size)
@@ -258,7 +258,7 @@ def oh_evaluate(config, logger):
 
 	index_captions, id_to_word_dict, word_to_id_dict = generate_index_sentences(config,
 	                                                                            cap_data=config[Conf.DATASET_SIZE])
-	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config)
+	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config, config[Conf.EVAL_SPLIT])
 
 	g_model = load_generator(logger)
 	g_model.compile(loss='categorical_crossentropy', optimizer="adam")
@@ -318,7 +318,8 @@ def oh_evaluate(config, logger):
 
 
 def oh_get_training_batch(batch, word_to_id_dict, config):
-	tr_one_hot_caption_batch = to_categorical_lists(batch, word_to_id_dict, config)
-	# return tr_one_hot_caption_batch
-	tr_softmax_caption_batch = onehot_to_softmax(tr_one_hot_caption_batch)
+	if not isinstance(batch, np.ndarray):
+		batch = pad_index_sentences(batch, word_to_id_dict, config)
+	# return to_categorical_lists(batch, word_to_id_dict, config)
+	tr_softmax_caption_batch = index_to_softmax(batch, config[Conf.VOCAB_SIZE])
 	return tr_softmax_caption_batch
@@ -1,14 +1,17 @@
 from GAN.embedding import *
-from GAN.helpers.datagen import generate_index_sentences, generate_input_noise, \
+from GAN.helpers.datagen import generate_index_sentences, \
 	generate_string_sentences, \
-	emb_generate_caption_training_batch, preprocess_sentences
+	emb_fetch_token_matrix, preprocess_sentences, pad_index_sentences, build_image_noise_input
 from GAN.helpers.enums import WordEmbedding, Conf
+from GAN.helpers.noise import NoiseSampler
+from GAN.helpers.pipeline import BatchPipeline, StageTimer
+from GAN.helpers.sampling import EpochSampler
 from GAN.onehot import oh_create_generator, oh_create_discriminator, oh_get_training_batch
 
 import time
 import numpy as np
 
-from data.embeddings.helpers.embeddings_helper import fetch_custom_embeddings
+from data.embeddings.helpers.embeddings_helper import fetch_custom_embeddings, gather_caption_images
 
 
 def generator_containing_discriminator(generator, discriminator):
@@ -31,22 +34,75 @@ def change_learning_rate(discriminator_on_generator):
 	print "Changed optimizer Adam lr=0.1"
 
 
+def generate_training_batches(config, epoch_batches, all_raw_caption_data, caption_encoder, noise_sampler, timer,
+                              all_image_vectors=None, caption_image_index=None):
+	""" Model inputs for every training step of one epoch, one step per row of example indices in epoch_batches: real
+	captions, and for image captions the real images and the image + noise generator inputs. Each step gets separate
+	noise for the fake batch and the generator update """
+	batch_size = config[Conf.BATCH_SIZE]
+	for batch_indices in epoch_batches:
+		batch = {}
+		with timer.stage("captions"):
+			batch["real_captions"] = caption_encoder(all_raw_caption_data[batch_indices])
+		if config[Conf.IMAGE_CAPTION]:
+			with timer.stage("images"):
+				real_image_batch = gather_caption_images(all_image_vectors, caption_image_index, batch_indices)
+				batch["real_images"] = np.reshape(real_image_batch, (batch_size, 1, config[Conf.IMAGE_DIM]))
+			with timer.stage("noise"):
+				batch["generator_input"] = build_image_noise_input(batch["real_images"], noise_sampler.next_batch(), config)
+				batch["gan_input"] = build_image_noise_input(batch["real_images"], noise_sampler.next_batch(), config)
+		else:
+			with timer.stage("noise"):
+				batch["generator_input"] = noise_sampler.next_batch()
+				batch["gan_input"] = noise_sampler.next_batch()
+		if config[Conf.FUSED_DISCRIMINATOR_UPDATE]:
+			with timer.stage("discriminator_inputs"):
+				prepare_fused_discriminator_inputs(batch, config)
+		yield batch
+
+
+def prepare_fused_discriminator_inputs(batch, config):
+	""" Real captions in the first half of a (2 * batch, ...) buffer. The training step writes the generated captions
+	into the second half, so real and fake go through the discriminator as one batch """
+	batch_size = config[Conf.BATCH_SIZE]
+	real_captions = batch["real_captions"]
+	discriminator_captions = np.empty((2 * batch_size,) + real_captions.shape[1:],
+	                                  dtype=np.result_type(real_captions, np.float32))
+	discriminator_captions[:batch_size] = real_captions
+	batch["discriminator_captions"] = discriminator_captions
+	if config[Conf.IMAGE_CAPTION]:
+		batch["discriminator_images"] = np.concatenate((batch["real_images"], batch["real_images"]))
+
+
+def train_discriminator_fused(d_model, batch, fake_generated_caption_batch, labels, config):
+	""" One train_on_batch on real and generated captions together, instead of one call for each """
+	discriminator_captions = batch["discriminator_captions"]
+	discriminator_captions[config[Conf.BATCH_SIZE]:] = fake_generated_caption_batch
+	if config[Conf.IMAGE_CAPTION]:
+		return d_model.train_on_batch([batch["discriminator_images"], discriminator_captions], labels)
+	return d_model.train_on_batch(discriminator_captions, labels)
+
+
 def train(gan_logger, resume_training, config):
 	# if gan_logger.exists:
 		# raw_input("\nModel already trained.\nPress enter to continue.\n")
 	#
 	print "Generating data..."
+	all_image_vectors, caption_image_index = None, None
 	if config[Conf.WORD_EMBEDDING] == WordEmbedding.ONE_HOT:
 		all_raw_caption_data, _, word_to_id_dict = generate_index_sentences(config, cap_data=config[Conf.DATASET_SIZE])
+		all_raw_caption_data = pad_index_sentences(all_raw_caption_data, word_to_id_dict, config)
 	else:
 		# Generate image captions
 		if config[Conf.IMAGE_CAPTION]:
-			# filenames, all_image_vectors, captions = fetch_embeddings()
-			filenames, all_image_vectors, captions = fetch_custom_embeddings(config)
+			# filenames, all_image_vectors, captions, caption_image_index = fetch_embeddings()
+			filenames, all_image_vectors, captions, caption_image_index = fetch_custom_embeddings(config)
 			all_raw_caption_data, word_embedding_dict = preprocess_sentences(config, captions)
 			del captions, filenames
 		else:
 			all_raw_caption_data, word_embedding_dict = generate_string_sentences(config)
+		# Token ids replace the word strings, real caption batches are gathered from embedding_table
+		all_raw_caption_data, embedding_table = emb_fetch_token_matrix(all_raw_caption_data, word_embedding_dict, config)
 
 	print "Compiling gan..."
 	if config[Conf.IMAGE_CAPTION]:
@@ -71,129 +127,86 @@ def train(gan_logger, resume_training, config):
 		print "Resuming training..."
 		g_model = load_generator(gan_logger)
 		d_model = load_discriminator(gan_logger)
-		g_weights = gan_logger.get_generator_weights()
-		d_weights = gan_logger.get_discriminator_weights()
-
-		print "Num g_weights: %s" % len(g_weights)
-		print "Num d_weights: %s" % len(d_weights)
-
-		largest_g_weight = 0
-		largest_g_weight_size = 0
-
-		largest_d_weight = 0
-		largest_d_weight_size = 0
-
-		for i in range(len(g_weights)):
-			g_weight = g_weights[i]
-			d_weight = d_weights[i]
-			g_w_number = int(g_weight.split("-")[1])
-			d_w_number = int(d_weight.split("-")[1])
-			if g_w_number > largest_g_weight_size:
-				largest_g_weight_size = g_w_number
-				largest_g_weight = g_weight
-			if d_w_number > largest_d_weight_size:
-				largest_d_weight_size = d_w_number
-				largest_d_weight = d_weight
-
-		g_model.load_weights(
-			"GAN/GAN_log/%s/model_files/stored_weights/%s" % (gan_logger.name_prefix, largest_g_weight))
-		d_model.load_weights(
-			"GAN/GAN_log/%s/model_files/stored_weights/%s" % (gan_logger.name_prefix, largest_d_weight))
+		checkpoints = gan_logger.get_complete_checkpoints()
+		checkpoint = checkpoints[-1]
+		print "Num checkpoints: %s" % len(checkpoints)
+
+		g_model.load_weights(gan_logger.get_weight_path(checkpoint["files"]["generator"]))
+		d_model.load_weights(gan_logger.get_weight_path(checkpoint["files"]["discriminator"]))
 		g_model.compile(loss="binary_crossentropy", optimizer="adam", metrics=['accuracy'])
 		d_model.compile(loss='binary_crossentropy', optimizer='sgd', metrics=['accuracy'])
 		gan_model = generator_containing_discriminator(g_model, d_model)
-		start_epoch = largest_g_weight_size
+		start_epoch = checkpoint["epoch"]
 		print "Starting training on epoch %s" % start_epoch
 	else:
 		gan_logger.save_model(g_model, "generator")
 		gan_logger.save_model(d_model, "discriminator")
 
-	total_training_data = len(all_raw_caption_data)
-	nb_batches = int(total_training_data / config[Conf.BATCH_SIZE])
+	noise_sampler = NoiseSampler(config, config[Conf.NOISE_SEED], config[Conf.NOISE_PREFETCH])
+	if config[Conf.WORD_EMBEDDING] == WordEmbedding.ONE_HOT:
+		caption_encoder = lambda caption_batch: oh_get_training_batch(caption_batch, word_to_id_dict, config)
+		pad_id = word_to_id_dict['<pad>']
+	else:
+		caption_encoder = lambda caption_batch: embedding_table[caption_batch]
+		pad_id = 0
+	# Captions and images stay in place, every epoch only permutes the example indices
+	epoch_sampler = EpochSampler(len(all_raw_caption_data), config[Conf.BATCH_SIZE], config[Conf.SAMPLING_MODE],
+	                             groups=caption_image_index,
+	                             bucket_keys=(np.asarray(all_raw_caption_data) != pad_id).sum(axis=1))
+
+	# training_batch_y_zeros = np.random.uniform(0.0, 0.3, config[Conf.BATCH_SIZE])
+	# training_batch_y_ones = np.random.uniform(0.7, 1.2, config[Conf.BATCH_SIZE])
+	training_batch_y_zeros = np.zeros(config[Conf.BATCH_SIZE])
+	training_batch_y_ones = np.ones(config[Conf.BATCH_SIZE])
+	fused_batch_y = np.concatenate((training_batch_y_ones, training_batch_y_zeros))
+
+	checkpoint_manager = gan_logger.create_checkpoint_manager(config)
+	timer = StageTimer()
+	nb_batches = epoch_sampler.nb_batches
 	print("Number of batches: %s" % nb_batches)
 	for epoch_cnt in range(start_epoch, config[Conf.EPOCHS], 1):
 		start_time_epoch = time.time()
 		print("Epoch: %s\t%s" % (epoch_cnt, gan_logger.name_prefix))
 
-		# Shuffle data
-		if config[Conf.IMAGE_CAPTION]:
-			shuffle_indices = np.arange(all_raw_caption_data.shape[0])
-			np.random.shuffle(shuffle_indices)
-			all_raw_caption_data = all_raw_caption_data[shuffle_indices]
-			all_image_vectors = all_image_vectors[shuffle_indices]
-		else:
-			np.random.shuffle(all_raw_caption_data)
-
-		for batch_counter in range(nb_batches):
+		# Batches are prepared on a background thread while the models train on the previous ones
+		training_batches = BatchPipeline(
+			generate_training_batches(config, epoch_sampler.epoch_batches(), all_raw_caption_data, caption_encoder,
+			                          noise_sampler, timer, all_image_vectors, caption_image_index),
+			config[Conf.PIPELINE_DEPTH], timer)
+		for batch_counter, batch in enumerate(training_batches):
 			# if batch_counter % 10 == 0:
 			# 	print_progress(batch_counter, nb_batches, prefix="Training batches")
-			raw_caption_training_batch = all_raw_caption_data[batch_counter * config[Conf.BATCH_SIZE]:(batch_counter + 1) * config[Conf.BATCH_SIZE]]
-
-			if config[Conf.IMAGE_CAPTION]:
-				real_image_batch = np.asarray(all_image_vectors[
-				                              batch_counter * config[Conf.BATCH_SIZE]:(batch_counter + 1) * config[
-					                              Conf.BATCH_SIZE]])
-				# noise_image_training_batch = generate_image_with_noise_training_batch(real_image_batch, config)
-
-			if config[Conf.WORD_EMBEDDING] == WordEmbedding.ONE_HOT:
-				real_caption_batch = oh_get_training_batch(raw_caption_training_batch, word_to_id_dict, config)
-			else:
-				real_caption_batch = emb_generate_caption_training_batch(raw_caption_training_batch, word_embedding_dict, config)
-
-			if config[Conf.IMAGE_CAPTION]:
-				# fake_generated_caption_batch = g_model.predict([real_image_batch, noise_image_training_batch])
-				noise_image_training_batch = generate_input_noise(config)
-				A = np.repeat(noise_image_training_batch, config[Conf.MAX_SEQ_LENGTH] - 1, axis=0)
-				B = np.reshape(A, (config[Conf.BATCH_SIZE], config[Conf.MAX_SEQ_LENGTH] - 1, 50))
-				C = np.reshape(real_image_batch, (config[Conf.BATCH_SIZE], 1, config[Conf.IMAGE_DIM]))
-				D = np.append(C, B, axis=1)
-				fake_generated_caption_batch = g_model.predict(D)
-			else:
-				noise_batch = generate_input_noise(config)
-				fake_generated_caption_batch = g_model.predict(noise_batch)
-
-			# training_batch_y_zeros = np.random.uniform(0.0, 0.3, config[Conf.BATCH_SIZE])
-			# training_batch_y_ones = np.random.uniform(0.7, 1.2, config[Conf.BATCH_SIZE])
-
-			training_batch_y_zeros = np.zeros(config[Conf.BATCH_SIZE])
-			training_batch_y_ones = np.ones(config[Conf.BATCH_SIZE])
+			with timer.stage("predict"):
+				fake_generated_caption_batch = g_model.predict(batch["generator_input"])
 
 			# Train discriminator
+			with timer.stage("train_discriminator"):
+				d_model.trainable = True
+				if config[Conf.FUSED_DISCRIMINATOR_UPDATE]:
+					# Loss and accuracy of the combined batch stand in for both the real and the generated part
+					d_loss_train, d_acc_train = train_discriminator_fused(d_model, batch, fake_generated_caption_batch,
+					                                                      fused_batch_y, config)
+					d_loss_gen, d_acc_gen = d_loss_train, d_acc_train
+				elif config[Conf.IMAGE_CAPTION]:
+					# fake_images = np.random.uniform(real_image_batch.min(), real_image_batch.max(),
+					#                                 size=real_image_batch.shape)
+					# d_loss_fake_img, d_acc_fake_img = d_model.train_on_batch([fake_images, real_caption_batch], training_batch_y_zeros)
+					d_loss_train, d_acc_train = d_model.train_on_batch([batch["real_images"], batch["real_captions"]],
+					                                                   training_batch_y_ones)
+					d_loss_gen, d_acc_gen = d_model.train_on_batch([batch["real_images"], fake_generated_caption_batch],
+					                                               training_batch_y_zeros)
+				else:
+					d_loss_train, d_acc_train = d_model.train_on_batch(batch["real_captions"], training_batch_y_ones)
+					d_loss_gen, d_acc_gen = d_model.train_on_batch(fake_generated_caption_batch, training_batch_y_zeros)
+				d_model.trainable = False
 
-			# start_time_d = time.time()
-			d_model.trainable = True
-			if config[Conf.IMAGE_CAPTION]:
-				# fake_images = np.random.uniform(real_image_batch.min(), real_image_batch.max(),
-				#                                 size=real_image_batch.shape)
-				# d_loss_fake_img, d_acc_fake_img = d_model.train_on_batch([fake_images, real_caption_batch], training_batch_y_zeros)
-
-				# d_loss_train, d_acc_train = d_model.train_on_batch([real_caption_batch], training_batch_y_ones)
-				# d_loss_gen, d_acc_gen = d_model.train_on_batch([fake_generated_caption_batch], training_batch_y_zeros)
-
-
-				reshape_image = np.reshape(real_image_batch, (config[Conf.BATCH_SIZE], 1, config[Conf.IMAGE_DIM]))
-				d_loss_train, d_acc_train = d_model.train_on_batch([reshape_image, real_caption_batch], training_batch_y_ones)
-				d_loss_gen, d_acc_gen = d_model.train_on_batch([reshape_image, fake_generated_caption_batch], training_batch_y_zeros)
-			else:
-				d_loss_train, d_acc_train = d_model.train_on_batch(real_caption_batch, training_batch_y_ones)
-				d_loss_gen, d_acc_gen = d_model.train_on_batch(fake_generated_caption_batch, training_batch_y_zeros)
-			d_model.trainable = False
-			# print("Discriminator --- %s\tseconds ---" % (time.time() - start_time_d))
-
-			noise_batch = generate_input_noise(config)
-			# start_time_g = time.time()
 			# Train generator
-			if config[Conf.IMAGE_CAPTION]:
-				noise_image_training_batch = generate_input_noise(config)
-				A = np.repeat(noise_image_training_batch, config[Conf.MAX_SEQ_LENGTH] - 1, axis=0)
-				B = np.reshape(A, (config[Conf.BATCH_SIZE], config[Conf.MAX_SEQ_LENGTH] - 1, 50))
-				C = np.reshape(real_image_batch, (config[Conf.BATCH_SIZE], 1, config[Conf.IMAGE_DIM]))
-				D = np.append(C, B, axis=1)
-				# g_loss, g_acc = gan_model.train_on_batch(D, training_batch_y_ones)
-				g_loss, g_acc = gan_model.train_on_batch([C, D], training_batch_y_ones)
-			else:
-				g_loss, g_acc = gan_model.train_on_batch(noise_batch, training_batch_y_ones)
-			# print("Generator --- %s\tseconds ---" % (time.time() - start_time_g))
+			with timer.stage("train_generator"):
+				if config[Conf.IMAGE_CAPTION]:
+					g_loss, g_acc = gan_model.train_on_batch([batch["real_images"], batch["gan_input"]],
+					                                         training_batch_y_ones)
+				else:
+					g_loss, g_acc = gan_model.train_on_batch(batch["gan_input"], training_batch_y_ones)
 			if batch_counter % int(nb_batches / 1) == 0:
 				print("d_loss_train:\t\t%f d_acc_train:\t\t%f" % (d_loss_train, d_acc_train))
 				# if config[Conf.IMAGE_CAPTION]:
@@ -205,14 +218,19 @@ def train(gan_logger, resume_training, config):
 				# 	gan_logger.save_loss_acc_fake(g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train, epoch_cnt, batch_counter, d_loss_fake_img, d_acc_fake_img)
 				gan_logger.save_loss_acc(g_loss, g_acc, d_loss_gen, d_acc_gen, d_loss_train, d_acc_train, epoch_cnt,
 				                         batch_counter)
-		# if (epoch_cnt < 1000 and epoch_cnt % 100 == 0) or (epoch_cnt < 10000 and epoch_cnt % 1000 == 0) or epoch_cnt % 5000 == 0:
-		if epoch_cnt < 10 or (epoch_cnt < 100 and epoch_cnt % 10 == 0) or epoch_cnt % 100 == 0:
-			gan_logger.save_model_weights(g_model, epoch_cnt, "generator")
-			gan_logger.save_model_weights(d_model, epoch_cnt, "discriminator")
+		# Weights are copied here and written to disk in the background
+		epoch_metrics = {"g_loss": g_loss, "g_acc": g_acc, "d_loss_gen": d_loss_gen, "d_acc_gen": d_acc_gen,
+		                 "d_loss_train": d_loss_train, "d_acc_train": d_acc_train}
+		checkpoint_manager.maybe_save(epoch_cnt, {"generator": g_model, "discriminator": d_model},
+		                              dict((key, float(value)) for key, value in epoch_metrics.items()))
+		gan_logger.flush_metrics()
 		print("--- %7.4f seconds ---" % (time.time() - start_time_epoch))
+		print("--- %s ---" % timer.report())
+		timer.reset()
 
-	gan_logger.save_model_weights(g_model, epoch_cnt, "generator")
-	gan_logger.save_model_weights(d_model, epoch_cnt, "discriminator")
+	checkpoint_manager.save(epoch_cnt, {"generator": g_model, "discriminator": d_model},
+	                        dict((key, float(value)) for key, value in epoch_metrics.items()))
+	checkpoint_manager.wait()
 	print "#" * 50
 	print "\tFinished with last epoch"
 	print "#" * 50
@@ -1,18 +1,19 @@
-from data.database.helpers.image_database_helper import fetch_all_image_vector_pairs
+from data.database.helpers.image_database_helper import fetch_image_vector_matrix
 from sklearn.decomposition import PCA
-import numpy as np
+
+import settings
 
 from data.database.helpers.pca_database_helper import store_pca_vector_to_db
 from helpers.list_helpers import print_progress
 
 
 def convert_and_store():
-	all_image_imgvec_pairs = fetch_all_image_vector_pairs()
-	image_filenames = [x[0] for x in all_image_imgvec_pairs]
-	image_vectors = np.asarray([x[1] for x in all_image_imgvec_pairs])
+	image_store = fetch_image_vector_matrix()
+	if image_store is None:
+		raise IOError("No image vectors in %s, store them with preprocess_dataset.run_inception first" %
+		              settings.DB_FILE_PATH)
+	image_filenames, image_vectors = image_store
 	image_count = len(image_filenames)
-	del x
-	del all_image_imgvec_pairs
 	pca = PCA(n_components=50)
 	pca_vectors = pca.fit_transform(image_vectors)
 	for i in range(image_count):
@@ -33,6 +33,10 @@ def fetch_filename_caption_tuple(caption_vector):
 	return db_wrapper.db_get_filename_caption_tuple_from_caption_vector(caption_vector)
 
 
+def fetch_filename_caption_tuples(caption_vectors):
+	return db_wrapper.db_get_filename_caption_tuples_from_caption_vectors(caption_vectors)
+
+
 def fetch_caption_count():
 	return db_wrapper.db_get_caption_table_size()
 
@@ -53,6 +57,18 @@ def fetch_all_caption_text_tuples():
 	return db_wrapper.db_all_caption_text_tuples()
 
 
+def iter_all_caption_text_tuples(arraysize=1000):
+	for rows in db_wrapper.db_iter_caption_text_tuples(arraysize):
+		for row in rows:
+			yield row
+
+
+def iter_all_caption_rows(arraysize=1000):
+	for rows in db_wrapper.db_iter_caption_rows(arraysize):
+		for row in rows:
+			yield row
+
+
 def store_caption_text_to_db():
 	text_file_path = "/Users/markus/workspace/master/Master/data/datasets/Flickr8k.txt"
 	text_file = open(text_file_path)
@@ -1,6 +1,8 @@
 
 import sqlite_wrapper as db_wrapper
-from data.database.helpers.caption_database_helper import fetch_all_caption_text_tuples
+from itertools import islice
+
+from data.database.helpers.caption_database_helper import iter_all_caption_text_tuples, fetch_caption_count
 from data.database.helpers.word_database_helper import fetch_all_word_vectors
 from helpers.io_helper import save_pickle_file, load_pickle_file
 from helpers.list_helpers import print_progress, insert_and_remove_last
@@ -35,6 +37,10 @@ def fetch_filename_class_tuple(class_vector):
 	return db_wrapper.db_get_filename_class_tuple_from_class_vector(class_vector)
 
 
+def fetch_filename_class_tuples(class_vectors):
+	return db_wrapper.db_get_filename_class_tuples_from_class_vectors(class_vectors)
+
+
 def fetch_class_count():
 	return db_wrapper.db_get_class_table_size()
 
@@ -116,11 +122,11 @@ def gen_class_embs():
 	print "Generating classes"
 	common_words = load_pickle_file("common_words.p")
 	print "Loading captions..."
-	filename_caption_text_tuples = fetch_all_caption_text_tuples()[:5000]
+	filename_caption_text_tuples = islice(iter_all_caption_text_tuples(), 5000)
 	print "Loading word embeddings..."
 	word_embedding_dict = dict(fetch_all_word_vectors())
 	filname_text_vector_tuples = []
-	tot = len(filename_caption_text_tuples)
+	tot = min(5000, fetch_caption_count())
 	counter = 1
 	print_progress(counter, tot, prefix="Converting classes to embs")
 	for filename, caption in filename_caption_text_tuples:
@@ -29,13 +29,35 @@ def fetch_image_vector(image_name):
 
 
 def fetch_all_image_vector_pairs():
-	return wrapper.db_all_filename_img_vec_pairs()
+	store = wrapper.db_vector_store("images")
+	if store is None:
+		return wrapper.db_all_filename_img_vec_pairs()
+	image_names, image_vectors = store
+	return zip(image_names.tolist(), image_vectors)
+
+
+def fetch_image_vector_matrix():
+	return wrapper.db_vector_store("images")
+
+
+def iter_all_image_vector_pairs(arraysize=1000):
+	for rows in wrapper.db_iter_filename_img_vec_pairs(arraysize):
+		for row in rows:
+			yield row
+
+
+def iter_image_vector_blocks(arraysize=1000):
+	return wrapper.db_iter_vector_blocks("images", arraysize)
 
 
 def fetch_filename_from_image_vector(image_vector):
 	return wrapper.db_get_filename_from_image_vector(image_vector)
 
 
+def fetch_filenames_from_image_vectors(image_vectors):
+	return [x[0] if x is not None else None for x in wrapper.db_get_filenames_from_image_vectors(image_vectors)]
+
+
 def update_image_vectors(filename_image_vector_tuples):
 	return wrapper.db_insert_image_vector_list(filename_image_vector_tuples)
 
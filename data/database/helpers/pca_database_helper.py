@@ -19,12 +19,34 @@ def fetch_pca_vector(image_name):
 
 
 def fetch_all_pca_vector_pairs():
-	return wrapper.db_all_filename_pca_vec_pairs()
+	store = wrapper.db_vector_store("pca")
+	if store is None:
+		return wrapper.db_all_filename_pca_vec_pairs()
+	image_names, pca_vectors = store
+	return zip(image_names.tolist(), pca_vectors)
+
+
+def fetch_pca_vector_matrix():
+	return wrapper.db_vector_store("pca")
+
+
+def iter_all_pca_vector_pairs(arraysize=1000):
+	for rows in wrapper.db_iter_filename_pca_vec_pairs(arraysize):
+		for row in rows:
+			yield row
+
+
+def iter_pca_vector_blocks(arraysize=1000):
+	return wrapper.db_iter_vector_blocks("pca", arraysize)
 
 
 def fetch_filename_from_pca_vector(pca_vector):
 	return wrapper.db_get_filename_from_pca_vector(pca_vector)
 
 
+def fetch_filenames_from_pca_vectors(pca_vectors):
+	return [x[0] if x is not None else None for x in wrapper.db_get_filenames_from_pca_vectors(pca_vectors)]
+
+
 def update_pca_vectors(filename_pca_vector_tuples):
 	return wrapper.db_insert_pca_vector_list(filename_pca_vector_tuples)
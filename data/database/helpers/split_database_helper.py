@@ -0,0 +1,58 @@
+import hashlib
+
+import sqlite_wrapper as wrapper
+from GAN.helpers.enums import Conf
+
+SPLITS = ["train", "val", "test"]
+
+
+def get_split_manifest_name(source, config):
+	ratios = "-".join(str(ratio) for ratio in config[Conf.SPLIT_RATIOS])
+	return "%s-seed%s-%s" % (source, config[Conf.SPLIT_SEED], ratios)
+
+
+def assign_split(key, seed, ratios):
+	""" Deterministic split of a key. It only depends on the key, seed and ratios, so adding data never moves
+	existing keys to another split """
+	text = "%s:%s" % (seed, key)
+	if isinstance(text, unicode):
+		text = text.encode("utf-8")
+	position = int(hashlib.sha1(text).hexdigest()[:8], 16) / float(0x100000000)
+	total = float(sum(ratios))
+	boundary = 0.0
+	for split, ratio in zip(SPLITS, ratios):
+		boundary += ratio / total
+		if position < boundary:
+			return split
+	return SPLITS[len(ratios) - 1]
+
+
+def fetch_split_manifest(source, keys, config):
+	""" {key: split} for every key, storing assignments for keys the manifest has not seen before """
+	manifest = get_split_manifest_name(source, config)
+	assignments = dict(wrapper.db_split_assignments(manifest))
+	missing_keys = set(keys).difference(assignments)
+	if len(missing_keys) > 0:
+		new_assignments = [(key, assign_split(key, config[Conf.SPLIT_SEED], config[Conf.SPLIT_RATIOS])) for key in
+		                   sorted(missing_keys)]
+		wrapper.db_insert_split_assignments(manifest, new_assignments)
+		assignments.update(new_assignments)
+	return assignments
+
+
+def fetch_split_keys(source, config, split):
+	return [x[0] for x in wrapper.db_split_keys(get_split_manifest_name(source, config), split)]
+
+
+def filter_split(source, items, config, split, key=lambda item: item):
+	""" The items whose key is assigned to split, in their original order. A split of None keeps every item """
+	if split is None:
+		return items
+	assignments = fetch_split_manifest(source, set(key(item) for item in items), config)
+	return [item for item in items if assignments[key(item)] == split]
+
+
+def update_image_split_manifest(config):
+	""" Assigns every image in the database to a split and returns the manifest name used by the SQL joins """
+	fetch_split_manifest("images", [x[0] for x in wrapper.db_keys_images()], config)
+	return get_split_manifest_name("images", config)
@@ -1,5 +1,10 @@
+import hashlib
 import io
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
 import numpy as np
 
@@ -19,55 +24,266 @@ def convert_array(text):
 	return np.load(out)
 
 
-db = sqlite3.connect(settings.DB_FILE_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
-print "connecting to %s" % settings.DB_FILE_PATH
-# TODO str Not working in python 2, unicode does
-# db.text_factory = lambda x: unicode(x, "utf-8", "ignore")
+""" SCHEMA MIGRATIONS """
+
+# Secondary indexes for the per-filename and per-class lookups
+INDEXES = [
+	("captions_filename_index", "captions", "filename"),
+	("classes_filename_index", "classes", "filename"),
+	("classes_class_text_index", "classes", "class_text"),
+]
+
+# Vector columns that are looked up by value. Each has a <column>_hash column holding vector_hash of the vector, kept
+# up to date by the insert and update helpers, with an index for the vector -> row lookups
+VECTOR_COLUMNS = {
+	"images": "image_vector",
+	"pca": "pca_vector",
+	"captions": "caption_vector",
+	"classes": "class_vector",
+}
+
+VECTOR_HASH_INDEXES = [("%s_hash_index" % column, table, "%s_hash" % column) for table, column in
+                       sorted(VECTOR_COLUMNS.items())]
+
+
+def migration_create_tables(cursor):
+	cursor.execute('''CREATE TABLE IF NOT EXISTS images (filename TEXT UNIQUE, image_vector array)''')
+	cursor.execute('''CREATE TABLE IF NOT EXISTS pca (filename TEXT UNIQUE, pca_vector array)''')
+	cursor.execute('''CREATE TABLE IF NOT EXISTS captions (filename TEXT, caption_text TEXT, caption_vector array)''')
+	cursor.execute('''CREATE TABLE IF NOT EXISTS words (word_text TEXT UNIQUE, word_vector array)''')
+	cursor.execute('''CREATE TABLE IF NOT EXISTS classes (filename TEXT, class_text TEXT, class_vector array)''')
+	cursor.execute(
+		'''CREATE TABLE IF NOT EXISTS vector_offsets (table_name TEXT, key TEXT, row INTEGER, UNIQUE(table_name, key))''')
+
+
+def create_indexes(cursor, indexes):
+	for index_name, table, column in indexes:
+		cursor.execute("""CREATE INDEX IF NOT EXISTS %s ON %s (%s)""" % (index_name, table, column))
+
+
+def migration_create_indexes(cursor):
+	create_indexes(cursor, INDEXES)
+
+
+def migration_create_splits(cursor):
+	cursor.execute('''CREATE TABLE IF NOT EXISTS splits (manifest TEXT, key TEXT, split TEXT, UNIQUE(manifest, key))''')
+	cursor.execute("""CREATE INDEX IF NOT EXISTS splits_manifest_split_index ON splits (manifest, split)""")
+
+
+def migration_add_vector_hashes(cursor):
+	""" Hash column per vector column, filled in for the rows already in the database """
+	for table, column in sorted(VECTOR_COLUMNS.items()):
+		cursor.execute("""ALTER TABLE %s ADD COLUMN %s_hash BLOB""" % (table, column))
+		rows = cursor.connection.cursor().execute(
+			"""SELECT rowid, %s FROM %s WHERE %s IS NOT NULL""" % (column, table, column))
+		hashes = [(vector_hash(vector), rowid) for rowid, vector in rows]
+		cursor.executemany("""UPDATE %s SET %s_hash = ? WHERE rowid = ?""" % (table, column), hashes)
+	create_indexes(cursor, VECTOR_HASH_INDEXES)
+
+
+def migration_create_vector_store_versions(cursor):
+	""" Change counter per vector store table, raised by triggers on every write to the table. A vector store records
+	the counter it was built at, so any insert, update or delete afterwards marks it stale """
+	cursor.execute('''CREATE TABLE IF NOT EXISTS vector_store_versions
+		(table_name TEXT UNIQUE, version INTEGER, built_version INTEGER)''')
+	for table in sorted(VECTOR_STORE_TABLES):
+		cursor.execute("""INSERT OR IGNORE INTO vector_store_versions VALUES (?, 0, NULL)""", (table,))
+		for event in ["INSERT", "UPDATE", "DELETE"]:
+			cursor.execute("""CREATE TRIGGER IF NOT EXISTS %s_%s_version AFTER %s ON %s BEGIN
+				UPDATE vector_store_versions SET version = version + 1 WHERE table_name = '%s'; END""" % (
+				table, event.lower(), event, table, table))
+
+
+# The schema version is stored in PRAGMA user_version. Databases created before versioning report 0 and are upgraded
+# in place by running every migration after their current version. Only ever append to this list.
+MIGRATIONS = [
+	migration_create_tables,
+	migration_create_indexes,
+	migration_create_splits,
+	migration_add_vector_hashes,
+	migration_create_vector_store_versions,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def db_schema_version(connection):
+	return connection.execute("""PRAGMA user_version""").fetchone()[0]
+
+
+def db_migrate(connection):
+	version = db_schema_version(connection)
+	cursor = connection.cursor()
+	for migration_index in range(version, SCHEMA_VERSION):
+		MIGRATIONS[migration_index](cursor)
+		cursor.execute("""PRAGMA user_version = %d""" % (migration_index + 1))
+		connection.commit()
+	if version < SCHEMA_VERSION:
+		print("Upgraded schema from version %s to %s" % (version, SCHEMA_VERSION))
+
+
+def db_migrate_file(path):
+	connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+	print("Migrating %s" % path)
+	db_migrate(connection)
+	connection.close()
+
 
 sqlite3.register_adapter(np.ndarray, adapt_array)
 sqlite3.register_converter("array", convert_array)
 
-c = db.cursor()
-c.execute('''CREATE TABLE IF NOT EXISTS images (filename TEXT UNIQUE, image_vector array)''')
-c.execute('''CREATE TABLE IF NOT EXISTS pca (filename TEXT UNIQUE, pca_vector array)''')
-c.execute('''CREATE TABLE IF NOT EXISTS captions (filename TEXT, caption_text TEXT, caption_vector array)''')
-c.execute('''CREATE TABLE IF NOT EXISTS words (word_text TEXT UNIQUE, word_vector array)''')
-c.execute('''CREATE TABLE IF NOT EXISTS classes (filename TEXT, class_text TEXT, class_vector array)''')
-db.commit()
+""" CONNECTIONS """
+
+# Connections are opened lazily on first use and pooled per (process, thread, database path), so importing this module
+# does no I/O, threads never share a connection and forked pool workers open their own instead of reusing the parent's.
+_connections = {}
+_connections_lock = threading.Lock()
+_migrated_paths = set()
+_read_only = False
+
+
+def open_connection(path, read_only=False):
+	connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+	print("Connected to %s" % path)
+	# TODO str Not working in python 2, unicode does
+	# connection.text_factory = lambda x: unicode(x, "utf-8", "ignore")
+	if path not in _migrated_paths and not read_only:
+		db_migrate(connection)
+		_migrated_paths.add(path)
+	if read_only:
+		connection.execute("""PRAGMA query_only = ON""")
+	return connection
+
+
+def get_db():
+	key = (os.getpid(), threading.current_thread().ident, settings.DB_FILE_PATH)
+	connection = _connections.get(key)
+	if connection is None:
+		connection = open_connection(settings.DB_FILE_PATH, _read_only)
+		with _connections_lock:
+			_connections[key] = connection
+	return connection
+
+
+def close_connections():
+	""" Closes every pooled connection owned by this process """
+	pid = os.getpid()
+	with _connections_lock:
+		for key in [k for k in _connections if k[0] == pid]:
+			_connections.pop(key).close()
+
+
+def init_worker_connections():
+	""" Pool initializer: drop connections inherited from the parent and only open read-only ones in the worker """
+	global _read_only
+	_read_only = True
+	with _connections_lock:
+		_connections.clear()
 
 
 def update_database_connection(word_embedding, image_embedding):
-	global db
+	close_connections()
 	settings.DB_SUFFIX = "%s-%s-%s" % (image_embedding, word_embedding, settings.DATASET)
 	settings.DB_FILE_PATH = settings.ROOT_DIR + "/data/databases/sqlite/data-%s.db" % settings.DB_SUFFIX
-	db = sqlite3.connect(settings.DB_FILE_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
 	settings.STORED_EMBEDDINGS_NAME = "%s-%s" % (settings.DB_SUFFIX, settings.NEG_TAG)
 	settings.IMAGE_EMBEDDING_DIMENSIONS = 4096 if image_embedding == "vgg" else 2048
-	print("Connected to %s" % settings.DB_FILE_PATH)
+
+
+""" BULK INGEST """
+
+_bulk_ingest_state = threading.local()
+
+
+def db_commit(cursor=None):
+	""" Commits outside bulk_ingest. Inside it, the rows written by the cursor's last statement are added to the
+	block's row count instead """
+	if not getattr(_bulk_ingest_state, "active", False):
+		get_db().commit()
+	elif cursor is not None:
+		_bulk_ingest_state.rows += max(cursor.rowcount, 0)
+
+
+def db_create_indexes():
+	db = get_db()
+	create_indexes(db.cursor(), INDEXES + VECTOR_HASH_INDEXES)
+	db.commit()
+
+
+def db_drop_indexes():
+	db = get_db()
+	cursor = get_db().cursor()
+	for index_name, _, _ in INDEXES + VECTOR_HASH_INDEXES:
+		cursor.execute("""DROP INDEX IF EXISTS %s""" % index_name)
+	db.commit()
+
+
+@contextmanager
+def bulk_ingest(name="Bulk ingest", synchronous_off=True):
+	""" Runs every insert in the block as one transaction with WAL, then rebuilds the indexes. synchronous=OFF is only
+	for short blocks that are cheap to run again, since a crash during one can corrupt the database. Long blocks keep
+	the synchronous setting and commit their progress with db_bulk_commit """
+	if getattr(_bulk_ingest_state, "active", False):
+		yield
+		return
+
+	db = get_db()
+	db.commit()
+	cursor = get_db().cursor()
+	journal_mode = cursor.execute("""PRAGMA journal_mode""").fetchone()[0]
+	synchronous = cursor.execute("""PRAGMA synchronous""").fetchone()[0]
+	if synchronous_off:
+		cursor.execute("""PRAGMA synchronous=OFF""")
+	cursor.execute("""PRAGMA journal_mode=WAL""").fetchone()
+	db_drop_indexes()
+
+	start_time = time.time()
+	_bulk_ingest_state.active = True
+	_bulk_ingest_state.rows = 0
+	try:
+		yield
+		db.commit()
+	except:
+		db.rollback()
+		raise
+	finally:
+		_bulk_ingest_state.active = False
+		db_create_indexes()
+		cursor.execute("""PRAGMA journal_mode=%s""" % journal_mode).fetchone()
+		cursor.execute("""PRAGMA synchronous=%s""" % synchronous)
+
+	# Counted from the insert helpers, db.total_changes also counts the rows written by triggers
+	rows = _bulk_ingest_state.rows
+	seconds = max(time.time() - start_time, 1e-6)
+	print("%s: %s rows in %.2f seconds (%.0f rows/sec)" % (name, rows, seconds, rows / seconds))
+
+
+def db_bulk_commit():
+	""" Commits the rows inserted so far, also inside bulk_ingest, so a crash only loses the rows since this call """
+	get_db().commit()
 
 
 """ TABLE: WORDS """
 
 
 def db_insert_word_vector(word_text, word_vector):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	cursor.execute("""INSERT INTO words VALUES(?, ?)""", (word_text, word_vector))
-	db.commit()
+	db_commit(cursor)
 
 
 def db_insert_word_vector_list(tuple_list):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	cursor.executemany("""INSERT INTO words VALUES (?, ?)""", tuple_list)
-	db.commit()
+	db_commit(cursor)
 
 
 def db_fetch_all_word_vectors():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT word_text, word_vector FROM words""").fetchall()
 
 
 def db_fetch_word_vector(word, default=None):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT word_vector FROM words WHERE word_text = ?""", (word,)).fetchone()
 	if result is None:
 		return default
@@ -78,12 +294,12 @@ def db_fetch_word_vector(word, default=None):
 
 
 def db_keys_images():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename FROM images""").fetchall()
 
 
 def db_get_image_vector(filename, default=None):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT image_vector FROM images WHERE filename = ?""", (filename,)).fetchone()
 	if result is None:
 		return default
@@ -91,39 +307,43 @@ def db_get_image_vector(filename, default=None):
 
 
 def db_all_filename_img_vec_pairs():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, image_vector FROM images""").fetchall()
 
 
 def db_update_filename_img_vec_pairs():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, image_vector FROM images""").fetchall()
 
 
 def db_insert_image_vector(filename, image_vector):
-	cursor = db.cursor()
-	cursor.execute("""INSERT INTO images VALUES (?,?)""", (filename, image_vector))
-	db.commit()
+	cursor = get_db().cursor()
+	cursor.execute("""INSERT INTO images (filename, image_vector, image_vector_hash) VALUES (?,?,?)""",
+	               (filename, image_vector, vector_hash(image_vector)))
+	db_commit(cursor)
 
 
 def db_get_filename_from_image_vector(image_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT filename FROM images WHERE image_vector = ?""",
-	                        (image_vector,)).fetchone()
-	return result
+	return db_fetchone_by_vector("images", "filename", image_vector)
+
+
+def db_get_filenames_from_image_vectors(image_vectors):
+	return db_fetch_first_by_vectors("images", "filename", image_vectors)
 
 
 def db_insert_image_vector_list(tuple_list):
-	cursor = db.cursor()
-	cursor.executemany("""UPDATE images SET image_vector = ? WHERE filename = ?""", tuple_list)
-	db.commit()
+	cursor = get_db().cursor()
+	cursor.executemany("""UPDATE images SET image_vector = ?, image_vector_hash = ? WHERE filename = ?""",
+	                   [(vector, vector_hash(vector), filename) for vector, filename in tuple_list])
+	db_commit(cursor)
+	db_drop_vector_store("images")
 
 
 """ TABLE: PCA VECTORS """
 
 
 def db_get_pca_vector(filename, default=None):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT pca_vector FROM pca WHERE filename = ?""", (filename,)).fetchone()
 	if result is None:
 		return default
@@ -131,119 +351,122 @@ def db_get_pca_vector(filename, default=None):
 
 
 def db_all_filename_pca_vec_pairs():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, pca_vector FROM pca""").fetchall()
 
 
 def db_update_filename_pca_vec_pairs():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, pca_vector FROM pca""").fetchall()
 
 
 def db_insert_pca_vector(filename, image_vector):
-	cursor = db.cursor()
-	cursor.execute("""INSERT INTO pca VALUES (?,?)""", (filename, image_vector))
-	db.commit()
+	cursor = get_db().cursor()
+	cursor.execute("""INSERT INTO pca (filename, pca_vector, pca_vector_hash) VALUES (?,?,?)""",
+	               (filename, image_vector, vector_hash(image_vector)))
+	db_commit(cursor)
 
 
 def db_get_filename_from_pca_vector(image_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT filename FROM pca WHERE pca_vector = ?""",
-	                        (image_vector,)).fetchone()
-	return result
+	return db_fetchone_by_vector("pca", "filename", image_vector)
+
+
+def db_get_filenames_from_pca_vectors(pca_vectors):
+	return db_fetch_first_by_vectors("pca", "filename", pca_vectors)
 
 
 def db_insert_pca_vector_list(tuple_list):
-	cursor = db.cursor()
-	cursor.executemany("""UPDATE pca SET pca_vector = ? WHERE filename = ?""", tuple_list)
-	db.commit()
+	cursor = get_db().cursor()
+	cursor.executemany("""UPDATE pca SET pca_vector = ?, pca_vector_hash = ? WHERE filename = ?""",
+	                   [(vector, vector_hash(vector), filename) for vector, filename in tuple_list])
+	db_commit(cursor)
+	db_drop_vector_store("pca")
 
 
 """ TABLE: CAPTIONS """
 
 
 def db_keys_captions():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename FROM captions""").fetchall()
 
 
 def db_all_caption_text_tuples():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, caption_text FROM captions""").fetchall()
 
 
 def db_caption_text_tuples(filename):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, caption_text FROM captions WHERE filename = ?""", (filename,)).fetchall()
 
 
 def db_all_filename_caption_vector_tuple():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, caption_vector FROM captions""").fetchall()
 
 
 def db_all_caption_rows():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, caption_vector, caption_text FROM captions""").fetchall()
 
 
 def db_get_caption_vectors(filename):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT caption_vector FROM captions WHERE filename = ?""", (filename,)).fetchall()
 	return result
 
 
 def db_get_caption_texts(filename):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT caption_text FROM captions WHERE filename = ?""", (filename,)).fetchall()
 	return result
 
 
 def db_fetch_all_caption_vectors():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT caption_vector FROM captions""").fetchall()
 	return result
 
 
 def db_insert_caption_vector(filename, caption_text, caption_vector):
 	try:
-		cursor = db.cursor()
-		cursor.execute("""INSERT INTO captions VALUES (?,?,?)""", (filename, caption_text, caption_vector))
-		db.commit()
+		cursor = get_db().cursor()
+		cursor.execute(
+			"""INSERT INTO captions (filename, caption_text, caption_vector, caption_vector_hash) VALUES (?,?,?,?)""",
+			(filename, caption_text, caption_vector, vector_hash(caption_vector)))
+		db_commit(cursor)
 	except sqlite3.ProgrammingError as e:
 		print(filename, caption_text)
 		print(e)
 
 
 def db_insert_caption_vector_list(tuple_list):
-	cursor = db.cursor()
-	cursor.executemany("""INSERT INTO captions VALUES (?,?,?)""", tuple_list)
-	db.commit()
+	cursor = get_db().cursor()
+	cursor.executemany(
+		"""INSERT INTO captions (filename, caption_text, caption_vector, caption_vector_hash) VALUES (?,?,?,?)""",
+		[(filename, text, vector, vector_hash(vector)) for filename, text, vector in tuple_list])
+	db_commit(cursor)
 
 
 def db_get_caption_text(caption_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT caption_text FROM captions WHERE caption_vector = ?""",
-	                        (caption_vector,)).fetchone()
-	return result
+	return db_fetchone_by_vector("captions", "caption_text", caption_vector)
 
 
 def db_get_filenames_from_caption_vector(caption_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT filename FROM captions WHERE caption_vector = ?""",
-	                        (caption_vector,)).fetchall()
-	return result
+	return db_fetchall_by_vector("captions", "filename", caption_vector)
 
 
 def db_get_filename_caption_tuple_from_caption_vector(caption_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT filename,caption_text FROM captions WHERE caption_vector = ?""",
-	                        (caption_vector,)).fetchone()
-	return result
+	return db_fetchone_by_vector("captions", "filename, caption_text", caption_vector)
+
+
+def db_get_filename_caption_tuples_from_caption_vectors(caption_vectors):
+	return db_fetch_first_by_vectors("captions", "filename, caption_text", caption_vectors)
 
 
 def db_get_caption_table_size():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT COUNT(*) FROM captions""").fetchone()[0]
 	return result
 
@@ -252,81 +475,356 @@ def db_get_caption_table_size():
 
 
 def db_keys_classes():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename FROM classes""").fetchall()
 
 
 def db_filenames_by_class(class_string):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, class_text FROM classes WHERE class_text = ?""", (class_string, )).fetchall()
 
 
 def db_all_filename_class_vector_tuple():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, class_vector FROM classes""").fetchall()
 
 
 def db_all_class_rows():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	return cursor.execute("""SELECT filename, class_vector, class_text FROM classes""").fetchall()
 
 
 def db_get_class_vectors(filename):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT class_vector FROM classes WHERE filename = ?""", (filename,)).fetchall()
 	return result
 
 
 def db_get_class_texts(filename):
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT class_text FROM classes WHERE filename = ?""", (filename,)).fetchall()
 	return result
 
 
 def db_fetch_all_class_vectors():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT class_vector FROM classes""").fetchall()
 	return result
 
 
 def db_insert_class_vector(filename, class_text, class_vector):
 	try:
-		cursor = db.cursor()
-		cursor.execute("""INSERT INTO classes VALUES (?,?,?)""", (filename, class_text, class_vector))
-		db.commit()
+		cursor = get_db().cursor()
+		cursor.execute(
+			"""INSERT INTO classes (filename, class_text, class_vector, class_vector_hash) VALUES (?,?,?,?)""",
+			(filename, class_text, class_vector, vector_hash(class_vector)))
+		db_commit(cursor)
 	except sqlite3.ProgrammingError as e:
 		print(filename, class_text)
 		print(e)
 
 
 def db_insert_class_vector_list(tuple_list):
-	cursor = db.cursor()
-	cursor.executemany("""INSERT INTO classes VALUES (?,?,?)""", tuple_list)
-	db.commit()
+	cursor = get_db().cursor()
+	cursor.executemany(
+		"""INSERT INTO classes (filename, class_text, class_vector, class_vector_hash) VALUES (?,?,?,?)""",
+		[(filename, text, vector, vector_hash(vector)) for filename, text, vector in tuple_list])
+	db_commit(cursor)
 
 
 def db_get_class_text(class_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT class_text FROM classes WHERE class_vector = ?""",
-	                        (class_vector,)).fetchone()
-	return result
+	return db_fetchone_by_vector("classes", "class_text", class_vector)
 
 
 def db_get_filenames_from_class_vector(class_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT filename FROM classes WHERE class_vector = ?""",
-	                        (class_vector,)).fetchall()
-	return result
+	return db_fetchall_by_vector("classes", "filename", class_vector)
 
 
 def db_get_filename_class_tuple_from_class_vector(class_vector):
-	cursor = db.cursor()
-	result = cursor.execute("""SELECT filename,class_text FROM classes WHERE class_vector = ?""",
-	                        (class_vector,)).fetchone()
-	return result
+	return db_fetchone_by_vector("classes", "filename, class_text", class_vector)
+
+
+def db_get_filename_class_tuples_from_class_vectors(class_vectors):
+	return db_fetch_first_by_vectors("classes", "filename, class_text", class_vectors)
 
 
 def db_get_class_table_size():
-	cursor = db.cursor()
+	cursor = get_db().cursor()
 	result = cursor.execute("""SELECT COUNT(*) FROM classes""").fetchone()[0]
 	return result
+
+
+""" VECTOR STORE """
+
+# Read-optimized copy of the vector columns: one contiguous float32 .npy matrix per table next to the database file,
+# opened with np.memmap. SQLite only keeps key -> row offset in vector_offsets. The BLOB columns stay the source of
+# truth, so the store is rebuilt with db_build_vector_store whenever it is missing or stale. A store is stale once the
+# change counter of its table in vector_store_versions has moved past the counter it was built at.
+VECTOR_STORE_TABLES = {
+	"images": ("filename", "image_vector"),
+	"pca": ("filename", "pca_vector"),
+	"words": ("word_text", "word_vector"),
+}
+
+
+def vector_store_path(table):
+	return "%s-%s.npy" % (os.path.splitext(settings.DB_FILE_PATH)[0], table)
+
+
+def db_vector_store_version(table):
+	""" (version, built_version) of a vector store table """
+	cursor = get_db().cursor()
+	return cursor.execute("""SELECT version, built_version FROM vector_store_versions WHERE table_name = ?""",
+	                      (table,)).fetchone()
+
+
+def db_dataset_stamp():
+	""" Change stamp of the tables the stored datasets are built from: the change counters of images and pca, and the
+	row count and last rowid of captions, classes and splits, which have no counter """
+	cursor = get_db().cursor()
+	stamp = dict(cursor.execute("""SELECT table_name, version FROM vector_store_versions
+		WHERE table_name IN ('images', 'pca')""").fetchall())
+	for table in ["captions", "classes", "splits"]:
+		stamp[table] = list(cursor.execute("""SELECT COUNT(*), MAX(rowid) FROM %s""" % table).fetchone())
+	return stamp
+
+
+def db_build_vector_store(table):
+	key_column, vector_column = VECTOR_STORE_TABLES[table]
+	cursor = get_db().cursor()
+	# Read before the rows, so a write during the build leaves the store stale instead of marking it current
+	version, _ = db_vector_store_version(table)
+	row_count = cursor.execute("""SELECT COUNT(*) FROM %s WHERE %s IS NOT NULL""" % (table, vector_column)).fetchone()[0]
+	if row_count == 0:
+		return 0
+	first_vector = cursor.execute(
+		"""SELECT %s FROM %s WHERE %s IS NOT NULL LIMIT 1""" % (vector_column, table, vector_column)).fetchone()[0]
+
+	path = vector_store_path(table)
+	tmp_path = path + ".tmp.npy"
+	matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(row_count, len(first_vector)))
+	offsets = []
+	rows = cursor.execute("""SELECT %s, %s FROM %s WHERE %s IS NOT NULL""" % (key_column, vector_column, table, vector_column))
+	for row_index, (key, vector) in enumerate(rows):
+		matrix[row_index] = vector
+		offsets.append((table, key, row_index))
+	matrix.flush()
+	del matrix
+	os.rename(tmp_path, path)
+
+	cursor.execute("""DELETE FROM vector_offsets WHERE table_name = ?""", (table,))
+	cursor.executemany("""INSERT INTO vector_offsets VALUES (?,?,?)""", offsets)
+	cursor.execute("""UPDATE vector_store_versions SET built_version = ? WHERE table_name = ?""", (version, table))
+	get_db().commit()
+	return row_count
+
+
+def db_drop_vector_store(table):
+	path = vector_store_path(table)
+	if os.path.isfile(path):
+		os.remove(path)
+	cursor = get_db().cursor()
+	cursor.execute("""DELETE FROM vector_offsets WHERE table_name = ?""", (table,))
+	cursor.execute("""UPDATE vector_store_versions SET built_version = NULL WHERE table_name = ?""", (table,))
+	get_db().commit()
+
+
+def db_load_vector_store(table):
+	""" Returns (keys, matrix) with matrix as a read-only memmap, or None if the store is missing or stale """
+	path = vector_store_path(table)
+	if not os.path.isfile(path):
+		return None
+	version, built_version = db_vector_store_version(table)
+	if built_version != version:
+		return None
+	cursor = get_db().cursor()
+	keys = cursor.execute("""SELECT key FROM vector_offsets WHERE table_name = ? ORDER BY row""", (table,)).fetchall()
+	matrix = np.load(path, mmap_mode="r")
+	if matrix.shape[0] != len(keys):
+		return None
+	return np.asarray([x[0] for x in keys]), matrix
+
+
+def db_vector_store(table):
+	store = db_load_vector_store(table)
+	if store is None:
+		print("Building vector store for table %s..." % table)
+		db_build_vector_store(table)
+		store = db_load_vector_store(table)
+	return store
+
+
+def db_get_vector_store_row(table, key):
+	cursor = get_db().cursor()
+	result = cursor.execute("""SELECT row FROM vector_offsets WHERE table_name = ? AND key = ?""", (table, key)).fetchone()
+	if result is None:
+		return None
+	return result[0]
+
+
+""" VECTOR LOOKUP """
+
+# Reverse lookups (vector -> row) used to compare serialized BLOBs with a full table scan. Instead they look up the
+# hash of the vector in the indexed <column>_hash column of the table. Vectors are hashed as float32 so BLOB-loaded and
+# vector store rows resolve to the same key.
+
+
+# Hashes per IN query, below SQLITE_MAX_VARIABLE_NUMBER (999 by default)
+VECTOR_LOOKUP_CHUNK_SIZE = 900
+
+
+def vector_bytes(vector):
+	return np.ascontiguousarray(vector, dtype=np.float32).tostring()
+
+
+def vector_hash(vector):
+	""" sha1 of the float32 bytes of a vector as an SQLite BLOB, None for a missing vector """
+	if vector is None:
+		return None
+	return sqlite3.Binary(hashlib.sha1(vector_bytes(vector)).digest())
+
+
+def db_fetchall_by_vector(table, columns, vector):
+	cursor = get_db().cursor()
+	query = """SELECT %s FROM %s WHERE %s_hash = ? ORDER BY rowid""" % (columns, table, VECTOR_COLUMNS[table])
+	return cursor.execute(query, (vector_hash(vector),)).fetchall()
+
+
+def db_fetchone_by_vector(table, columns, vector):
+	cursor = get_db().cursor()
+	query = """SELECT %s FROM %s WHERE %s_hash = ? ORDER BY rowid LIMIT 1""" % (columns, table, VECTOR_COLUMNS[table])
+	return cursor.execute(query, (vector_hash(vector),)).fetchone()
+
+
+def db_fetch_first_by_vectors(table, columns, vectors):
+	""" The first matching row of every vector, None where there is no match. The hashes are looked up in chunks with
+	IN queries, and the stored vectors are compared as well, so a hash collision is never returned as a match """
+	cursor = get_db().cursor()
+	column = VECTOR_COLUMNS[table]
+	keys = [vector_bytes(vector) if vector is not None else None for vector in vectors]
+	unique_keys = sorted(set(key for key in keys if key is not None))
+	first_rows = {}
+	for start in range(0, len(unique_keys), VECTOR_LOOKUP_CHUNK_SIZE):
+		chunk_keys = set(unique_keys[start:start + VECTOR_LOOKUP_CHUNK_SIZE])
+		hashes = [sqlite3.Binary(hashlib.sha1(key).digest()) for key in chunk_keys]
+		query = """SELECT %s, %s FROM %s WHERE %s_hash IN (%s) ORDER BY rowid""" % (
+			columns, column, table, column, ",".join("?" * len(hashes)))
+		for row in cursor.execute(query, hashes):
+			if row[-1] is None:
+				continue
+			key = vector_bytes(row[-1])
+			if key in chunk_keys and key not in first_rows:
+				first_rows[key] = row[:-1]
+	return [first_rows.get(key) for key in keys]
+
+
+""" JOINS """
+
+
+def db_class_caption_pca_rows(class_strings, max_caption_words, split_manifest=None, split=None):
+	""" (filename, caption_text, pca row) for every caption of an image in one of the classes, with at most
+	max_caption_words words. The pca row indexes the pca vector store, which must be up to date. With a split
+	manifest only images assigned to split are returned. """
+	cursor = get_db().cursor()
+	split_join = ""
+	split_parameters = []
+	if split_manifest is not None:
+		split_join = """JOIN splits ON splits.manifest = ? AND splits.key = captions.filename AND splits.split = ?"""
+		split_parameters = [split_manifest, split]
+	query = """SELECT captions.filename, captions.caption_text, vector_offsets.row FROM captions
+		JOIN (SELECT DISTINCT filename FROM classes WHERE class_text IN (%s)) AS selected
+			ON selected.filename = captions.filename
+		JOIN vector_offsets ON vector_offsets.table_name = 'pca' AND vector_offsets.key = captions.filename
+		%s
+		WHERE length(captions.caption_text) - length(replace(captions.caption_text, ' ', '')) + 1 <= ?
+		ORDER BY captions.filename, captions.rowid""" % (",".join("?" * len(class_strings)), split_join)
+	return cursor.execute(query, list(class_strings) + split_parameters + [max_caption_words]).fetchall()
+
+
+""" SPLITS """
+
+# Train/val/test assignments, one row per (manifest, key). A manifest names the source and the split parameters, so
+# several splittings of the same data can live side by side in the database.
+
+
+def db_insert_split_assignments(manifest, tuple_list):
+	cursor = get_db().cursor()
+	cursor.executemany("""INSERT OR IGNORE INTO splits (manifest, key, split) VALUES (?,?,?)""",
+	                   [(manifest, key, split) for (key, split) in tuple_list])
+	db_commit(cursor)
+
+
+def db_split_assignments(manifest):
+	cursor = get_db().cursor()
+	return cursor.execute("""SELECT key, split FROM splits WHERE manifest = ?""", (manifest,)).fetchall()
+
+
+def db_split_keys(manifest, split):
+	cursor = get_db().cursor()
+	return cursor.execute("""SELECT key FROM splits WHERE manifest = ? AND split = ? ORDER BY key""",
+	                      (manifest, split)).fetchall()
+
+
+def db_drop_split_manifest(manifest):
+	cursor = get_db().cursor()
+	cursor.execute("""DELETE FROM splits WHERE manifest = ?""", (manifest,))
+	db_commit(cursor)
+
+
+""" STREAMING """
+
+# Generator counterparts of the fetchall() accessors. Each yields lists of at most arraysize rows, so whole-table reads
+# keep only one chunk of decoded rows in memory at a time.
+
+
+def db_iter_query(query, parameters=(), arraysize=1000):
+	cursor = get_db().cursor()
+	cursor.arraysize = arraysize
+	cursor.execute(query, parameters)
+	while True:
+		rows = cursor.fetchmany()
+		if not rows:
+			break
+		yield rows
+
+
+def db_iter_word_vectors(arraysize=1000):
+	return db_iter_query("""SELECT word_text, word_vector FROM words""", arraysize=arraysize)
+
+
+def db_iter_filename_img_vec_pairs(arraysize=1000):
+	return db_iter_query("""SELECT filename, image_vector FROM images""", arraysize=arraysize)
+
+
+def db_iter_filename_pca_vec_pairs(arraysize=1000):
+	return db_iter_query("""SELECT filename, pca_vector FROM pca""", arraysize=arraysize)
+
+
+def db_iter_caption_text_tuples(arraysize=1000):
+	return db_iter_query("""SELECT filename, caption_text FROM captions""", arraysize=arraysize)
+
+
+def db_iter_caption_rows(arraysize=1000):
+	return db_iter_query("""SELECT filename, caption_vector, caption_text FROM captions""", arraysize=arraysize)
+
+
+def db_iter_caption_vectors(arraysize=1000):
+	return db_iter_query("""SELECT caption_vector FROM captions""", arraysize=arraysize)
+
+
+def db_iter_class_rows(arraysize=1000):
+	return db_iter_query("""SELECT filename, class_vector, class_text FROM classes""", arraysize=arraysize)
+
+
+def db_iter_vector_blocks(table, arraysize=1000):
+	""" Yields (keys, float32 matrix) blocks of at most arraysize rows for one of the VECTOR_STORE_TABLES """
+	key_column, vector_column = VECTOR_STORE_TABLES[table]
+	query = """SELECT %s, %s FROM %s WHERE %s IS NOT NULL""" % (key_column, vector_column, table, vector_column)
+	for rows in db_iter_query(query, arraysize=arraysize):
+		yield np.asarray([x[0] for x in rows]), np.asarray([x[1] for x in rows], dtype=np.float32)
+
+if __name__ == "__main__":
+	import glob
+
+	for database_path in glob.glob(settings.ROOT_DIR + "data/databases/sqlite/data-*.db"):
+		db_migrate_file(database_path)
@@ -2,7 +2,21 @@ import sqlite_wrapper as db_wrapper
 
 
 def fetch_all_word_vectors():
-	return db_wrapper.db_fetch_all_word_vectors()
+	store = db_wrapper.db_vector_store("words")
+	if store is None:
+		return db_wrapper.db_fetch_all_word_vectors()
+	words, word_vectors = store
+	return zip(words.tolist(), word_vectors)
+
+
+def fetch_word_vector_matrix():
+	return db_wrapper.db_vector_store("words")
+
+
+def iter_all_word_vectors(arraysize=1000):
+	for rows in db_wrapper.db_iter_word_vectors(arraysize):
+		for row in rows:
+			yield row
 
 
 def fetch_word_vector(word, default_return=None):
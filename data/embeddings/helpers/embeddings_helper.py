@@ -1,109 +1,94 @@
 # encoding=utf8
+import hashlib
+import json
+
+from GAN.config import config as default_config
 from GAN.helpers.enums import Conf
 from data.database.helpers.caption_database_helper import *
 from data.database.helpers.image_database_helper import *
-from data.database.helpers.pca_database_helper import fetch_all_pca_vector_pairs, fetch_pca_vector
-from data.database.helpers.sqlite_wrapper import db_all_filename_class_vector_tuple
+from data.database.helpers.pca_database_helper import iter_all_pca_vector_pairs, fetch_pca_vector_matrix
+from data.database.helpers.split_database_helper import filter_split, update_image_split_manifest
+from data.database.helpers.sqlite_wrapper import db_all_filename_class_vector_tuple, db_class_caption_pca_rows, \
+	db_dataset_stamp
 from helpers.io_helper import *
 
 
-def fetch_embeddings(size=-1):
-	if embedding_exists(size):
-		return load_embeddings(size)
+def fetch_embeddings(size=-1, config=None, split=None):
+	""" The first size images and their captions. With a split only the images of that split are kept, split with the
+	settings of GAN/config.py when no config is given """
+	if config is None:
+		config = default_config
+	cache_key = get_embeddings_cache_key("all" if size == -1 else size, {
+		"size": size,
+		"split": get_split_parameters(config, split),
+	})
+	database_stamp = get_database_stamp(config, split)
+	if embedding_exists(cache_key, database_stamp):
+		return load_embeddings(cache_key)
 	else:
 		print("Generating compatible dataset...")
-		all_image_names, image_name_caption_dict = create_dictionaries(size)
-		image_names, image_data, image_captions = get_examples(all_image_names, image_name_caption_dict)
-
-		dataset = [image_names, np.asarray(image_data), image_captions]
+		all_image_names, image_name_caption_dict = create_dictionaries(size, config, split)
+		dataset = get_examples(all_image_names, image_name_caption_dict)
+		image_captions = dataset[2]
 		print("Finished generating %s training example" % len(image_captions))
-		save_embeddings(dataset, size)
+		save_embeddings(dataset, cache_key, database_stamp)
 
 		return dataset
 
 
-def fetch_custom_embeddings(config):
-	print("Generating compatible dataset...")
-	# all_image_names, filename_caption_dict = create_dictionaries(size)
-	# image_names, image_data, image_captions = get_examples(all_image_names, filename_caption_dict)
-	filename_class_dict, filename_caption_dict, filename_pca_dict = create_custom_dictionaries(config)
-	image_names, image_data, image_captions = get_custom_examples(filename_class_dict, filename_caption_dict, filename_pca_dict)
+def fetch_custom_embeddings(config, split=None):
+	""" Image caption dataset of config[Conf.IMAGE_CLASSES], restricted to split (config[Conf.TRAIN_SPLIT] by default) """
+	if split is None:
+		split = config[Conf.TRAIN_SPLIT]
+	cache_key = get_embeddings_cache_key("custom", {
+		"classes": config[Conf.IMAGE_CLASSES],
+		"max_caption_length": config[Conf.MAX_CAPTION_LENGTH],
+		"split": get_split_parameters(config, split),
+	})
+	database_stamp = get_database_stamp(config, split)
+	if embedding_exists(cache_key, database_stamp):
+		return load_embeddings(cache_key)
 
-	dataset = [image_names, np.asarray(image_data), image_captions]
+	print("Generating compatible dataset...")
+	dataset = create_custom_examples(config, split)
+	image_captions = dataset[2]
 	print("Finished generating %s training example" % len(image_captions))
-	save_embeddings(dataset, 0)
+	save_embeddings(dataset, cache_key, database_stamp)
 
 	return dataset
 
 
-def create_custom_dictionaries(config):
-	image_name_class_tuple_58 = fetch_all_image_names_with_class(class_string='00058')
-	image_name_class_tuple_65 = fetch_all_image_names_with_class(class_string='00065')
-	image_name_class_tuple_25 = fetch_all_image_names_with_class(class_string='00025')
-	# if len(image_name_class_tuple_58) > len(image_name_class_tuple_65):
-	# 	image_name_class_tuple_58 = image_name_class_tuple_58[:len(image_name_class_tuple_65)]
-	# else:
-	# 	image_name_class_tuple_65 = image_name_class_tuple_65[:len(image_name_class_tuple_58)]
+def create_custom_examples(config, split=None):
+	pca_store = fetch_pca_vector_matrix()
+	if pca_store is None:
+		raise IOError('No PCA vectors in databases')
+	pca_names, pca_matrix = pca_store
 
-	all_image_name_class_tuples = image_name_class_tuple_58 + image_name_class_tuple_65 + image_name_class_tuple_25
-	# all_image_name_class_tuples = db_all_filename_class_vector_tuple()
+	split_manifest = None
+	if split is not None:
+		split_manifest = update_image_split_manifest(config)
+	rows = db_class_caption_pca_rows(config[Conf.IMAGE_CLASSES], config[Conf.MAX_CAPTION_LENGTH], split_manifest, split)
+	pca_rows = np.asarray([x[2] for x in rows], dtype=np.int64)
+	# Each image is stored once, captions point at their image through caption_image_index
+	unique_pca_rows, caption_image_index = np.unique(pca_rows, return_inverse=True)
+	validate_database(len(unique_pca_rows))
 
-	num_images = len(all_image_name_class_tuples)
-	filename_class_dict = dict(all_image_name_class_tuples)
+	image_names = pca_names[unique_pca_rows]
+	image_data = np.asarray(pca_matrix[unique_pca_rows], dtype=np.float32)
+	image_captions = [x[1] for x in rows]
+	return image_names, image_data, image_captions, caption_image_index.astype(np.int32)
 
-	validate_database(num_images)
 
-	filename_caption_dict = dict()
-	name_cap_tuples = fetch_all_caption_text_tuples()
-
-	filename_pca_dict = dict()
-	name_pca_tuples = fetch_all_pca_vector_pairs()
-
-	# filename_58 = image_name_class_tuple_58[0][0]
-	# filename_65 = image_name_class_tuple_65[0][0]
-
-	# pca_58 = fetch_pca_vector(filename_58)
-	# pca_65 = fetch_pca_vector(filename_65)
-	filenames = [x[0] for x in all_image_name_class_tuples]
-	# config[Conf.LOGGER].write_to_comments_file("Red PCA %s" % pca_58)
-	# config[Conf.LOGGER].write_to_comments_file("Yellow PCA %s" % pca_65)
-	for (name, caption) in name_cap_tuples:
-		if name in filenames:
-			cap_length = len(caption.split(" "))
-			if cap_length > 10:
-				continue
-			if name in filename_caption_dict:
-				filename_caption_dict[name].append(caption)
-			else:
-				filename_caption_dict[name] = [caption]
-
-	for (name, pca) in name_pca_tuples:
-		if name in filenames:
-			# if filename_class_dict[name] == '00058':
-			# 	pca = pca_58
-			# 	# pca = np.zeros(config[Conf.IMAGE_DIM])
-			# 	# pca = np.random.uniform(size=config[Conf.IMAGE_DIM]).astype(dtype="float32")
-			# else:
-			# 	pca = pca_65
-				# pca = np.ones(config[Conf.IMAGE_DIM])
-				# pca = np.random.uniform(size=config[Conf.IMAGE_DIM]).astype(dtype="float32")
-			if name in filename_pca_dict:
-				filename_pca_dict[name].append(pca)
-			else:
-				filename_pca_dict[name] = [pca]
-	return filename_class_dict, filename_caption_dict, filename_pca_dict
-
-
-def create_dictionaries(size):
+def create_dictionaries(size, config=None, split=None):
 	if size > 0:
 		all_image_names = fetch_all_image_names()[:size]
 	else:
 		all_image_names = fetch_all_image_names()
+	all_image_names = filter_split("images", all_image_names, config, split)
 	num_images = len(all_image_names)
 	validate_database(num_images)
 	image_name_caption_dict = dict()
-	name_cap_tuples = fetch_all_caption_text_tuples()
-	for (name, caption) in name_cap_tuples:
+	for (name, caption) in iter_all_caption_text_tuples():
 		if name in image_name_caption_dict:
 			image_name_caption_dict[name].append(caption)
 		else:
@@ -119,54 +104,21 @@ def get_similarity_dictionary():
 
 
 def get_examples(all_image_names, image_name_caption_vector_dict):
-	sorted_caption_vector_data = []
-	sorted_image_data = []
-	sorted_image_names = []
-	image_name_pca_vector_dict = {key: value for (key, value) in fetch_all_pca_vector_pairs()}
-	all_image_names_total = len(all_image_names)
-	for i in range(all_image_names_total):
-		image_name = all_image_names[i]
-		pca_vector = image_name_pca_vector_dict[image_name]
-		caption_vectors = image_name_caption_vector_dict[image_name]
+	wanted_image_names = set(all_image_names)
+	image_name_pca_vector_dict = {key: value for (key, value) in iter_all_pca_vector_pairs() if key in wanted_image_names}
+	image_data = np.asarray([image_name_pca_vector_dict[name] for name in all_image_names], dtype=np.float32)
 
-		for caption_vector in caption_vectors:
-			sorted_image_data.append(pca_vector)
-			sorted_image_names.append(image_name)
-			sorted_caption_vector_data.append(caption_vector)
-		print_progress(i + 1, all_image_names_total, prefix='Generating data:', suffix='Complete', barLength=50)
+	caption_lists = [image_name_caption_vector_dict[name] for name in all_image_names]
+	caption_counts = [len(captions) for captions in caption_lists]
+	caption_image_index = np.repeat(np.arange(len(all_image_names), dtype=np.int32), caption_counts)
+	captions = [caption for captions in caption_lists for caption in captions]
 
-	return sorted_image_names, sorted_image_data, sorted_caption_vector_data
+	return all_image_names, image_data, captions, caption_image_index
 
 
-def get_custom_examples(filename_class_dict, filename_caption_dict, filename_pca_dict):
-	sorted_caption_data = []
-	sorted_image_data = []
-	sorted_image_names = []
-	# filename_red = 'image_02644'
-	# filename_yellow = 'image_03230'
-	# pca_red = fetch_pca_vector(filename_red + ".jpg")
-	# pca_yellow = fetch_pca_vector(filename_yellow + ".jpg")
-	all_image_names_total = len(filename_class_dict)
-	filenames = filename_class_dict.keys()
-	for i in range(len(filenames)):
-		image_name = filenames[i]
-		# if filename_class_dict[image_name] == filename_class_dict[filename_red]:
-		# 	pca_vector = copy.deepcopy(pca_red)
-		# elif filename_class_dict[image_name] == filename_class_dict[filename_yellow]:
-		# 	pca_vector = copy.deepcopy(pca_yellow)
-		# else:
-		# 	pca_vector = None
-		pca_vector = filename_pca_dict[image_name][0]
-		if image_name not in filename_caption_dict:
-			continue
-		captions = filename_caption_dict[image_name]
-		for caption in captions:
-			sorted_image_data.append(pca_vector)
-			sorted_image_names.append(image_name)
-			sorted_caption_data.append(caption)
-		print_progress(i + 1, all_image_names_total, prefix='Generating data:', suffix='Complete', barLength=50)
-
-	return sorted_image_names, sorted_image_data, sorted_caption_data
+def gather_caption_images(image_data, caption_image_index, caption_indices):
+	""" Image rows for the given captions, one row per caption """
+	return image_data[caption_image_index[caption_indices]]
 
 
 def get_class_examples(image_name_class_vector_dict):
@@ -187,9 +139,25 @@ def get_class_examples(image_name_class_vector_dict):
 	return sorted_class_vector_data, sorted_image_data
 
 
-def save_embeddings(dataset_to_store, size):
-	filepath = find_stored_embeddings_filepath(size)
-	save_pickle_file(dataset_to_store, filepath)
+# Bump when the layout of the stored datasets changes, so old caches are rebuilt instead of misread
+EMBEDDINGS_CACHE_VERSION = 2
+EMBEDDINGS_CACHE_ARRAYS = ["image_names", "image_data", "image_captions", "caption_image_index"]
+
+
+def save_embeddings(dataset_to_store, cache_key, database_stamp):
+	image_names, image_data, image_captions, caption_image_index = dataset_to_store
+	arrays = {
+		"image_names": np.asarray(image_names),
+		"image_data": np.asarray(image_data, dtype=np.float32),
+		"image_captions": np.asarray(image_captions),
+		"caption_image_index": np.asarray(caption_image_index, dtype=np.int32),
+	}
+	manifest = {
+		"version": EMBEDDINGS_CACHE_VERSION,
+		"database": settings.DB_FILE_PATH,
+		"database_stamp": database_stamp,
+	}
+	save_array_dir(arrays, manifest, find_stored_embeddings_path(cache_key))
 
 
 def save_class_embeddings(dataset_to_store, size):
@@ -197,10 +165,10 @@ def save_class_embeddings(dataset_to_store, size):
 	save_pickle_file(dataset_to_store, filepath)
 
 
-def load_embeddings(size):
-	print("Loading compatible dataset from local storage: %s" % get_stored_embeddings_filename(size))
-	filepath = find_stored_embeddings_filepath(size)
-	return load_pickle_file(filepath)
+def load_embeddings(cache_key):
+	print("Loading compatible dataset from local storage: %s" % cache_key)
+	arrays, _ = load_array_dir(find_stored_embeddings_path(cache_key))
+	return [arrays[name] for name in EMBEDDINGS_CACHE_ARRAYS]
 
 
 def load_class_embeddings(size):
@@ -209,17 +177,39 @@ def load_class_embeddings(size):
 	return load_pickle_file(filepath)
 
 
-def find_stored_embeddings_filepath(size):
-	return settings.STORED_EMBEDDINGS_DIR + get_stored_embeddings_filename(size)
+def find_stored_embeddings_path(cache_key):
+	return settings.STORED_EMBEDDINGS_DIR + cache_key
 
 
 def find_stored_class_embeddings_filepath(size):
 	return settings.STORED_EMBEDDINGS_DIR + get_stored_class_embeddings_filename(size)
 
 
-def embedding_exists(size):
-	filepath = find_stored_embeddings_filepath(size)
-	return check_pickle_file(filepath)
+def embedding_exists(cache_key, database_stamp):
+	manifest = load_array_dir_manifest(find_stored_embeddings_path(cache_key))
+	if manifest is None or manifest["version"] != EMBEDDINGS_CACHE_VERSION:
+		return False
+	return manifest.get("database_stamp") == database_stamp
+
+
+def get_embeddings_cache_key(name, parameters):
+	""" Names a stored dataset by everything it was built from: database, dataset name and filter parameters """
+	key_source = json.dumps([EMBEDDINGS_CACHE_VERSION, settings.DB_FILE_PATH, name, parameters], sort_keys=True)
+	return "%s-%s-%s" % (settings.STORED_EMBEDDINGS_NAME, name, hashlib.sha1(key_source).hexdigest()[:12])
+
+
+def get_split_parameters(config, split):
+	if split is None:
+		return None
+	return {"split": split, "seed": config[Conf.SPLIT_SEED], "ratios": config[Conf.SPLIT_RATIOS]}
+
+
+def get_database_stamp(config, split):
+	""" Taken before a dataset is built, so a write during the build marks it stale. The split manifest is brought up to
+	date first, so storing the assignments of a new split does not """
+	if split is not None:
+		update_image_split_manifest(config)
+	return db_dataset_stamp()
 
 
 def class_embedding_exists(size):
@@ -234,14 +224,6 @@ def validate_database(num_images):
 		raise IOError('No captions in databases')
 
 
-def get_stored_embeddings_filename(size):
-	if size == 0:
-		size = 'custom'
-	elif size == -1:
-		size = "all"
-	return "%s-%s.picklefile" % (settings.STORED_EMBEDDINGS_NAME, size)
-
-
 def get_stored_class_embeddings_filename(size):
 	if size == -1:
 		size = "all"
@@ -249,22 +231,11 @@ def get_stored_class_embeddings_filename(size):
 
 
 if __name__ == "__main__":
-	from image_database_helper import fetch_filename_from_image_vector
-	from caption_database_helper import fetch_filenames_from_cation_vector, fetch_filename_caption_tuple, \
-		fetch_all_filename_caption_vector_tuples
-
-	dataset = fetch_embeddings(5)
-	caption_vectors = dataset[0]
-	img_vecs = dataset[1]
-	sims = dataset[2]
-	print("%s \t %s \t %s \t %s" % (
-		"filename from cap", "filename from img", "similarity",
-		"text caption"))
-	for i in range(len(caption_vectors)):
-		cap_vec = caption_vectors[i]
-		img_vec = img_vecs[i]
-		sim = sims[i]
-
-		print("%s \t %s \t %s \t %s" % (
-			fetch_filenames_from_cation_vector(cap_vec), fetch_filename_from_image_vector(img_vec), sim,
-			fetch_filename_caption_tuple(cap_vec)[1]))
+	from data.database.helpers.pca_database_helper import fetch_filenames_from_pca_vectors
+
+	image_names, pca_vecs, captions, caption_image_index = fetch_embeddings(5)
+	pca_filenames = fetch_filenames_from_pca_vectors(pca_vecs)
+	print("%s \t %s \t %s" % ("filename", "filename from pca", "text caption"))
+	for i in range(len(captions)):
+		image_index = caption_image_index[i]
+		print("%s \t %s \t %s" % (image_names[image_index], pca_filenames[image_index], captions[i]))
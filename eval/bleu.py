@@ -1,3 +1,6 @@
+import math
+from collections import Counter
+
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.translate.bleu_score import SmoothingFunction
@@ -7,15 +10,99 @@ def remove_special(hyp):
 	return hyp.replace("<sos>", "").replace("<eos>", "").replace("<pad>", "").replace("UNK", "").replace("unk", "")
 
 
-def fetch_bleu_score(refs, hyp, return_hyp=False):
-	tokenized_refs = []
-	for ref in refs:
-		tokenized_refs.append(word_tokenize(ref))
-	# clean_hyp = remove_special(hyp)
+class BleuScorer(object):
+	""" nltk 3.2.2's sentence_bleu with its default weights and no smoothing, for many sentences.
+
+	Every sentence is tokenized once and its n-gram counts are kept, so references shared by many hypotheses are only
+	processed once. Scores are memoized per (hypothesis, references), so a sentence generated again by a later
+	checkpoint is not scored again """
+
+	def __init__(self, max_n=4):
+		self.max_n = max_n
+		self.sentence_ngrams = {}
+		self.scores = {}
+
+	def get_ngram_counts(self, sentence):
+		""" (token count, [Counter of the n-grams for n = 1..max_n]) """
+		if sentence not in self.sentence_ngrams:
+			tokens = tuple(word_tokenize(sentence))
+			ngram_counts = [Counter(tokens[i:i + n] for i in range(len(tokens) - n + 1)) for n in
+			                range(1, self.max_n + 1)]
+			self.sentence_ngrams[sentence] = (len(tokens), ngram_counts)
+		return self.sentence_ngrams[sentence]
+
+	def prepare(self, sentences):
+		""" Tokenizes sentences ahead of time, e.g. the reference corpus before worker processes are forked """
+		for sentence in sentences:
+			self.get_ngram_counts(sentence)
+
+	def compute_bleu(self, refs, hyp):
+		hyp_length, hyp_ngram_counts = self.get_ngram_counts(hyp)
+		refs_ngram_data = [self.get_ngram_counts(ref) for ref in refs]
+		log_precisions = []
+		for n in range(self.max_n):
+			hyp_counts = hyp_ngram_counts[n]
+			# Modified precision: hypothesis n-gram counts clipped by their largest count in a single reference
+			numerator = 0
+			for ngram, count in hyp_counts.items():
+				numerator += min(count, max(ref_ngram_counts[n].get(ngram, 0) for _, ref_ngram_counts in refs_ngram_data))
+			denominator = max(1, sum(hyp_counts.values()))
+			if numerator == 0:
+				if n == 0:
+					return 0
+				# nltk 3.2.2's method0 smoothing stops at the first order without matches, so it and the higher
+				# orders are left out of the sum
+				break
+			log_precisions.append((1.0 / self.max_n) * math.log(float(numerator) / denominator))
+
+		closest_ref_length = min((ref_length for ref_length, _ in refs_ngram_data),
+		                         key=lambda ref_length: (abs(ref_length - hyp_length), ref_length))
+		if hyp_length > closest_ref_length:
+			brevity_penalty = 1
+		elif hyp_length == 0:
+			brevity_penalty = 0
+		else:
+			brevity_penalty = math.exp(1 - closest_ref_length / float(hyp_length))
+		return brevity_penalty * math.exp(math.fsum(log_precisions))
+
+	def sentence_bleu(self, refs, hyp):
+		key = (hyp, tuple(refs))
+		if key not in self.scores:
+			self.scores[key] = self.compute_bleu(refs, hyp)
+		return self.scores[key]
 
-	tokenized_hyp = word_tokenize(hyp)
+	def score_batch(self, pairs, use_pool=False, nb_workers=None):
+		""" sentence_bleu for every (refs, hyp) pair. Pairs not scored before run in the evaluation pool when
+		use_pool is set, nb_workers sizes the pool if it is not running yet """
+		keys = [(hyp, tuple(refs)) for refs, hyp in pairs]
+		missing_keys = list(set(key for key in keys if key not in self.scores))
+		if use_pool and len(missing_keys) > 0:
+			from eval.worker_pool import eval_map
+			missing_scores = eval_map(background_bleu, missing_keys, "bleu", (self,), nb_workers, "Running BLEU")
+		else:
+			missing_scores = [self.compute_bleu(refs, hyp) for hyp, refs in missing_keys]
+		self.scores.update(zip(missing_keys, missing_scores))
+		return [self.scores[key] for key in keys]
 
-	bleu = nltk.translate.bleu_score.sentence_bleu(tokenized_refs, tokenized_hyp)
+
+def background_bleu(key):
+	from eval.worker_pool import get_shared_data
+	scorer, = get_shared_data("bleu")
+	hyp, refs = key
+	return scorer.compute_bleu(refs, hyp)
+
+
+_bleu_scorer = BleuScorer()
+
+
+def get_bleu_scorer():
+	""" Scorer shared by the process, so its caches last across evaluations """
+	return _bleu_scorer
+
+
+def fetch_bleu_score(refs, hyp, return_hyp=False):
+	# clean_hyp = remove_special(hyp)
+	bleu = get_bleu_scorer().sentence_bleu(refs, hyp)
 	if return_hyp:
 		return bleu, hyp
 	else:
@@ -1,6 +1,5 @@
 import numpy as np
 from pyemd import emd
-from scipy.spatial.distance import cosine
 from sklearn.feature_extraction import stop_words
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.metrics import euclidean_distances
@@ -8,10 +7,12 @@ from sklearn.metrics import euclidean_distances
 from GAN.config import config
 from GAN.helpers.datagen import generate_string_sentences
 from GAN.helpers.enums import Conf
-from bleu import fetch_bleu_score
+from bleu import get_bleu_scorer
 from eval import tfidf
+from eval.retrieval import CosineRetriever, sentence_vector_matrix
+from eval.wmd import WMDRetriever
+from eval.worker_pool import eval_map, get_shared_data
 from helpers.io_helper import load_pickle_file
-from helpers.list_helpers import insert_and_remove_last, print_progress
 from word2vec.word2vec_helpers import get_dict_filename
 
 """
@@ -21,164 +22,60 @@ Word embedding distance
 """
 
 
-def find_n_most_similar_vectors(pred_vector, vector_list, sentence_list, n=5):
-	first_vector = vector_list[0]
-	first_sentence = sentence_list[0]
-	first_mse = compare_vectors(pred_vector, first_vector)
-
-	best_mse_list = [0 for _ in range(n)]
-	best_sentence_list = ["" for _ in range(n)]
-	best_vector_list = [[] for _ in range(n)]
-
-	best_mse_list = insert_and_remove_last(0, best_mse_list, first_mse)
-	best_vector_list = insert_and_remove_last(0, best_vector_list, first_vector)
-	best_sentence_list = insert_and_remove_last(0, best_sentence_list, first_sentence)
-	for i in range(len(vector_list)):
-		temp_vector = vector_list[i]
-		temp_mse = compare_vectors(pred_vector, temp_vector)
-		for index in range(len(best_vector_list)):
-			if temp_mse < best_mse_list[index]:
-				best_mse_list = insert_and_remove_last(index, best_mse_list, temp_mse)
-				best_vector_list = insert_and_remove_last(index, best_vector_list, temp_vector)
-				best_sentence_list = insert_and_remove_last(index, best_sentence_list, sentence_list[i])
-				break
-	return best_sentence_list
-
-
-def background_find_n_most_similar_vectors(tuple_array):
-	global counter
-
-	pred_vector, vector_list, sentence_list, sentence_count = tuple_array
-
-	n = 5
-	first_vector = vector_list[0]
-	first_sentence = sentence_list[0]
-	first_mse = compare_vectors(pred_vector, first_vector)
-
-	best_mse_list = [0 for _ in range(n)]
-	best_sentence_list = ["" for _ in range(n)]
-	best_vector_list = [[] for _ in range(n)]
-
-	best_mse_list = insert_and_remove_last(0, best_mse_list, first_mse)
-	best_vector_list = insert_and_remove_last(0, best_vector_list, first_vector)
-	best_sentence_list = insert_and_remove_last(0, best_sentence_list, first_sentence)
-	for i in range(len(vector_list)):
-		temp_vector = vector_list[i]
-		temp_mse = compare_vectors(pred_vector, temp_vector)
-		for index in range(len(best_vector_list)):
-			if temp_mse < best_mse_list[index]:
-				best_mse_list = insert_and_remove_last(index, best_mse_list, temp_mse)
-				best_vector_list = insert_and_remove_last(index, best_vector_list, temp_vector)
-				best_sentence_list = insert_and_remove_last(index, best_sentence_list, sentence_list[i])
-				break
-	with counter.get_lock():
-		counter.value += 1
-	print_progress(counter.value, sentence_count, "Running Cosine distance")
-	return [" ".join(x) for x in best_sentence_list]
-
-
-def convert_to_word_embeddings(sentences, word_embedding_dict):
-	embedded_sentences = []
-	for sentence in sentences:
-		embedded_sentence = []
-		words = sentence.split(" ")
-		for word in words:
-			if word in word_embedding_dict:
-				embedded_sentence.append(word_embedding_dict[word])
-			else:
-				embedded_sentence.append(word_embedding_dict['UNK'])
-			# embedded_sentence.append(word_embedding_dict['markus'])
-
-		embedded_sentences.append(embedded_sentence)
-	return embedded_sentences
-
-
-def compare_vectors(v1, v2):
-	return cosine(v1, v2)
-
-
-def convert_vectors(vectors):
-	sum_vector = np.zeros(vectors[0].shape)
-	for word_emb in vectors:
-		sum_vector += word_emb
-	return sum_vector
-
-
-def convert_to_emb_list(dataset_string_list_sentences, word_embedding_dict):
-	dataset_emb_list_sentences = []
-	for sentence in dataset_string_list_sentences:
-		s = []
-		for word in sentence:
-			if word in word_embedding_dict:
-				s.append(word_embedding_dict[word])
-			else:
-				s.append(word_embedding_dict['UNK'])
-			# s.append(word_embedding_dict['markus'])
-		dataset_emb_list_sentences.append(s)
-	return dataset_emb_list_sentences
+# (corpus, embedding dict, retriever) of the most recent reference corpus
+_cosine_retriever = None
+
+
+def get_cosine_retriever(dataset_string_list_sentences, word_embedding_dict):
+	""" Retriever of the reference corpus, reused while the calls pass the same corpus and embedding dict objects.
+	Only the most recent corpus is kept, like get_tfidf_index """
+	global _cosine_retriever
+	if _cosine_retriever is None or _cosine_retriever[0] is not dataset_string_list_sentences or \
+			_cosine_retriever[1] is not word_embedding_dict:
+		_cosine_retriever = None
+		retriever = CosineRetriever(sentence_vector_matrix(dataset_string_list_sentences, word_embedding_dict),
+		                            [" ".join(x) for x in dataset_string_list_sentences])
+		_cosine_retriever = (dataset_string_list_sentences, word_embedding_dict, retriever)
+	return _cosine_retriever[2]
 
 
 def cosine_distance_retrieval(pred_strings, dataset_string_list_sentences, word_embedding_dict):
-	dataset_emb_list_sentences = convert_to_emb_list(dataset_string_list_sentences, word_embedding_dict)
-	dataset_single_vector_sentences = [convert_vectors(sentence) for sentence in dataset_emb_list_sentences]
-	pred_emb_list_sentences = convert_to_word_embeddings(pred_strings, word_embedding_dict)
-	pred_single_vector_sentences = [convert_vectors(sentence) for sentence in pred_emb_list_sentences]
-
-	best_sentence_lists = []
-	tot_count = len(pred_single_vector_sentences)
-	for i in range(tot_count):
-		pred_single_vector_sentence = pred_single_vector_sentences[i]
-		best_sentence_list = find_n_most_similar_vectors(pred_single_vector_sentence, dataset_single_vector_sentences,
-		                                                 dataset_string_list_sentences)
-		best_sentence_lists.append([" ".join(x) for x in best_sentence_list])
-		print_progress(i + 1, tot_count, "Calculating cosine distances")
-	return best_sentence_lists
+	retriever = get_cosine_retriever(dataset_string_list_sentences, word_embedding_dict)
+	pred_vectors = sentence_vector_matrix([x.split(" ") for x in pred_strings], word_embedding_dict)
+	return retriever.query(pred_vectors)
 
 
 def background_cosine_distance_retrieval(pred_strings, dataset_string_list_sentences, word_embedding_dict):
-	dataset_emb_list_sentences = convert_to_emb_list(dataset_string_list_sentences, word_embedding_dict)
-	dataset_single_vector_sentences = [convert_vectors(sentence) for sentence in dataset_emb_list_sentences]
+	print "Running Cosine distance on %s sentences" % len(pred_strings)
+	return cosine_distance_retrieval(pred_strings, dataset_string_list_sentences, word_embedding_dict)
 
-	pred_emb_list_sentences = convert_to_word_embeddings(pred_strings, word_embedding_dict)
-	pred_single_vector_sentences = [convert_vectors(sentence) for sentence in pred_emb_list_sentences]
 
-	counter = Value('i', 0)
-	sentence_count = len(pred_strings)
-	cpu_count = multiprocessing.cpu_count()
-	print "CPUs:", cpu_count
-	if 8 < cpu_count < 15:
-		cpu_count = 10
-	elif cpu_count > 40:
-		cpu_count = 40
-	print "Starting pool with %s processes" % cpu_count
-	pool = Pool(cpu_count, initializer=init, initargs=(counter,))
+"""
 
-	tuple_array = [(pred_single_vector_sentence, dataset_single_vector_sentences, dataset_string_list_sentences, sentence_count) for pred_single_vector_sentence in pred_single_vector_sentences]
-	best_sentence_lists = pool.map(background_find_n_most_similar_vectors, tuple_array, chunksize=1)
-	pool.close()
-	pool.join()
+TF-IDF
 
-	return best_sentence_lists
+"""
 
 
-"""
+# (corpus, index) of the most recent reference corpus
+_tfidf_index = None
 
-TF-IDF
 
-"""
+def get_tfidf_index(dataset_string_list_sentences):
+	""" Index of the reference corpus, reused while the calls pass the same corpus object. Only the most recent corpus
+	is kept, so evaluating another split frees the previous index """
+	global _tfidf_index
+	if _tfidf_index is None or _tfidf_index[0] is not dataset_string_list_sentences:
+		_tfidf_index = None
+		documents = [[str(x) for x in dataset_entry] for dataset_entry in dataset_string_list_sentences]
+		_tfidf_index = (dataset_string_list_sentences, tfidf.TfidfIndex(documents))
+	return _tfidf_index[1]
 
 
 def tfidf_retrieval(pred_strings, dataset_string_list_sentences):
-	table = tfidf.tfidf()
-	for dataset_entry in dataset_string_list_sentences:
-		table_name = " ".join(dataset_entry)
-		table.addDocument(table_name, [str(x) for x in dataset_entry])
-	best_sentence_lists = []
-	for pred_string in pred_strings:
-		similarities = table.similarities(pred_string.split(" "))
-		similarities = sorted(similarities, key=lambda x: x[1], reverse=True)
-		best_sentence_lists.append([x[0] for x in similarities[:5]])
-	return best_sentence_lists
+	index = get_tfidf_index(dataset_string_list_sentences)
+	best_indices = index.top_k([pred_string.split(" ") for pred_string in pred_strings], 5)
+	return [[" ".join(dataset_string_list_sentences[i]) for i in row] for row in best_indices]
 
 
 """
@@ -226,81 +123,47 @@ def get_wmd_distance(d1, d2, word_embedding_dict, min_vocab=7, verbose=False):
 	return emd(v_1, v_2, D_)
 
 
-def wmd_retrieval(pred_strindgs, dataset_string_list_sentences):
-	filename = get_dict_filename(config[Conf.EMBEDDING_SIZE], config[Conf.WORD2VEC_NUM_STEPS],
-	                             config[Conf.VOCAB_SIZE], config[Conf.W2V_SET])
-	word_embedding_dict = load_pickle_file(filename)
-
-	best_sentence_lists = []
+_wmd_embedding_dicts = {}
+# (corpus, embedding dict, retriever) of the most recent reference corpus
+_wmd_retriever = None
 
-	for pred_string in pred_strings:
 
-		score_tuples = []
-		for dataset_string_list_sentence in dataset_string_list_sentences:
-			dataset_string = " ".join(dataset_string_list_sentence)
-			score = get_wmd_distance(pred_string, dataset_string, word_embedding_dict)
-			score_tuples.append((dataset_string, score))
-		score_tuples = sorted(score_tuples, key=lambda x: x[1], reverse=False)
-		result = [x[0] for x in score_tuples[:5]]
+def get_wmd_embedding_dict():
+	""" Loaded once per process, so the pool for it is reused across calls """
+	filename = get_dict_filename(config[Conf.EMBEDDING_SIZE], config[Conf.WORD2VEC_NUM_STEPS], config[Conf.VOCAB_SIZE],
+	                             config[Conf.W2V_SET])
+	if filename not in _wmd_embedding_dicts:
+		_wmd_embedding_dicts[filename] = load_pickle_file(filename)
+	return _wmd_embedding_dicts[filename]
 
-		best_sentence_lists.append(result)
 
-	return best_sentence_lists
+def get_wmd_retriever(dataset_string_list_sentences):
+	""" Retriever of the reference corpus, reused while the calls pass the same corpus object. Only the most recent
+	corpus is kept, like get_tfidf_index """
+	global _wmd_retriever
+	word_embedding_dict = get_wmd_embedding_dict()
+	if _wmd_retriever is None or _wmd_retriever[0] is not dataset_string_list_sentences or \
+			_wmd_retriever[1] is not word_embedding_dict:
+		_wmd_retriever = None
+		dataset_strings = [" ".join(x) for x in dataset_string_list_sentences]
+		_wmd_retriever = (dataset_string_list_sentences, word_embedding_dict,
+		                  WMDRetriever(dataset_strings, word_embedding_dict))
+	return _wmd_retriever[2]
 
 
-from multiprocessing import Pool, Value
-import multiprocessing
+def wmd_retrieval(pred_strings, dataset_string_list_sentences):
+	retriever = get_wmd_retriever(dataset_string_list_sentences)
+	return [retriever.query(pred_string) for pred_string in pred_strings]
 
-counter = None
 
+def background_wmd_retrieval(pred_strings, dataset_string_list_sentences):
+	shared_data = (get_wmd_retriever(dataset_string_list_sentences),)
+	return eval_map(background_wmd, pred_strings, "wmd", shared_data, config[Conf.EVAL_WORKERS], "Running WMD")
 
-def init(args):
-	''' store the counter for later use '''
-	global counter
-	counter = args
 
-
-def background_wmd_retrieval(pred_strings, dataset_string_list_sentences):
-	filename = get_dict_filename(config[Conf.EMBEDDING_SIZE], config[Conf.WORD2VEC_NUM_STEPS], config[Conf.VOCAB_SIZE],
-	                             config[Conf.W2V_SET])
-	word_embedding_dict = load_pickle_file(filename)
-
-	counter = Value('i', 0)
-	sentence_count = len(pred_strings)
-	cpu_count = multiprocessing.cpu_count()
-	print "CPUs:", cpu_count
-	if cpu_count > 8 and cpu_count < 15:
-		cpu_count = 10
-	elif cpu_count > 40:
-		cpu_count = 40
-	print "Starting pool with %s processes" % cpu_count
-	pool = Pool(cpu_count, initializer=init, initargs=(counter,))
-	tuple_array = [(pred_string, dataset_string_list_sentences, word_embedding_dict, sentence_count) for pred_string in
-	               pred_strings]
-	best_sentence_lists = pool.map(background_wmd, tuple_array, chunksize=1)
-	pool.close()
-	pool.join()
-
-	return best_sentence_lists
-
-
-def background_wmd(tuple):
-	global counter
-
-	pred_string, dataset_string_list_sentences, word_embedding_dict, sentence_count = tuple
-	score_tuples = []
-	for dataset_string_list_sentence in dataset_string_list_sentences:
-		dataset_string = " ".join(dataset_string_list_sentence)
-		score = get_wmd_distance(pred_string, dataset_string, word_embedding_dict)
-		score_tuples.append((dataset_string, score))
-	score_tuples = sorted(score_tuples, key=lambda x: x[1], reverse=False)
-	result = [x[0] for x in score_tuples[:5]]
-	with counter.get_lock():
-		counter.value += 1
-
-	print_progress(counter.value, sentence_count, "Running WMD")
-	# print counter.value
-	return result
+def background_wmd(pred_string):
+	retriever, = get_shared_data("wmd")
+	return retriever.query(pred_string)
 
 
 from collections import Counter
@@ -311,7 +174,7 @@ def calculate_bleu_score(sentences, dataset_string_list_sentences=None, word_emb
 	if dataset_string_list_sentences is None or word_embedding_dict is None:
 		if not config[Conf.LIMITED_DATASET].endswith("_uniq.txt"):
 			config[Conf.LIMITED_DATASET] = config[Conf.LIMITED_DATASET].split(".txt")[0] + "_uniq.txt"
-		dataset_string_list_sentences, word_embedding_dict = generate_string_sentences(config)
+		dataset_string_list_sentences, word_embedding_dict = generate_string_sentences(config, config[Conf.EVAL_SPLIT])
 
 	count_dict = Counter(sentences)
 	uniq_sentences = count_dict.keys()
@@ -327,6 +190,14 @@ def calculate_bleu_score(sentences, dataset_string_list_sentences=None, word_emb
 	print "Finding reference sentneces using TF-IDF"
 	best_sentence_lists_tfidf = tfidf_retrieval(uniq_sentences, dataset_string_list_sentences)
 
+	# All three reference sets of every sentence are scored in one batch, repeated pairs only once
+	bleu_pairs = []
+	for i in range(len(uniq_sentences)):
+		bleu_pairs.append((best_sentence_lists_cosine[i], uniq_sentences[i]))
+		bleu_pairs.append((best_sentence_lists_tfidf[i], uniq_sentences[i]))
+		bleu_pairs.append((best_sentence_lists_wmd[i], uniq_sentences[i]))
+	bleu_scores = get_bleu_scorer().score_batch(bleu_pairs, config[Conf.BLEU_IN_POOL], config[Conf.EVAL_WORKERS])
+
 	bleu_score_tot_cosine = 0
 	bleu_score_tot_tfidf = 0
 	bleu_score_tot_wmd = 0
@@ -334,9 +205,7 @@ def calculate_bleu_score(sentences, dataset_string_list_sentences=None, word_emb
 	for i in range(len(uniq_sentences)):
 		sentence = uniq_sentences[i]
 
-		bleu_cosine = fetch_bleu_score(best_sentence_lists_cosine[i], sentence)
-		bleu_tfidf = fetch_bleu_score(best_sentence_lists_tfidf[i], sentence)
-		bleu_wmd = fetch_bleu_score(best_sentence_lists_wmd[i], sentence)
+		bleu_cosine, bleu_tfidf, bleu_wmd = bleu_scores[3 * i:3 * i + 3]
 
 		bleu_score_tot_cosine += (bleu_cosine * count_dict[sentence])
 		bleu_score_tot_tfidf += (bleu_tfidf * count_dict[sentence])
@@ -362,7 +231,7 @@ def calculate_bleu_score(sentences, dataset_string_list_sentences=None, word_emb
 
 
 def eval_main():
-	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config)
+	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config, config[Conf.EVAL_SPLIT])
 	sentences = ["<sos> the flower har large green petals and black stamen <eos> <pad>",
 	             "<sos> this flower has yellow petals and middle red stamen <eos> <pad>",
 	             "<sos> this flower has many yellow petals with yellow stamen <eos> <pad>",
@@ -416,7 +285,7 @@ def eval_main():
 
 
 def eval_seqgan():
-	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config)
+	eval_dataset_string_list_sentences, eval_word_embedding_dict = generate_string_sentences(config, config[Conf.EVAL_SPLIT])
 
 	seqgan_file = open("eval/files/seqgan_flickr.txt")
 	seqgan_lines = seqgan_file.readlines()[:10000]
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def sentence_vector_matrix(word_list_sentences, word_embedding_dict):
+	""" float32 matrix with the sum of the word vectors of every sentence as rows. Unknown words count as UNK """
+	unk_vector = word_embedding_dict['UNK']
+	matrix = np.zeros((len(word_list_sentences), len(unk_vector)), dtype=np.float32)
+	for i, sentence in enumerate(word_list_sentences):
+		for word in sentence:
+			matrix[i] += word_embedding_dict.get(word, unk_vector)
+	return matrix
+
+
+def normalize_rows(matrix):
+	""" Rows scaled to unit L2 norm. All-zero rows stay zero, so they have similarity 0 to everything """
+	matrix = np.asarray(matrix, dtype=np.float32)
+	norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+	norms[norms == 0] = 1
+	return matrix / norms[:, np.newaxis]
+
+
+def top_k_rows(scores, k):
+	""" Column indices of the k highest scores of every row, highest first """
+	if k >= scores.shape[1]:
+		return np.argsort(-scores, axis=1, kind="mergesort")
+	top_k = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+	top_k_scores = scores[np.arange(len(scores))[:, np.newaxis], top_k]
+	order = np.argsort(-top_k_scores, axis=1, kind="mergesort")
+	return top_k[np.arange(len(scores))[:, np.newaxis], order]
+
+
+class CosineRetriever(object):
+	""" Nearest reference sentences by cosine distance of summed word vectors. The references are normalized into one
+	matrix once, and queries are scored block_size at a time with a single matrix multiply per block """
+
+	def __init__(self, reference_vectors, reference_sentences, block_size=1024):
+		self.reference_matrix = normalize_rows(reference_vectors)
+		self.reference_sentences = reference_sentences
+		self.block_size = block_size
+
+	def query_indices(self, query_vectors, k=5):
+		""" (nb_queries, k) int array with the indices of the k nearest references, nearest first """
+		query_matrix = normalize_rows(query_vectors)
+		k = min(k, len(self.reference_matrix))
+		indices = np.zeros((len(query_matrix), k), dtype=np.int64)
+		for start in range(0, len(query_matrix), self.block_size):
+			scores = np.dot(query_matrix[start:start + self.block_size], self.reference_matrix.T)
+			indices[start:start + self.block_size] = top_k_rows(scores, k)
+		return indices
+
+	def query(self, query_vectors, k=5):
+		""" The k nearest reference sentences of every query, nearest first """
+		return [[self.reference_sentences[i] for i in row] for row in self.query_indices(query_vectors, k)]
@@ -6,8 +6,12 @@ The simplest TF-IDF library imaginable.
 Add your documents as two-element lists `[docname, [list_of_words_in_the_document]]` with `addDocument(docname, list_of_words)`. Get a list of all the `[docname, similarity_score]` pairs relative to a document by calling `similarities([list_of_words])`.
 
 See the README for a usage example.
+
+`TfidfIndex` gives the same scores from an inverted index, for retrieval over a large corpus.
 """
 
+import numpy as np
+
 
 class tfidf:
 	def __init__(self):
@@ -54,3 +58,71 @@ class tfidf:
 			sims.append([doc[0], score])
 
 		return sims
+
+
+class TfidfIndex:
+	"""
+	Inverted index with the scores of `tfidf.similarities`, for many documents and queries.
+
+	Every term has a postings list of the documents containing it, with their precomputed weight. A query only touches the
+	postings of its own terms. Queries are scored `block_size` at a time into one dense score matrix, and `top_k` returns
+	the indices of the best documents like a stable descending sort of all scores: ties, including documents sharing no
+	term with the query, go to the earlier document.
+	"""
+
+	def __init__(self, documents):
+		self.nb_documents = len(documents)
+		term_ids = {}
+		corpus_counts = []
+		posting_terms = []
+		posting_docs = []
+		posting_tfs = []
+		for doc_id, list_of_words in enumerate(documents):
+			doc_dict = {}
+			for w in list_of_words:
+				doc_dict[w] = doc_dict.get(w, 0.0) + 1.0
+			length = float(len(list_of_words))
+			for w, count in doc_dict.items():
+				if w not in term_ids:
+					term_ids[w] = len(term_ids)
+					corpus_counts.append(0.0)
+				corpus_counts[term_ids[w]] += count
+				posting_terms.append(term_ids[w])
+				posting_docs.append(doc_id)
+				posting_tfs.append(count / length)
+		self.term_ids = term_ids
+		self.corpus_counts = np.array(corpus_counts)
+
+		posting_terms = np.array(posting_terms, dtype=np.int64)
+		order = np.argsort(posting_terms, kind="mergesort")
+		self.posting_docs = np.array(posting_docs, dtype=np.int64)[order]
+		self.posting_weights = np.array(posting_tfs)[order] / self.corpus_counts[posting_terms[order]]
+		self.term_starts = np.concatenate(([0], np.cumsum(np.bincount(posting_terms, minlength=len(term_ids)))))
+
+	def scores(self, queries):
+		""" (len(queries), number of documents) matrix of `tfidf.similarities` scores """
+		scores = np.zeros((len(queries), self.nb_documents))
+		for row, list_of_words in enumerate(queries):
+			query_dict = {}
+			for w in list_of_words:
+				query_dict[w] = query_dict.get(w, 0.0) + 1.0
+			length = float(len(list_of_words))
+			for w, count in query_dict.items():
+				if w not in self.term_ids:
+					continue
+				term = self.term_ids[w]
+				start, end = self.term_starts[term], self.term_starts[term + 1]
+				query_weight = (count / length) / self.corpus_counts[term]
+				scores[row, self.posting_docs[start:end]] += query_weight + self.posting_weights[start:end]
+		return scores
+
+	def top_k(self, queries, k=5, block_size=256):
+		""" For every query, the indices of the k best documents, best first """
+		k = min(k, self.nb_documents)
+		results = []
+		for start in range(0, len(queries), block_size):
+			for scores in self.scores(queries[start:start + block_size]):
+				threshold = np.partition(scores, self.nb_documents - k)[self.nb_documents - k]
+				candidates = np.flatnonzero(scores >= threshold)
+				results.append(candidates[np.lexsort((candidates, -scores[candidates]))][:k])
+		return results
@@ -0,0 +1,134 @@
+import heapq
+from collections import Counter
+
+import numpy as np
+from pyemd import emd
+from sklearn.feature_extraction import stop_words
+from sklearn.metrics import euclidean_distances
+
+""" Word Mover's Distance retrieval with the semantics of evaulator.get_wmd_distance: the vocabulary of a pair is the
+set of lowercased words of both sentences that have an embedding and are not stop words, pairs with fewer than
+min_vocab such words have distance 1, and word distances are divided by the largest distance within the pair.
+
+Exact EMD only runs on references that can still make the top k. Every reference first gets a lower bound, the
+largest of the Word Centroid Distance and both directions of the Relaxed WMD, divided by the same largest word distance
+the exact distance uses. References are visited in order of their bound, and the search stops once a bound is above
+the k-th best exact distance """
+
+# Slack for comparing a lower bound with an exact distance. pyemd's result can be ~1e-6 below the true distance the
+# bounds hold for
+BOUND_TOLERANCE = 1e-5
+
+
+def sentence_bag_of_words(sentence, word_ids):
+	""" (word ids, normalized counts) of a sentence, with ids sorted """
+	words = [w for w in set(sentence.lower().split()) if w in word_ids]
+	counts = Counter(sentence.split(" "))
+	ids = np.array(sorted(word_ids[w] for w in words), dtype=np.int64)
+	id_to_word = dict((word_ids[w], w) for w in words)
+	weights = np.array([counts[id_to_word[i]] for i in ids], dtype=np.float64)
+	if weights.sum() > 0:
+		weights /= weights.sum()
+	return ids, weights
+
+
+def max_pairwise_distance(vectors):
+	if len(vectors) < 2:
+		return 0.0
+	return euclidean_distances(vectors).max()
+
+
+class WMDRetriever(object):
+	def __init__(self, reference_strings, word_embedding_dict, min_vocab=7):
+		self.reference_strings = reference_strings
+		self.min_vocab = min_vocab
+		vocabulary = sorted(w for w in word_embedding_dict if w not in stop_words.ENGLISH_STOP_WORDS)
+		self.word_ids = dict((w, i) for i, w in enumerate(vocabulary))
+		self.embeddings = np.array([word_embedding_dict[w] for w in vocabulary], dtype=np.float64)
+
+		bags = [sentence_bag_of_words(sentence, self.word_ids) for sentence in reference_strings]
+		self.reference_bags = bags
+		self.reference_sizes = np.array([len(ids) for ids, _ in bags], dtype=np.int64)
+		self.all_ids = np.concatenate([ids for ids, _ in bags] + [np.zeros(0, dtype=np.int64)])
+		self.all_owners = np.repeat(np.arange(len(bags)), self.reference_sizes)
+		# References without any weight can not be compared with EMD, they are only ranked by the min_vocab rule
+		self.searchable = np.array([weights.sum() > 0 for _, weights in bags], dtype=bool)
+		searchable_bags = [bags[i] for i in np.flatnonzero(self.searchable)]
+		self.searchable_indices = np.flatnonzero(self.searchable)
+		if len(searchable_bags) > 0:
+			self.concat_ids = np.concatenate([ids for ids, _ in searchable_bags])
+			self.concat_weights = np.concatenate([weights for _, weights in searchable_bags])
+			self.offsets = np.cumsum([0] + [len(ids) for ids, _ in searchable_bags[:-1]])
+		self.centroids = np.array([np.dot(weights, self.embeddings[ids]) for ids, weights in searchable_bags])
+		self.internal_max = np.array([max_pairwise_distance(self.embeddings[ids]) for ids, _ in searchable_bags])
+
+	def exact_distance(self, query_bag, reference_bag):
+		""" get_wmd_distance for two bags of words with at least min_vocab words together """
+		query_ids, query_weights = query_bag
+		reference_ids, reference_weights = reference_bag
+		union = np.union1d(query_ids, reference_ids)
+		v_1 = np.zeros(len(union))
+		v_2 = np.zeros(len(union))
+		v_1[np.searchsorted(union, query_ids)] = query_weights
+		v_2[np.searchsorted(union, reference_ids)] = reference_weights
+		distances = euclidean_distances(self.embeddings[union]).astype(np.double)
+		distances /= distances.max()
+		return emd(v_1, v_2, distances)
+
+	def lower_bounds(self, query_bag):
+		""" Lower bound of the distance from the query to every searchable reference """
+		query_ids, query_weights = query_bag
+		query_vectors = self.embeddings[query_ids]
+		cross = euclidean_distances(query_vectors, self.embeddings)[:, self.concat_ids]
+
+		# Relaxed WMD: all weight of a word moves to the nearest word of the other sentence
+		rwmd_reference = np.add.reduceat(self.concat_weights * cross.min(axis=0), self.offsets)
+		rwmd_query = np.dot(query_weights, np.minimum.reduceat(cross, self.offsets, axis=1))
+		wcd = np.sqrt(((self.centroids - np.dot(query_weights, query_vectors)) ** 2).sum(axis=1))
+
+		largest_distance = np.maximum(np.maximum.reduceat(cross.max(axis=0), self.offsets), self.internal_max)
+		largest_distance = np.maximum(largest_distance, max_pairwise_distance(query_vectors))
+		largest_distance[largest_distance == 0] = 1
+		return np.maximum(np.maximum(rwmd_reference, rwmd_query), wcd) / largest_distance
+
+	def query(self, query_string, k=5):
+		""" The k nearest references, ordered by distance and then by position in the corpus like a stable sort of
+		all distances """
+		query_bag = sentence_bag_of_words(query_string, self.word_ids)
+		query_ids, query_weights = query_bag
+		in_query = np.zeros(len(self.embeddings), dtype=bool)
+		in_query[query_ids] = True
+		shared_words = np.bincount(self.all_owners, weights=in_query[self.all_ids], minlength=len(self.reference_bags))
+		small_vocabulary = (len(query_ids) + self.reference_sizes - shared_words) < self.min_vocab
+
+		# (distance, index) of the best references so far, negated in a max heap
+		best = []
+
+		def consider(distance, index):
+			if len(best) < k:
+				heapq.heappush(best, (-distance, -index))
+			elif (distance, index) < (-best[0][0], -best[0][1]):
+				heapq.heapreplace(best, (-distance, -index))
+
+		for index in np.flatnonzero(small_vocabulary)[:k]:
+			consider(1.0, index)
+
+		if query_weights.sum() > 0 and len(self.searchable_indices) > 0:
+			bounds = self.lower_bounds(query_bag)
+			candidates = ~small_vocabulary[self.searchable_indices]
+			candidate_positions = np.flatnonzero(candidates)
+			order = candidate_positions[np.argsort(bounds[candidate_positions], kind="mergesort")]
+			for position in order:
+				# Near ties with the k-th distance are still computed, since pyemd can rank them either way
+				if len(best) == k and bounds[position] > -best[0][0] + BOUND_TOLERANCE:
+					break
+				index = self.searchable_indices[position]
+				consider(self.exact_distance(query_bag, self.reference_bags[index]), index)
+
+		# Pairs where one sentence has no weight have no distance, they only fill up short results
+		if len(best) < k:
+			chosen = set(-index for _, index in best)
+			for index in [i for i in range(len(self.reference_strings)) if i not in chosen][:k - len(best)]:
+				consider(float("inf"), index)
+
+		return [self.reference_strings[-index] for _, index in sorted(best, reverse=True)]
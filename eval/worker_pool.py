@@ -0,0 +1,79 @@
+import atexit
+import multiprocessing
+from multiprocessing import Pool
+
+from data.database.helpers.sqlite_wrapper import init_worker_connections
+from helpers.list_helpers import print_progress
+
+""" Persistent process pool for the evaluation retrievals. The shared data of every role, e.g. the WMD retriever and the
+BLEU scorer, is stored in a module global before the pool forks, so the workers inherit it instead of receiving it with
+every task. One pool holds the data of all roles, and is only replaced when a role gets new data, so alternating roles
+for every checkpoint of emb_evaluate reuse the same workers """
+
+_shared_data = {}
+_pool = None
+_pool_workers = None
+
+
+def get_shared_data(role):
+	""" The shared data of role in the pool this worker belongs to """
+	return _shared_data[role]
+
+
+def get_nb_workers(nb_workers=None):
+	if nb_workers is None:
+		return multiprocessing.cpu_count()
+	return max(1, nb_workers)
+
+
+def get_eval_pool(role, shared_data, nb_workers=None):
+	""" Pool whose workers see shared_data through get_shared_data(role), along with the data of the other roles.
+	nb_workers only sizes a new pool, a running one is kept whatever its size """
+	global _pool, _pool_workers
+	current_data = _shared_data.get(role)
+	same_data = current_data is not None and len(current_data) == len(shared_data) and all(
+		x is y for x, y in zip(current_data, shared_data))
+	if _pool is not None and same_data:
+		return _pool
+	close_eval_pool(clear_data=False)
+	nb_workers = get_nb_workers(nb_workers)
+	_shared_data[role] = shared_data
+	print "Starting pool with %s processes" % nb_workers
+	_pool = Pool(nb_workers, initializer=init_worker_connections)
+	_pool_workers = nb_workers
+	return _pool
+
+
+def close_eval_pool(clear_data=True):
+	global _pool, _pool_workers
+	if _pool is not None:
+		_pool.close()
+		_pool.join()
+	_pool, _pool_workers = None, None
+	if clear_data:
+		_shared_data.clear()
+
+
+atexit.register(close_eval_pool)
+
+
+def run_chunk(arguments):
+	function, start, items = arguments
+	return start, [function(item) for item in items]
+
+
+def eval_map(function, items, role, shared_data, nb_workers=None, name=""):
+	""" [function(item) for item in items] on the pool with shared_data for role. function must be a module level
+	function, it reads the shared data with get_shared_data(role). Progress is reported as chunks of results come
+	back """
+	pool = get_eval_pool(role, shared_data, nb_workers)
+	# A few chunks per worker keeps the workers busy without sending one task per item
+	chunk_size = max(1, len(items) / (_pool_workers * 4))
+	chunks = [(function, start, items[start:start + chunk_size]) for start in range(0, len(items), chunk_size)]
+	results = [None] * len(items)
+	done = 0
+	for start, chunk_results in pool.imap_unordered(run_chunk, chunks):
+		results[start:start + len(chunk_results)] = chunk_results
+		done += len(chunk_results)
+		print_progress(done, len(items), name)
+	return results
@@ -1,7 +1,8 @@
 import matplotlib.pyplot as plt
-import numpy as np
 from matplotlib.lines import Line2D
 
+from GAN.helpers.metrics import load_loss_metrics, downsample_metrics
+
 # loss_file = open('/Users/markus/workspace/master/Master/GAN/GAN_log/2017-04-26_ImgCapFalse_WordEmbedding.WORD2VEC_Vocab1000_Seq10_Batch128_EmbSize50_NoiseMode.REPEAT_Noise50_PreInitPreInit.NONE_Dataset_all_flowers_500hidden_dropout0.2/loss.txt', 'r')
 # loss_fix_file = open('/Users/markus/workspace/master/Master/GAN/GAN_log/2017-04-26_ImgCapFalse_WordEmbedding.WORD2VEC_Vocab1000_Seq10_Batch128_EmbSize50_NoiseMode.REPEAT_Noise50_PreInitPreInit.NONE_Dataset_all_flowers_500hidden_dropout0.2/loss-fix.txt', 'w+')
 # loss_lines = loss_file.readlines()
@@ -21,12 +22,9 @@ model_1 = '2017-05-16_ImgCapFalse_word2vec_Vocab1000_Seq12_Batch64_EmbSize50_rep
 # model_3 = '2017-05-13_ImgCapFalse_onehot_Vocab1000_Seq12_Batch64_EmbSize50_repeat_Noise50_PreInitNone_Dataset_10_all_flowers_softmax'
 # model_4 = '2017-05-13_ImgCapFalse_onehot_Vocab1000_Seq12_Batch64_EmbSize50_repeat_Noise50_PreInitNone_Dataset_10_all_flowers_0.75dropout-softmax'
 
-data_1 = np.genfromtxt(
-	log_folder + model_1 + "/loss.txt",
-	delimiter=',',
-	skip_header=1,
-	skip_footer=0,
-	names=['epoch', 'batch', 'g_loss', 'g_acc', 'd_loss_gen', 'd_acc_gen', 'd_loss_train', 'd_acc_train'])
+max_points = 2000
+
+data_1 = downsample_metrics(load_loss_metrics(log_folder + model_1), max_points)
 
 # data_2 = np.genfromtxt(
 # 	log_folder + model_2 + "/loss.txt",
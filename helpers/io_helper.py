@@ -1,5 +1,10 @@
+import json
 import os
 import pickle
+import shutil
+
+import numpy as np
+
 import settings
 
 
@@ -23,3 +28,36 @@ def check_pickle_file(name):
 		return True
 	return False
 
+
+def save_array_dir(arrays, manifest, name):
+	""" Stores every array as its own .npy file in the directory name, next to a manifest.json """
+	tmp_name = name + ".tmp"
+	if os.path.isdir(tmp_name):
+		shutil.rmtree(tmp_name)
+	os.makedirs(tmp_name)
+	for key, array in arrays.items():
+		np.save(os.path.join(tmp_name, key + ".npy"), array)
+	manifest = dict(manifest, arrays=sorted(arrays.keys()))
+	with open(os.path.join(tmp_name, "manifest.json"), "w") as manifest_file:
+		json.dump(manifest, manifest_file)
+	if os.path.isdir(name):
+		shutil.rmtree(name)
+	os.rename(tmp_name, name)
+	print("Saved array directory: %s" % name)
+
+
+def load_array_dir_manifest(name):
+	manifest_path = os.path.join(name, "manifest.json")
+	if not os.path.isfile(manifest_path):
+		return None
+	with open(manifest_path, "r") as manifest_file:
+		return json.load(manifest_file)
+
+
+def load_array_dir(name, mmap_mode="r"):
+	manifest = load_array_dir_manifest(name)
+	arrays = {}
+	for key in manifest["arrays"]:
+		arrays[key] = np.load(os.path.join(name, key + ".npy"), mmap_mode=mmap_mode)
+	return arrays, manifest
+
@@ -4,6 +4,8 @@
 import matplotlib.pyplot as plt
 import numpy as np
 
+from GAN.helpers.metrics import LOSS_ACC_FIELDS, load_loss_metrics, downsample_metrics
+
 
 def distinct_number_enlarger(x):
 	if x <= 3:
@@ -15,9 +17,12 @@ def distinct_number_enlarger(x):
 	return 14
 
 
-def plotter():
+def plotter(loss_log_folder=None):
+	""" Losses are read from the loss files copied to eval_path, or from the GAN log directories in loss_log_folder,
+	e.g. "GAN/GAN_log/", which also holds runs logged to loss.metrics """
 	colors = ['#F95400', '#0C56A2', '#F9DC00', '#00A670', '#C60074']
 	eval_path = "/Users/markus/workspace/master/Master/eval/files/"
+	max_loss_points = 2000
 	models = get_onehot_models()[3:4]
 	# models = get_wordemb_models(models)
 
@@ -47,17 +52,16 @@ def plotter():
 			names=['epoch', 'distinct_sentences', 'sentence_count', 'avg_bleu_score', 'avg_bleu_cosine',
 			       'avg_bleu_tfidf', 'avg_bleu_wmd'])
 
-		loss_file_path = eval_path + "loss/" + model[0] + ".txt"
-		loss_data = np.genfromtxt(
-			loss_file_path,
-			delimiter=',',
-			skip_header=1,
-			skip_footer=3,
-			names=['epoch', 'batch', 'loss_g', 'g_acc', 'd_loss_gen', 'd_acc_gen', 'd_loss_train', 'd_acc_train'])
-
-		loss_d_train = loss_data["d_loss_train"]
-		loss_d_gen = loss_data["d_loss_gen"]
-		loss_d = (loss_d_gen + loss_d_train) / 2
+		if loss_log_folder is None:
+			loss_file_path = eval_path + "loss/" + model[0] + ".txt"
+			loss_data = np.genfromtxt(
+				loss_file_path,
+				delimiter=',',
+				skip_header=1,
+				skip_footer=3,
+				names=[name for name, _ in LOSS_ACC_FIELDS])
+		else:
+			loss_data = load_loss_metrics(loss_log_folder + model[0])
 
 		beta_skip = 5
 		beta_start_index = np.where(beta_data['epoch'] == 0)[0][0]
@@ -68,6 +72,11 @@ def plotter():
 		loss_start_index = np.where(loss_data['epoch'] == 0)[0][0]
 		# loss_stop_index = np.where(loss_data['epoch'] == 300)[0][0]
 		loss_stop_index = None
+		loss_data = downsample_metrics(loss_data[loss_start_index:loss_stop_index], max_loss_points)
+
+		loss_d_train = loss_data["d_loss_train"]
+		loss_d_gen = loss_data["d_loss_gen"]
+		loss_d = (loss_d_gen + loss_d_train) / 2
 
 		beta_epochs = beta_data['epoch'][beta_start_index:beta_stop_index:beta_skip]
 		beta = beta_data['avg_bleu_score'][beta_start_index:beta_stop_index:beta_skip]
@@ -75,9 +84,9 @@ def plotter():
 		# beta_epochs = np.insert(beta_epochs, 0, beta_data['epoch'][1])
 		# beta = np.insert(beta, 0, beta_data['avg_bleu_score'][1])
 
-		loss_epochs = loss_data['epoch'][loss_start_index:loss_stop_index:loss_skip]
-		loss_g = loss_data['loss_g'][loss_start_index:loss_stop_index:loss_skip]
-		loss_d = loss_d[loss_start_index:loss_stop_index:loss_skip]
+		loss_epochs = loss_data['epoch'][::loss_skip]
+		loss_g = loss_data['g_loss'][::loss_skip]
+		loss_d = loss_d[::loss_skip]
 
 
 
@@ -13,6 +13,7 @@ import numpy as np
 from data.database.helpers.caption_database_helper import save_caption_vector_list
 from data.database.helpers.class_database_helper import save_class_vector_list
 from data.database.helpers.image_database_helper import store_image_vector_to_db
+from data.database.helpers.sqlite_wrapper import bulk_ingest, db_bulk_commit
 from helpers.list_helpers import print_progress
 
 
@@ -26,6 +27,9 @@ def get_model():
 
 counter = 0
 
+# Image vectors take long to compute, so they are committed in groups of this many images instead of all at the end
+IMAGE_COMMIT_INTERVAL = 500
+
 
 def preprocess(img_path, num_images):
 	img = image.load_img(img_path, target_size=(299, 299))
@@ -58,43 +62,48 @@ def run_inception():
 	processed_imgs = [preprocess(x, num_images) for x in image_paths]
 	print "Loading model"
 	inception = get_model()
-	for i in range(num_images):
-		img_vec = inception.predict(np.asarray(processed_imgs[i]))
-		store_image_vector_to_db(image_filenames[i], img_vec[0])
-		print_progress(i, num_images, prefix="Running images through model and storing...")
+	with bulk_ingest("Storing image vectors", synchronous_off=False):
+		for i in range(num_images):
+			img_vec = inception.predict(np.asarray(processed_imgs[i]))
+			store_image_vector_to_db(image_filenames[i], img_vec[0])
+			print_progress(i, num_images, prefix="Running images through model and storing...")
+			if (i + 1) % IMAGE_COMMIT_INTERVAL == 0:
+				db_bulk_commit()
 
 
 def save_classes():
 	flowers_path = "/Users/markus/workspace/master/Master/data/datasets/flowers/"
 	flowers_text_path = flowers_path + "text/"
 	class_dirs = fetch_class_dirs(flowers_text_path)
-	for class_dir in class_dirs:
-		class_filesnames = fetch_all_filenames(flowers_text_path + class_dir)
-		class_name = class_dir[6:]
-		tuples = []
-		for filename in class_filesnames:
-			if filename != 'class.txt':
-				filename = filename[:-4]
-				tuples.append((filename, class_name, None))
-		save_class_vector_list(tuples)
+	with bulk_ingest("Storing classes"):
+		for class_dir in class_dirs:
+			class_filesnames = fetch_all_filenames(flowers_text_path + class_dir)
+			class_name = class_dir[6:]
+			tuples = []
+			for filename in class_filesnames:
+				if filename != 'class.txt':
+					filename = filename[:-4]
+					tuples.append((filename, class_name, None))
+			save_class_vector_list(tuples)
 
 
 def save_captions():
 	flowers_path = "/Users/markus/workspace/master/Master/data/datasets/flowers/"
 	flowers_text_path = flowers_path + "text/"
 	class_dirs = fetch_class_dirs(flowers_text_path)
-	for class_dir in class_dirs:
-		filesnames = fetch_all_filenames(flowers_text_path + class_dir)
-		for filename in filesnames:
-			if filename != 'class.txt':
-				textfile = open(flowers_text_path + class_dir + "/" + filename, 'r')
-				caption_lines = textfile.readlines()
-				textfile.close()
-				filename = filename[:-4]
-				captions_tuples = []
-				for line in caption_lines:
-					captions_tuples.append((filename, line.strip().replace(",", "").replace(".", ""), None))
-				save_caption_vector_list(captions_tuples)
+	with bulk_ingest("Storing captions"):
+		for class_dir in class_dirs:
+			filesnames = fetch_all_filenames(flowers_text_path + class_dir)
+			for filename in filesnames:
+				if filename != 'class.txt':
+					textfile = open(flowers_text_path + class_dir + "/" + filename, 'r')
+					caption_lines = textfile.readlines()
+					textfile.close()
+					filename = filename[:-4]
+					captions_tuples = []
+					for line in caption_lines:
+						captions_tuples.append((filename, line.strip().replace(",", "").replace(".", ""), None))
+					save_caption_vector_list(captions_tuples)
 
 
 if __name__ == "__main__":
@@ -13,6 +13,7 @@ from keras.models import Sequential, model_from_json
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import normalize
 
+from GAN.helpers.noise import get_encoded_data_path
 from enums import W2VEmbToEmbConf
 from helpers.io_helper import load_pickle_file, save_pickle_file
 from helpers.list_helpers import print_progress
@@ -338,7 +339,10 @@ def encode(conf, embedded_data, string_training_data, model_filename, weights_fi
 	latent_data = test_model.predict(np.asarray(embedded_data))
 	decode(conf, string_training_data, latent_data, model_filename, weights_filename + "_decoder",
 		   word_embeddings)
-	save_pickle_file(latent_data, "sequence_to_sequence/logs/" + model_filename + "/encoded_data.pkl")
+	encoded_data_path = get_encoded_data_path(model_filename)
+	save_pickle_file(latent_data, encoded_data_path + ".pkl")
+	# Memory-mappable copy for the GAN's ENCODING noise
+	np.save(encoded_data_path + ".npy", np.asarray(latent_data))
 
 
 def seq2seq(inference=False, encode_data=False, decode_random=False, conf=W2VEmbToEmbConf, model_filename="NORM_DROP25_S2S_2EMB_2017-04-24_VS2+1000_BS128_HD40_DHL1_ED50_SEQ5_WEMword2vec", weights_filename="E:101-L:0.0104.hdf5"):
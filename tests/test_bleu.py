@@ -0,0 +1,62 @@
+import random
+import unittest
+
+try:
+	import nltk
+	from nltk.translate.bleu_score import sentence_bleu
+except ImportError:
+	nltk = None
+
+""" BleuScorer has to give the scores of the pinned nltk, since the evaluations are compared with earlier runs """
+
+
+@unittest.skipIf(nltk is None or nltk.__version__ != "3.2.2", "needs nltk 3.2.2")
+class BleuScorerTest(unittest.TestCase):
+	def setUp(self):
+		import eval.bleu
+		self.bleu_module = eval.bleu
+		# Both sides tokenize the same way, so the test does not depend on the punkt data being installed
+		self.word_tokenize = eval.bleu.word_tokenize
+		eval.bleu.word_tokenize = lambda sentence: sentence.split()
+		self.scorer = eval.bleu.BleuScorer()
+
+	def tearDown(self):
+		self.bleu_module.word_tokenize = self.word_tokenize
+
+	def assert_parity(self, refs, hyp):
+		expected = sentence_bleu([ref.split() for ref in refs], hyp.split())
+		self.assertAlmostEqual(self.scorer.compute_bleu(refs, hyp), expected, places=12)
+
+	def test_zero_match_orders(self):
+		refs = ["this flower has red petals and a yellow center"]
+		# Trigram matches but no 4-gram match
+		self.assert_parity(refs, "this flower has red petals")
+		self.assert_parity(refs, "this flower has petals red")
+		self.assert_parity(refs, "petals flower red this")
+		self.assert_parity(refs, "purple leaves")
+
+	def test_lengths(self):
+		refs = ["a b c d e", "a b c d e f g h"]
+		self.assert_parity(refs, "a b c d e f")
+		self.assert_parity(refs, "a b c d e f g h i j")
+		self.assert_parity(refs, "a")
+		self.assert_parity(refs, "")
+
+	def test_random_sentences(self):
+		random_state = random.Random(0)
+		vocabulary = ["the", "flower", "has", "petals", "red", "yellow", "a", "and", "stamen", "green"]
+		for _ in range(300):
+			refs = [" ".join(random_state.choice(vocabulary) for _ in range(random_state.randint(1, 12))) for _ in
+			        range(random_state.randint(1, 5))]
+			hyp = " ".join(random_state.choice(vocabulary) for _ in range(random_state.randint(1, 12)))
+			self.assert_parity(refs, hyp)
+
+	def test_score_batch(self):
+		pairs = [(["a b c d e f"], "a b c d e"), (["a b c"], "c b a"), (["a b c d e f"], "a b c d e")]
+		expected = [sentence_bleu([ref.split() for ref in refs], hyp.split()) for refs, hyp in pairs]
+		for score, expected_score in zip(self.scorer.score_batch(pairs), expected):
+			self.assertAlmostEqual(score, expected_score, places=12)
+
+
+if __name__ == "__main__":
+	unittest.main()
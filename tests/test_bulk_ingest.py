@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import numpy as np
+
+import settings
+from data.database.helpers import sqlite_wrapper
+
+
+class BulkIngestTest(unittest.TestCase):
+	def setUp(self):
+		self.db_file_path = settings.DB_FILE_PATH
+		self.tmp_dir = tempfile.mkdtemp()
+		settings.DB_FILE_PATH = os.path.join(self.tmp_dir, "test.db")
+
+	def tearDown(self):
+		sqlite_wrapper.close_connections()
+		settings.DB_FILE_PATH = self.db_file_path
+		shutil.rmtree(self.tmp_dir)
+
+	def ingest(self, function):
+		stdout = sys.stdout
+		sys.stdout = StringIO()
+		try:
+			with sqlite_wrapper.bulk_ingest("Probe"):
+				function()
+			return sys.stdout.getvalue()
+		finally:
+			sys.stdout = stdout
+
+	def test_row_count(self):
+		def insert():
+			for i in range(5):
+				sqlite_wrapper.db_insert_image_vector("image_%s" % i, np.ones(4, dtype=np.float32) * i)
+			sqlite_wrapper.db_insert_caption_vector_list(
+				[("image_%s" % (i % 5), "caption %s" % i, np.ones(3, dtype=np.float32) * i) for i in range(20)])
+
+		# Every image insert also raises the images change counter through a trigger
+		self.assertIn("Probe: 25 rows", self.ingest(insert))
+		self.assertEqual(sqlite_wrapper.db_get_caption_table_size(), 20)
+
+	def test_updates_are_counted(self):
+		for i in range(3):
+			sqlite_wrapper.db_insert_image_vector("image_%s" % i, np.zeros(4, dtype=np.float32))
+		output = self.ingest(lambda: sqlite_wrapper.db_insert_image_vector_list(
+			[(np.ones(4, dtype=np.float32) * i, "image_%s" % i) for i in range(3)]))
+		self.assertIn("Probe: 3 rows", output)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+	from GAN.helpers.checkpoints import CheckpointIndex, CheckpointManager, KeepBestPolicy, KeepLastPolicy, \
+		ScheduleSavePolicy
+except ImportError:
+	CheckpointIndex = None
+
+
+def checkpoint(epoch, **metrics):
+	return {"epoch": epoch, "files": {}, "sizes": {}, "metrics": metrics, "time": 0}
+
+
+@unittest.skipIf(CheckpointIndex is None, "needs keras and h5py")
+class RetentionPolicyTest(unittest.TestCase):
+	def test_keep_last(self):
+		checkpoints = [checkpoint(epoch) for epoch in range(10)]
+		self.assertEqual(KeepLastPolicy(3).keep(checkpoints), set([7, 8, 9]))
+		self.assertEqual(KeepLastPolicy(20).keep(checkpoints), set(range(10)))
+		self.assertRaises(ValueError, KeepLastPolicy, 0)
+
+	def test_keep_best(self):
+		checkpoints = [checkpoint(0, g_loss=3.0), checkpoint(1), checkpoint(2, g_loss=1.0), checkpoint(3, g_loss=2.0)]
+		self.assertEqual(KeepBestPolicy("g_loss", 2).keep(checkpoints), set([2, 3]))
+		self.assertEqual(KeepBestPolicy("g_loss", 1, lowest=False).keep(checkpoints), set([0]))
+		self.assertEqual(KeepBestPolicy("d_loss", 2).keep(checkpoints), set())
+
+	def test_schedule(self):
+		saved = [epoch for epoch in range(1000) if ScheduleSavePolicy().should_save(epoch, 0)]
+		self.assertEqual(saved, list(range(10)) + list(range(10, 100, 10)) + list(range(100, 1000, 100)))
+
+
+@unittest.skipIf(CheckpointIndex is None, "needs keras and h5py")
+class CheckpointManagerTest(unittest.TestCase):
+	def setUp(self):
+		self.weights_dir = tempfile.mkdtemp()
+		self.index = CheckpointIndex(os.path.join(self.weights_dir, "index.json"), self.weights_dir)
+
+	def tearDown(self):
+		shutil.rmtree(self.weights_dir)
+
+	def record(self, epoch, name="generator", **metrics):
+		filename = "%s-%s" % (name, epoch)
+		with open(self.index.weight_path(filename), "w") as weight_file:
+			weight_file.write("weights")
+		self.index.record(epoch, {name: filename}, metrics)
+
+	def test_prune(self):
+		manager = CheckpointManager(self.index, [], [KeepLastPolicy(2), KeepBestPolicy("g_loss", 1)])
+		for epoch, g_loss in enumerate([5.0, 1.0, 4.0, 3.0, 2.0]):
+			self.record(epoch, g_loss=g_loss)
+			manager.prune()
+		self.assertEqual([entry["epoch"] for entry in self.index.checkpoints()], [1, 3, 4])
+		self.assertEqual(sorted(f for f in os.listdir(self.weights_dir) if f.startswith("generator")),
+		                 ["generator-1", "generator-3", "generator-4"])
+		self.assertEqual(self.index.best("g_loss")["epoch"], 1)
+		self.assertEqual(self.index.latest("generator")["epoch"], 4)
+
+	def test_index_is_rebuilt_from_weight_files(self):
+		for epoch in [3, 1, 2]:
+			self.record(epoch)
+		os.remove(self.index.path)
+		index = CheckpointIndex(self.index.path, self.weights_dir)
+		self.assertEqual([entry["epoch"] for entry in index.checkpoints("generator")], [1, 2, 3])
+		self.assertTrue(os.path.isfile(self.index.path))
+
+	def test_complete_checkpoints(self):
+		for epoch in range(4):
+			self.record(epoch)
+		for epoch in [0, 2]:
+			self.record(epoch, "discriminator")
+		self.assertEqual([entry["epoch"] for entry in self.index.complete_checkpoints(["generator", "discriminator"])],
+		                 [0, 2])
+		self.assertEqual(self.index.complete_checkpoints(["generator", "critic"]), [])
+
+
+if __name__ == "__main__":
+	unittest.main()
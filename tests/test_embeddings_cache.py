@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import settings
+from GAN.config import config
+from GAN.helpers.enums import Conf
+from data.database.helpers import sqlite_wrapper
+from data.database.helpers.split_database_helper import filter_split
+
+try:
+	from data.embeddings.helpers import embeddings_helper
+except ImportError:
+	embeddings_helper = None
+
+
+@unittest.skipIf(embeddings_helper is None, "needs scikit-learn")
+class EmbeddingsCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.db_file_path = settings.DB_FILE_PATH
+		self.stored_embeddings_dir = settings.STORED_EMBEDDINGS_DIR
+		self.tmp_dir = tempfile.mkdtemp()
+		settings.DB_FILE_PATH = os.path.join(self.tmp_dir, "test.db")
+		settings.STORED_EMBEDDINGS_DIR = self.tmp_dir + "/"
+		self.config = {Conf.IMAGE_CLASSES: ["rose"], Conf.MAX_CAPTION_LENGTH: 10, Conf.TRAIN_SPLIT: "train",
+		               Conf.SPLIT_SEED: 0, Conf.SPLIT_RATIOS: [1]}
+		for i in range(4):
+			filename = "image_%s" % i
+			sqlite_wrapper.db_insert_image_vector(filename, np.ones(6) * i)
+			sqlite_wrapper.db_insert_pca_vector(filename, np.ones(3) * i)
+			sqlite_wrapper.db_insert_class_vector(filename, "rose", None)
+			sqlite_wrapper.db_insert_caption_vector(filename, "a red rose", None)
+		self.builds = 0
+		self.create_custom_examples = embeddings_helper.create_custom_examples
+
+		def create_custom_examples(*args):
+			self.builds += 1
+			return self.create_custom_examples(*args)
+
+		embeddings_helper.create_custom_examples = create_custom_examples
+
+	def tearDown(self):
+		embeddings_helper.create_custom_examples = self.create_custom_examples
+		sqlite_wrapper.close_connections()
+		settings.DB_FILE_PATH = self.db_file_path
+		settings.STORED_EMBEDDINGS_DIR = self.stored_embeddings_dir
+		shutil.rmtree(self.tmp_dir)
+
+	def test_reused_after_unrelated_writes(self):
+		self.assertEqual(len(embeddings_helper.fetch_custom_embeddings(self.config)[2]), 4)
+		sqlite_wrapper.db_insert_word_vector("rose", np.ones(3))
+		sqlite_wrapper.db_build_vector_store("words")
+		self.assertEqual(len(embeddings_helper.fetch_custom_embeddings(self.config)[2]), 4)
+		self.assertEqual(self.builds, 1)
+
+	def test_rebuilt_after_new_captions(self):
+		embeddings_helper.fetch_custom_embeddings(self.config)
+		sqlite_wrapper.db_insert_caption_vector("image_0", "a pink rose", None)
+		self.assertEqual(len(embeddings_helper.fetch_custom_embeddings(self.config)[2]), 5)
+		self.assertEqual(self.builds, 2)
+
+	def test_split_without_config(self):
+		image_names = embeddings_helper.fetch_embeddings(split="train")[0]
+		self.assertEqual(list(image_names), filter_split("images", ["image_%s" % i for i in range(4)], config, "train"))
+
+
+if __name__ == '__main__':
+	unittest.main()
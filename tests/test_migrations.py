@@ -0,0 +1,75 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+import settings
+
+
+def create_unversioned_database(path):
+	""" The tables of the original schema, without indexes and with user_version 0 """
+	connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+	connection.execute('''CREATE TABLE images (filename TEXT UNIQUE, image_vector array)''')
+	connection.execute('''CREATE TABLE pca (filename TEXT UNIQUE, pca_vector array)''')
+	connection.execute('''CREATE TABLE captions (filename TEXT, caption_text TEXT, caption_vector array)''')
+	connection.execute('''CREATE TABLE words (word_text TEXT UNIQUE, word_vector array)''')
+	connection.execute('''CREATE TABLE classes (filename TEXT, class_text TEXT, class_vector array)''')
+	return connection
+
+
+class MigrationTest(unittest.TestCase):
+	def setUp(self):
+		self.db_file_path = settings.DB_FILE_PATH
+		self.tmp_dir = tempfile.mkdtemp()
+		settings.DB_FILE_PATH = os.path.join(self.tmp_dir, "default.db")
+		# Imported once the database path is redirected, in case the import opens a connection
+		from data.database.helpers import sqlite_wrapper
+		self.sqlite_wrapper = sqlite_wrapper
+		self.connection = create_unversioned_database(os.path.join(self.tmp_dir, "old.db"))
+		self.image_vector = np.arange(8, dtype=np.float32)
+		self.caption_vector = np.ones((3, 4), dtype=np.float32)
+		self.connection.execute("""INSERT INTO images VALUES (?, ?)""", ("a.jpg", self.image_vector))
+		self.connection.execute("""INSERT INTO captions VALUES (?, ?, ?)""", ("a.jpg", "a cat", self.caption_vector))
+		self.connection.execute("""INSERT INTO words VALUES (?, ?)""", ("cat", self.image_vector))
+		self.connection.commit()
+
+	def tearDown(self):
+		self.connection.close()
+		settings.DB_FILE_PATH = self.db_file_path
+		shutil.rmtree(self.tmp_dir)
+
+	def schema(self):
+		return self.connection.execute("""SELECT type, name, sql FROM sqlite_master ORDER BY name""").fetchall()
+
+	def test_migrate_unversioned(self):
+		self.assertEqual(self.sqlite_wrapper.db_schema_version(self.connection), 0)
+		self.sqlite_wrapper.db_migrate(self.connection)
+		self.assertEqual(self.sqlite_wrapper.db_schema_version(self.connection), len(self.sqlite_wrapper.MIGRATIONS))
+		index_names = [name for kind, name, _ in self.schema() if kind == "index"]
+		for index_name, _, _ in self.sqlite_wrapper.INDEXES:
+			self.assertIn(index_name, index_names)
+
+		filename, image_vector = self.connection.execute("""SELECT filename, image_vector FROM images""").fetchone()
+		self.assertEqual(filename, "a.jpg")
+		np.testing.assert_array_equal(image_vector, self.image_vector)
+		filename, caption_text, caption_vector = self.connection.execute(
+			"""SELECT filename, caption_text, caption_vector FROM captions""").fetchone()
+		self.assertEqual((filename, caption_text), ("a.jpg", "a cat"))
+		np.testing.assert_array_equal(caption_vector, self.caption_vector)
+		self.assertEqual(self.connection.execute("""SELECT word_text FROM words""").fetchall(), [("cat",)])
+
+	def test_migrate_twice(self):
+		self.sqlite_wrapper.db_migrate(self.connection)
+		schema = self.schema()
+		images = self.connection.execute("""SELECT rowid, filename FROM images""").fetchall()
+		self.sqlite_wrapper.db_migrate(self.connection)
+		self.assertEqual(self.sqlite_wrapper.db_schema_version(self.connection), len(self.sqlite_wrapper.MIGRATIONS))
+		self.assertEqual(self.schema(), schema)
+		self.assertEqual(self.connection.execute("""SELECT rowid, filename FROM images""").fetchall(), images)
+
+
+if __name__ == '__main__':
+	unittest.main()
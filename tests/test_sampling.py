@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from GAN.helpers.enums import SamplingMode
+from GAN.helpers.sampling import EpochSampler
+
+
+class EpochSamplerTest(unittest.TestCase):
+	def test_shuffle(self):
+		sampler = EpochSampler(103, 10, SamplingMode.SHUFFLE, random_state=np.random.RandomState(0))
+		batches = sampler.epoch_batches()
+		self.assertEqual(batches.shape, (10, 10))
+		self.assertEqual(len(set(batches.ravel())), 100)
+		self.assertFalse(np.array_equal(batches, sampler.epoch_batches()))
+
+	def test_seeded_epochs_repeat(self):
+		first = EpochSampler(50, 8, random_state=np.random.RandomState(4))
+		second = EpochSampler(50, 8, random_state=np.random.RandomState(4))
+		for _ in range(3):
+			np.testing.assert_array_equal(first.epoch_batches(), second.epoch_batches())
+
+	def test_balanced(self):
+		# One large group and nine single-example groups
+		groups = np.array([0] * 91 + list(range(1, 10)))
+		sampler = EpochSampler(100, 10, SamplingMode.BALANCED, groups=groups, random_state=np.random.RandomState(0))
+		counts = np.bincount(groups[np.concatenate([sampler.epoch_batches().ravel() for _ in range(200)])])
+		np.testing.assert_allclose(counts / float(counts.sum()), np.ones(10) / 10, atol=0.01)
+		self.assertRaises(ValueError, EpochSampler, 100, 10, SamplingMode.BALANCED)
+
+	def test_bucketed(self):
+		keys = np.random.RandomState(1).randint(1, 20, size=105)
+		sampler = EpochSampler(105, 10, SamplingMode.BUCKETED, bucket_keys=keys,
+		                       random_state=np.random.RandomState(0))
+		seen = set()
+		for _ in range(50):
+			batches = sampler.epoch_batches()
+			self.assertEqual(batches.shape, (10, 10))
+			self.assertEqual(len(set(batches.ravel())), 100)
+			# Batches cover consecutive key ranges, so no two batches overlap in keys beyond a shared boundary key
+			batch_keys = sorted((keys[batch].min(), keys[batch].max()) for batch in batches)
+			for (_, previous_max), (next_min, _) in zip(batch_keys, batch_keys[1:]):
+				self.assertLessEqual(previous_max, next_min)
+			seen.update(batches.ravel())
+		# The examples left out of an epoch differ between epochs, so every example is trained on
+		self.assertEqual(seen, set(range(105)))
+		self.assertRaises(ValueError, EpochSampler, 100, 10, SamplingMode.BUCKETED)
+
+
+if __name__ == "__main__":
+	unittest.main()
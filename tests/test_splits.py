@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import settings
+from GAN.helpers.enums import Conf
+from data.database.helpers import sqlite_wrapper
+from data.database.helpers.split_database_helper import assign_split, fetch_split_manifest, filter_split, SPLITS
+
+
+class AssignSplitTest(unittest.TestCase):
+	def test_deterministic(self):
+		keys = ["image_%05d" % i for i in range(1000)]
+		self.assertEqual([assign_split(key, 0, [8, 1, 1]) for key in keys],
+		                 [assign_split(key, 0, [8, 1, 1]) for key in keys])
+		self.assertEqual(assign_split(u"image_00001", 0, [8, 1, 1]), assign_split("image_00001", 0, [8, 1, 1]))
+
+	def test_ratios(self):
+		splits = [assign_split("image_%05d" % i, 3, [8, 1, 1]) for i in range(10000)]
+		self.assertAlmostEqual(splits.count("train") / 10000.0, 0.8, delta=0.02)
+		self.assertAlmostEqual(splits.count("val") / 10000.0, 0.1, delta=0.02)
+		self.assertAlmostEqual(splits.count("test") / 10000.0, 0.1, delta=0.02)
+		self.assertEqual(set(assign_split("image_%05d" % i, 3, [1, 1]) for i in range(100)), set(SPLITS[:2]))
+
+	def test_seed(self):
+		keys = ["image_%05d" % i for i in range(100)]
+		self.assertNotEqual([assign_split(key, 0, [1, 1, 1]) for key in keys],
+		                    [assign_split(key, 1, [1, 1, 1]) for key in keys])
+
+
+class SplitManifestTest(unittest.TestCase):
+	def setUp(self):
+		self.db_file_path = settings.DB_FILE_PATH
+		self.tmp_dir = tempfile.mkdtemp()
+		settings.DB_FILE_PATH = os.path.join(self.tmp_dir, "test.db")
+		self.config = {Conf.SPLIT_SEED: 0, Conf.SPLIT_RATIOS: [8, 1, 1]}
+
+	def tearDown(self):
+		sqlite_wrapper.close_connections()
+		settings.DB_FILE_PATH = self.db_file_path
+		shutil.rmtree(self.tmp_dir)
+
+	def test_adding_keys_keeps_assignments(self):
+		keys = ["image_%05d" % i for i in range(200)]
+		assignments = fetch_split_manifest("images", keys[:100], self.config)
+		self.assertEqual(fetch_split_manifest("images", keys, self.config), dict(
+			(key, assign_split(key, 0, [8, 1, 1])) for key in keys))
+		for key in keys[:100]:
+			self.assertEqual(fetch_split_manifest("images", keys, self.config)[key], assignments[key])
+
+	def test_filter_split(self):
+		items = [("image_%05d" % i, i) for i in range(300)]
+		splits = [filter_split("images", items, self.config, split, key=lambda item: item[0]) for split in SPLITS]
+		self.assertEqual(sorted(sum(splits, [])), items)
+		for split_items in splits:
+			self.assertEqual(split_items, sorted(split_items))
+		self.assertEqual(filter_split("images", items, self.config, None), items)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+
+import numpy as np
+
+from eval import tfidf
+
+""" TfidfIndex has to rank the references like the tfidf class it replaced in tfidf_retrieval """
+
+
+def original_top_k(documents, query, k):
+	table = tfidf.tfidf()
+	for i, document in enumerate(documents):
+		table.addDocument(i, document)
+	similarities = sorted(table.similarities(query), key=lambda x: x[1], reverse=True)
+	return [x[0] for x in similarities[:k]]
+
+
+class TfidfIndexTest(unittest.TestCase):
+	def setUp(self):
+		random_state = random.Random(0)
+		vocabulary = ["the", "flower", "has", "petals", "red", "yellow", "a", "and", "stamen", "green", "pink", "white"]
+		self.documents = [[random_state.choice(vocabulary) for _ in range(random_state.randint(1, 10))] for _ in
+		                  range(300)]
+		self.queries = [[random_state.choice(vocabulary + ["unknown"]) for _ in range(random_state.randint(1, 8))] for _
+		                in range(100)]
+		self.index = tfidf.TfidfIndex(self.documents)
+
+	def test_scores(self):
+		table = tfidf.tfidf()
+		for i, document in enumerate(self.documents):
+			table.addDocument(i, document)
+		scores = self.index.scores(self.queries)
+		for query, row in zip(self.queries, scores):
+			np.testing.assert_allclose(row, [score for _, score in table.similarities(query)], rtol=1e-12)
+
+	def test_top_k(self):
+		for query, best in zip(self.queries, self.index.top_k(self.queries, 5, block_size=16)):
+			self.assertEqual(list(best), original_top_k(self.documents, query, 5))
+
+	def test_unknown_words_keep_corpus_order(self):
+		self.assertEqual(list(self.index.top_k([["unknown"]], 5)[0]), [0, 1, 2, 3, 4])
+
+	def test_k_above_corpus_size(self):
+		documents = self.documents[:3]
+		best = tfidf.TfidfIndex(documents).top_k([self.queries[0]], 5)[0]
+		self.assertEqual(list(best), original_top_k(documents, self.queries[0], 5))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import settings
+from data.database.helpers import sqlite_wrapper
+
+
+class VectorLookupTest(unittest.TestCase):
+	def setUp(self):
+		self.db_file_path = settings.DB_FILE_PATH
+		self.tmp_dir = tempfile.mkdtemp()
+		settings.DB_FILE_PATH = os.path.join(self.tmp_dir, "test.db")
+		self.vectors = [np.ones(4) * i for i in range(10)]
+		sqlite_wrapper.db_insert_caption_vector_list(
+			[("image_%s" % i, "caption %s" % i, vector) for i, vector in enumerate(self.vectors)] +
+			[("image_duplicate", "caption duplicate", self.vectors[3])])
+
+	def tearDown(self):
+		sqlite_wrapper.close_connections()
+		settings.DB_FILE_PATH = self.db_file_path
+		shutil.rmtree(self.tmp_dir)
+
+	def test_input_order(self):
+		vectors = [self.vectors[7], np.ones(4) * -1, self.vectors[3], None, self.vectors[7].astype(np.float32)]
+		self.assertEqual(sqlite_wrapper.db_fetch_first_by_vectors("captions", "filename, caption_text", vectors),
+		                 [("image_7", "caption 7"), None, ("image_3", "caption 3"), None, ("image_7", "caption 7")])
+
+	def test_matches_single_lookup(self):
+		vectors = self.vectors * 200
+		self.assertGreater(len(vectors), sqlite_wrapper.VECTOR_LOOKUP_CHUNK_SIZE)
+		self.assertEqual(sqlite_wrapper.db_fetch_first_by_vectors("captions", "filename", vectors),
+		                 [sqlite_wrapper.db_fetchone_by_vector("captions", "filename", vector) for vector in vectors])
+
+	def test_hash_collision(self):
+		# A row whose hash matches but whose vector does not is skipped
+		sqlite_wrapper.get_db().execute("""UPDATE captions SET caption_vector_hash = ? WHERE filename = 'image_0'""",
+		                                (sqlite_wrapper.vector_hash(self.vectors[5]),))
+		self.assertEqual(sqlite_wrapper.db_fetch_first_by_vectors("captions", "filename", [self.vectors[5]]),
+		                 [("image_5",)])
+
+
+if __name__ == '__main__':
+	unittest.main()
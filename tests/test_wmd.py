@@ -0,0 +1,53 @@
+import random
+import unittest
+
+import numpy as np
+
+try:
+	from eval.evaulator import get_wmd_distance
+	from eval.wmd import BOUND_TOLERANCE, WMDRetriever
+except (ImportError, LookupError):
+	# LookupError: the evaluator loads the nltk stopwords when it is imported
+	WMDRetriever = None
+
+""" WMDRetriever has to return the references the exhaustive get_wmd_distance search of wmd_retrieval returned """
+
+
+def original_wmd_retrieval(pred_string, dataset_strings, word_embedding_dict, k=5):
+	score_tuples = [(dataset_string, get_wmd_distance(pred_string, dataset_string, word_embedding_dict)) for
+	                dataset_string in dataset_strings]
+	score_tuples = sorted(score_tuples, key=lambda x: x[1], reverse=False)
+	return [x[0] for x in score_tuples[:k]]
+
+
+@unittest.skipIf(WMDRetriever is None, "needs pyemd, scikit-learn and the evaluation dependencies and data")
+class WMDRetrieverTest(unittest.TestCase):
+	def setUp(self):
+		random_state = random.Random(0)
+		np_random_state = np.random.RandomState(0)
+		words = ["flower", "petals", "red", "yellow", "stamen", "green", "pink", "white", "large", "small", "round",
+		         "pointed", "leaves", "center", "bright", "dark", "the", "a", "and", "has"]
+		self.word_embedding_dict = dict((word, np_random_state.normal(size=8)) for word in words)
+		# Every sentence has a word with an embedding, so no distance divides by an empty histogram
+		self.dataset_strings = [" ".join(["flower"] + [random_state.choice(words + ["unknown"]) for _ in
+		                                               range(random_state.randint(2, 12))]) for _ in range(150)]
+		self.pred_strings = [" ".join(["petals"] + [random_state.choice(words) for _ in range(random_state.randint(
+			1, 10))]) for _ in range(30)]
+
+	def test_query(self):
+		retriever = WMDRetriever(self.dataset_strings, self.word_embedding_dict)
+		for pred_string in self.pred_strings:
+			self.assertEqual(retriever.query(pred_string),
+			                 original_wmd_retrieval(pred_string, self.dataset_strings, self.word_embedding_dict))
+
+	def test_lower_bounds(self):
+		retriever = WMDRetriever(self.dataset_strings, self.word_embedding_dict, min_vocab=0)
+		query_bag = retriever.reference_bags[0]
+		bounds = retriever.lower_bounds(query_bag)
+		for position, index in enumerate(retriever.searchable_indices):
+			exact = retriever.exact_distance(query_bag, retriever.reference_bags[index])
+			self.assertLessEqual(bounds[position], exact + BOUND_TOLERANCE)
+
+
+if __name__ == "__main__":
+	unittest.main()